@@ -1,54 +1,136 @@
-import time
+try:
+    import uasyncio as asyncio
+except ImportError:
+    import asyncio
 import sensor
+import sensor_state
 from pyb import USB_VCP
+from command_server import CommandServer, VCPTransport
+from take_img import take_frame
+from bmp_line_detection import process_frame
+from pipeline import analyze
+from result_protocol import encode_result
+from frame_transfer import prepare_transfer, start_transfer, get_transfer, active_transfer
+from utils import load_env, roi_coords
 
 # Initialize the USB VCP object
 usb = USB_VCP()
 
+SNAPSHOT_FRAMESIZE = sensor.QVGA  # SNAPSHOT images (ANALYZE / GETFRAME use take_frame)
+
 # --- SENSOR INITIALIZATION ---
-sensor.reset()
-sensor.set_pixformat(sensor.GRAYSCALE)
-sensor.set_framesize(sensor.QVGA)
-sensor.skip_frames(time = 2000)
+sensor_state.reset()
+sensor_state.configure(pixformat=sensor.GRAYSCALE, framesize=SNAPSHOT_FRAMESIZE)
+sensor_state.settle()
 # ---------------------------
 
+def load_coords():
+    """ROI offsets from env.txt, or the main.py defaults if it cannot be read."""
+    try:
+        return roi_coords(load_env("env.txt"))
+    except Exception as e:
+        print("Warning: Could not load config from env.txt: {}".format(e))
+        print("Using default ROI offsets")
+        return {"LEFT_ROI": "200", "CENTER_ROI": "800", "RIGHT_ROI": "1500"}
+
+
+coords = load_coords()
+_results = {"seq": 0}
+
 def take():
     img =sensor.snapshot()
     img.save("new.jpg")
-# Example: Continuously check for and process incoming data
-while True:
-    if usb.isconnected():
-        if usb.any(): # Check if any data is waiting to be read
-            # Read all available data
-            data = usb.read()
-
-            # Decode the received bytes into a string
-            command = data.decode().strip()
-
-            print("Received command:", command)
-
-            if command == "SNAPSHOT":
-                # START OF TRY BLOCK
-                try:
-                    img = sensor.snapshot()
-                    img.save("UART.jpg")
-                    take()
-
-                    time.sleep(1)
-
-                    print("Image saved as UART.jpg") # Print a confirmation
-                    usb.write("OK\r\n".encode()) # Send an acknowledgment back
-
-                # END OF TRY BLOCK, START OF EXCEPT BLOCK
-                except Exception as e:
-                    # An error occurred (e.g., no space, file system issue)
-                    error_message = f"SAVE FAILED: {e}"
-                    print(error_message)
-                    usb.write(f"ERROR: {e}\r\n".encode())
-
-            elif command == "STOP":
-                # Stop a process
-                # ...
-                usb.write("STOPPED\r\n".encode())
-
-    time.sleep_ms(100)
+
+
+async def snapshot(server, args):
+    """SNAPSHOT: captures and saves UART.jpg (and new.jpg) at SNAPSHOT_FRAMESIZE."""
+    # ANALYZE / GETFRAME leave the sensor at the full capture size
+    sensor_state.configure(pixformat=sensor.GRAYSCALE, framesize=SNAPSHOT_FRAMESIZE,
+                           windowing=None)
+    sensor_state.settle()
+    img = sensor.snapshot()
+    img.save("UART.jpg")
+    take()
+    server.log("Image saved as UART.jpg") # Print a confirmation
+
+
+async def analyze_frame(server, args):
+    """
+    ANALYZE [GAP_ANALYSIS|VIRTUAL_SLOTS] [SEGMENTS]: captures, analyzes and
+    pushes the result frames (result_protocol) before the OK <seq> reply.
+    """
+    options = [a.upper() for a in args]
+    mode = "VIRTUAL_SLOTS" if "VIRTUAL_SLOTS" in options else "GAP_ANALYSIS"
+
+    frame, meta = take_frame(coords=coords)
+    await asyncio.sleep(0)
+    pre_process = process_frame(frame, coords)
+    await asyncio.sleep(0)
+    result = analyze(pre_process, coords, mode=mode)
+
+    _results["seq"] = (_results["seq"] + 1) & 0xFFFF
+    seq = _results["seq"]
+    segments = pre_process if "SEGMENTS" in options else None
+    for data in encode_result(result, seq=seq, segments=segments):
+        server.send(data)
+    return "OK {}".format(seq)
+
+
+async def get_frame(server, args):
+    """
+    GETFRAME [JPEG|RAW] [ROI]: captures a frame and streams it in chunks in
+    the background; replies OK <transfer_id> <bytes> right away, or BUSY
+    while an earlier transfer is still streaming.
+    """
+    # Checked before capturing: a new buffer would replace the one being sent
+    if active_transfer() is not None:
+        return "BUSY"
+    options = [a.upper() for a in args]
+    fmt = "RAW" if ("RAW" in options or "ROI" in options) else "JPEG"
+    frame, meta = take_frame(coords=coords)
+    transfer = prepare_transfer(frame, fmt=fmt, coords=coords if "ROI" in options else None)
+    if not start_transfer(server, transfer):
+        return "BUSY"
+    return "OK {} {}".format(transfer["id"], len(transfer["data"]))
+
+
+async def resume_frame(server, args):
+    """
+    RESUME <transfer_id> [offset]: re-sends a kept transfer from a chunk
+    boundary; BUSY while a transfer is streaming.
+    """
+    transfer = get_transfer(int(args[0])) if args else None
+    if transfer is None:
+        raise ValueError("unknown transfer")
+    offset = int(args[1]) if len(args) > 1 else 0
+    if not start_transfer(server, transfer, offset=offset):
+        return "BUSY"
+    return "OK {} {}".format(transfer["id"], len(transfer["data"]) - offset)
+
+
+async def stop(server, args):
+    """STOP: drops queued commands."""
+    dropped = server.clear_queue()
+    server.log("Stopped, dropped {} queued commands".format(dropped))
+    return "STOPPED"
+
+
+async def ping(server, args):
+    return "PONG"
+
+
+def build_server(transport):
+    """Command server with the camera commands registered."""
+    server = CommandServer(transport)
+    # Bursts of triggers while a capture is pending collapse into one capture
+    server.register("SNAPSHOT", snapshot, merge=True)
+    # Every ANALYZE gets its own result (seq), so pipelined requests are not merged
+    server.register("ANALYZE", analyze_frame)
+    server.register("GETFRAME", get_frame, merge=True)
+    server.register("RESUME", resume_frame, immediate=True)
+    server.register("STOP", stop, immediate=True)
+    server.register("PING", ping, immediate=True)
+    return server
+
+
+asyncio.run(build_server(VCPTransport(usb)).serve())
@@ -1,10 +1,49 @@
-import image
-import sensor
+import gc
+try:
+    import image
+    import sensor
+except ImportError:
+    # Host tools (host_detect) reuse the frame header / tile readers
+    image = None
+    sensor = None
 import time
 
+import math
 import struct
 from utils import log_data_to_file, log
 
+# Line segment detector parameters (also part of the detect_cache key)
+SEGMENT_MIN_LENGTH = 30
+MERGE_DISTANCE = 10
+MAX_THETA_DIFFERENCE = 30
+
+# Coarse-to-fine (pyramid) detection
+PYRAMID_SCALE = 4          # Coarse pass at 1/PYRAMID_SCALE resolution
+PYRAMID_MARGIN = 8         # Full-res rows added above/below each candidate band
+PYRAMID_EDGE_THETA = (45, 135)  # Coarse segments refined at full resolution
+
+# Tile geometry: frame size comes from the BMP header (or the raw file size),
+# tile width from the ROI layout, band height from the memory budget.
+FRAME_SIZES = {
+    "QVGA": (320, 240),
+    "VGA": (640, 480),
+    "SXGA": (1280, 1024),
+    "UXGA": (1600, 1200),
+    "FHD": (1920, 1080),
+    "QXGA": (2048, 1536),
+    "WQXGA2": (2592, 1944),
+}
+BMP_HEADER_SIZE = 30       # File header + the BITMAPINFOHEADER fields read (to bpp)
+MAX_TILE_W = 200           # Widest tile per ROI (narrower if ROIs are closer)
+TILE_MEMORY_BUDGET = None  # Bytes one band may use; None = BAND_HEAP_FRACTION of free heap
+
+# Vertical banding of file tiles (bounded peak memory at any resolution)
+BAND_HEAP_FRACTION = 0.5   # Share of gc.mem_free() one band may use
+BAND_MIN_ROWS = 64
+BAND_OVERLAP = 16          # Rows shared by neighbouring bands
+STITCH_THETA = 10          # Max angle difference (deg) to join segments at a seam
+STITCH_DISTANCE = 4        # Max perpendicular/along-line gap (px) to join
+
 
 def read_raw_pixel_data_from_bmp(img_path, Width, Height):
     """
@@ -61,39 +100,142 @@ def read_raw_pixel_data_from_bmp(img_path, Width, Height):
         return None
 
 
-def process_image(img_path, coords, offset_y=0, sensor_type="VGA", logs=False):
+def read_frame_header(f, width=None, height=None, sensor_type=None):
     """
-    Reads a BMP image file by segment (tile) to avoid memory allocation errors,
-    correcting for BMP structure, padding, and vertical orientation.
+    Works out the pixel layout of an 8-bit grayscale frame file.
+
+    BMP files are parsed from their header. Headerless raw files (as written
+    by capture_and_save_grayscale) use width/height if given, else the size
+    in FRAME_SIZES matching the file length, else the sensor_type entry.
+
+    Returns:
+        tuple: (data_offset, Width, Height, file_row_size, bottom_up)
+
+    Raises:
+        ValueError: If the frame size cannot be determined, or the file is
+                    shorter than the pixel data it describes.
     """
-    try:
-        # 1. Set image/tile dimensions
-        if sensor_type == "QVGA":
-            TILE_W = 160
-            TILE_H = 120
-            Width = 320
-            Height = 240
-        elif sensor_type == "VGA":  # VGA (default)
-            TILE_W = 50
-            TILE_H = 480
-            Width = 640
-            Height = 480
-        elif sensor_type == "FHD":
-            TILE_W = 200
-            TILE_H = 1080
-            Width = 1920
-            Height = 1080
-        elif sensor_type == "WQXGA2":
-            TILE_W = 200
-            TILE_H = 1944
-            Width = 2592
-            Height = 1944
+    f.seek(0)
+    magic = f.read(2)
+    if magic == b"BM":
+        f.seek(0)
+        header = f.read(BMP_HEADER_SIZE)
+        if len(header) < BMP_HEADER_SIZE:
+            raise ValueError("truncated BMP header")
+        f.seek(10)
+        data_offset = struct.unpack('<I', f.read(4))[0]
+        f.seek(18)
+        Width, Height = struct.unpack('<ii', f.read(8))
+        f.seek(28)
+        bits = struct.unpack('<H', f.read(2))[0]
+        if bits != 8:
+            raise ValueError("Only 8-bit grayscale BMP supported, got {} bpp".format(bits))
+        # Positive height = rows stored bottom-up
+        bottom_up = Height > 0
+        Height = abs(Height)
+        row_padding = (4 - (Width % 4)) % 4
+        _check_frame_length(f, data_offset + (Width + row_padding) * Height)
+        return data_offset, Width, Height, Width + row_padding, bottom_up
+
+    f.seek(0, 2)
+    size = f.tell()
+    if width is None or height is None:
+        for name, (w, h) in FRAME_SIZES.items():
+            if w * h == size:
+                width, height = w, h
+                break
         else:
-            TILE_W = 200
-            TILE_H = 480
-            Width = 640
-            Height = 480
+            if sensor_type not in FRAME_SIZES:
+                raise ValueError("Unknown frame size ({} bytes, sensor_type={})".format(
+                    size, sensor_type))
+            width, height = FRAME_SIZES[sensor_type]
+    _check_frame_length(f, width * height)
+    return 0, width, height, width, False
+
+
+def _check_frame_length(f, needed):
+    # A truncated file would otherwise read short rows and look black
+    f.seek(0, 2)
+    size = f.tell()
+    if size < needed:
+        raise ValueError("Truncated frame: {} bytes, {} needed".format(size, needed))
+
 
+def roi_tile_width(coords, frame_width=None, max_tile_w=MAX_TILE_W):
+    """
+    Tile width for an ROI layout: MAX_TILE_W, narrowed so neighbouring tiles
+    do not overlap (and to frame_width, if given).
+    """
+    offsets = sorted(int(v) for v in coords.values())
+    tile_w = max_tile_w
+    for a, b in zip(offsets, offsets[1:]):
+        if b - a > 0:
+            tile_w = min(tile_w, b - a)
+    if frame_width is not None:
+        tile_w = min(tile_w, frame_width)
+    return max(1, tile_w)
+
+
+def tile_geometry(frame_width, frame_height, coords, offset_y=0, tile_w=None,
+                  memory_budget=TILE_MEMORY_BUDGET, logs=False):
+    """
+    Computes tile geometry from the frame, the ROI layout and a memory budget.
+
+    Args:
+        frame_width, frame_height: Actual frame dimensions.
+        coords: ROI dict (env.txt format).
+        offset_y: First frame row of the tiles.
+        tile_w: Fixed tile width (default: roi_tile_width()).
+        memory_budget: Bytes one band may use (default: BAND_HEAP_FRACTION
+                       of gc.mem_free()).
+        logs: Also write the decision to logs.txt.
+
+    Returns:
+        dict: {tile_w, tile_h, band_rows, memory_budget}
+    """
+    if tile_w is None:
+        tile_w = roi_tile_width(coords, frame_width)
+    tile_h = max(0, frame_height - offset_y)
+
+    if memory_budget is None:
+        gc.collect()
+        memory_budget = int(gc.mem_free() * BAND_HEAP_FRACTION)
+
+    # One band = row buffer + detection scratch of about the same size
+    rows = memory_budget // (2 * tile_w)
+    if rows >= tile_h:
+        band_rows = tile_h
+    else:
+        band_rows = max(BAND_MIN_ROWS, BAND_OVERLAP + 1, rows)
+
+    geometry = {"tile_w": tile_w, "tile_h": tile_h, "band_rows": band_rows,
+                "memory_budget": memory_budget}
+    print("Tile geometry for {}x{} frame: {}".format(frame_width, frame_height, geometry))
+    if logs:
+        try:
+            log("logs.txt", message=geometry, function_name="tile_geometry")
+        except Exception as log_error:
+            print(f"Logging failed: {log_error}")
+    return geometry
+
+
+def process_image(img_path, coords, offset_y=0, sensor_type="VGA", logs=False, pyramid=False,
+                  width=None, height=None, tile_w=None, memory_budget=TILE_MEMORY_BUDGET):
+    """
+    Reads a BMP (or headerless raw) grayscale image file by segment (tile)
+    to avoid memory allocation errors, correcting for BMP structure, padding,
+    and vertical orientation.
+
+    Frame size comes from the file (see read_frame_header(); sensor_type is
+    only a fallback for raw files of unknown size), tile width from the ROI
+    layout and band height from the memory budget (see tile_geometry()).
+    Tiles that do not fit the budget are read and detected in overlapping
+    vertical bands, and segments crossing band seams are stitched back
+    together, so peak memory stays bounded at any resolution.
+
+    pyramid=True uses the coarse-to-fine detector (detect_segments_pyramid).
+    """
+    try:
         # Sort coordinates by X offset value
         sorted_data_list = sorted(
             coords.items(),
@@ -104,88 +246,61 @@ def process_image(img_path, coords, offset_y=0, sensor_type="VGA", logs=False):
         results = {}
 
         with open(img_path, "rb") as img:
-            # --- BMP HEADER CALCULATION ---
-            # 2. Get the file offset to the start of pixel data
-            img.seek(10)
-            data_offset_bytes = img.read(4)
-            data_offset = struct.unpack('<I', data_offset_bytes)[0]
+            # 1. Frame layout from the file itself
+            data_offset, Width, Height, file_row_size, bottom_up = read_frame_header(
+                img, width, height, sensor_type)
 
-            # 3. Calculate row metrics for seeking
-            row_padding = (4 - (Width % 4)) % 4
-            # Size of a row in the file (data + padding)
-            file_row_size = Width + row_padding
-            # --- END BMP HEADER CALCULATION ---
+            # 2. Tile / band geometry
+            geometry = tile_geometry(Width, Height, coords, offset_y=offset_y,
+                                     tile_w=tile_w, memory_budget=memory_budget, logs=logs)
+            TILE_H = geometry["tile_h"]
+            band_rows = geometry["band_rows"]
 
             for index, offset_str in sorted_data_list:
                 tile_x_offset = int(offset_str.strip())
+                TILE_W = min(geometry["tile_w"], Width - tile_x_offset)
                 print("offset", tile_x_offset)
+                if TILE_W <= 0:
+                    print("Skipping ROI {} outside the {}px wide frame".format(tile_x_offset, Width))
+                    continue
+
+                tile_segments = []
+                band_start = 0
+                while band_start < TILE_H:
+                    rows = min(band_rows, TILE_H - band_start)
 
-                # Use a list to hold tile rows to allow reversing the order easily
-                tile_rows = []
+                    data = read_tile_rows(img, data_offset, file_row_size, Height,
+                                          tile_x_offset, TILE_W,
+                                          offset_y + band_start, rows, bottom_up)
 
-                # 4. Construct data array for image tile, reading row by row
-                for i in range(TILE_H):
-                    # i is the current row index of the TILE (0 to TILE_H-1)
+                    # 3. Process the band
+                    tile_img = image.Image(
+                        TILE_W, rows, sensor.GRAYSCALE, buffer=data, copy_to_fb=True)
+                    data = None
 
-                    # Calculate the Y-coordinate in the full LOGICAL (Top-Down) image
-                    logical_y = i + offset_y
+                    # Apply Gaussian blur for noise reduction and unsharp masking for edge enhancement
+                    #tile_img.gaussian(1, unsharp=True)
 
-                    # Convert LOGICAL Y to FILE ROW INDEX (0 = file bottom, Height-1 = file top)
-                    # This ensures we are always targeting the correct pixel content.
-                    file_row_index = (Height - 1) - logical_y
+                    band_segments = detect_tile_segments(
+                        tile_img, tile_x_offset, offset_y + band_start, pyramid=pyramid)
+                    tile_img = None
 
-                    if file_row_index < 0 or file_row_index >= Height:
-                        # Skip if the logical tile row is outside the image bounds
-                        row_data = b'\x00' * TILE_W  # Pad with black pixels
+                    if band_start == 0:
+                        tile_segments = band_segments
                     else:
-                        # Calculate the start position in the file for this row:
-                        # = (Data Start) + (Row Index * Row Size in File) + (X Offset)
-                        file_start_pos = (
-                            data_offset +
-                            (file_row_index * file_row_size) +
-                            tile_x_offset
-                        )
-
-                        # Move pointer and read the tile segment
-                        img.seek(file_start_pos)
-                        row_data = img.read(TILE_W)
-
-                    # Store the row data for later reordering
-                    tile_rows.append(row_data)
-
-                # --- NEW LOGIC: Correct the vertical flip ---
-                # BMP stores rows bottom-to-top. The loop above read them in the file's order,
-                # meaning tile_rows[0] is the bottom row of the tile.
-                # Reversing the list puts the visual top row first, correcting the orientation.
-                tile_rows.reverse()
-                data = bytearray().join(tile_rows)
-                # --- END NEW LOGIC ---
-
-                # 5. Process the Tile (Rest of the logic is retained)
-                tile_img = image.Image(
-                    TILE_W, TILE_H, sensor.GRAYSCALE, buffer=data, copy_to_fb=True)
-
-                # Apply Gaussian blur for noise reduction and unsharp masking for edge enhancement
-                #tile_img.gaussian(1, unsharp=True)
-
-                # Detect segments and store results
-                local_segments = detect_segments(tile_img)
-
-                global_segments = []
-                for segment in local_segments:
-                    global_segment = segment.copy()
-
-                    # Add the X-offset and Y-offset to the coordinates
-                    global_segment["x1"] += tile_x_offset
-                    global_segment["x2"] += tile_x_offset
-                    global_segment["y1"] += offset_y
-                    global_segment["y2"] += offset_y
-
-                    global_segments.append(global_segment)
-
-                results[tile_x_offset] = global_segments
-
-        # 6. Logging (Optional)
+                        tile_segments = stitch_segments(
+                            tile_segments, band_segments,
+                            offset_y + band_start, offset_y + band_start + BAND_OVERLAP)
+
+                    if band_start + rows >= TILE_H:
+                        break
+                    band_start += rows - BAND_OVERLAP
+                    gc.collect()
+
+                # Store the results of the tile
+                results[tile_x_offset] = tile_segments
+
+        # 4. Logging (Optional)
         if logs:
             try:
                 # Use the provided log function from utils
@@ -197,29 +312,224 @@ def process_image(img_path, coords, offset_y=0, sensor_type="VGA", logs=False):
 
     # Catching the most general file/system errors available in MicroPython
     except OSError:
-        print(f"An error occurred: Image file '{
-              img_path}' not found (OSError).")
+        print(f"An error occurred: Image file '{img_path}' not found (OSError).")
         return None
     except Exception as e:
         # This catches memory allocation failures, struct errors, etc.
         print(f"An error occurred: {e}")
         return None
 
-    # The detect_segments function remains unchanged.
 
-# Line Segment Detection Function (Unchanged)
+def read_tile_rows(img, data_offset, file_row_size, Height, tile_x_offset, TILE_W,
+                   first_row, rows, bottom_up=True):
+    """
+    Reads `rows` consecutive image rows (top-down, starting at first_row) of
+    one tile column band. bottom_up=True maps them onto BMP rows stored
+    bottom-to-top. Rows outside the image are padded with black pixels.
+
+    Returns: bytearray of TILE_W * rows pixels.
+    """
+    data = bytearray(TILE_W * rows)
+    for i in range(rows):
+        logical_y = first_row + i
+        if logical_y < 0 or logical_y >= Height:
+            continue  # Already zero (black)
+
+        file_row_index = (Height - 1) - logical_y if bottom_up else logical_y
+
+        # = (Data Start) + (Row Index * Row Size in File) + (X Offset)
+        img.seek(data_offset + (file_row_index * file_row_size) + tile_x_offset)
+        row_data = img.read(TILE_W)
+        data[i * TILE_W:i * TILE_W + len(row_data)] = row_data
+    return data
+
+
+def _theta_diff(a, b):
+    d = abs(a - b) % 180
+    return min(d, 180 - d)
+
+
+def _collinear(a, b):
+    """True if segment b lies on segment a's line and touches/overlaps it."""
+    if _theta_diff(a["theta"], b["theta"]) > STITCH_THETA:
+        return False
+
+    dx = a["x2"] - a["x1"]
+    dy = a["y2"] - a["y1"]
+    norm = math.sqrt(dx * dx + dy * dy)
+    if norm == 0:
+        return False
+    ux, uy = dx / norm, dy / norm
+
+    # Perpendicular distance of b's endpoints from a's line
+    for x, y in ((b["x1"], b["y1"]), (b["x2"], b["y2"])):
+        if abs((x - a["x1"]) * uy - (y - a["y1"]) * ux) > STITCH_DISTANCE:
+            return False
+
+    # Along-line projections must overlap or nearly touch
+    t1 = (b["x1"] - a["x1"]) * ux + (b["y1"] - a["y1"]) * uy
+    t2 = (b["x2"] - a["x1"]) * ux + (b["y2"] - a["y1"]) * uy
+    return max(t1, t2) >= -STITCH_DISTANCE and min(t1, t2) <= norm + STITCH_DISTANCE
+
+
+def _join(a, b):
+    """Joins two collinear segments into one spanning both (a's other fields kept)."""
+    points = [(a["x1"], a["y1"]), (a["x2"], a["y2"]), (b["x1"], b["y1"]), (b["x2"], b["y2"])]
+    best = None
+    for i in range(len(points)):
+        for j in range(i + 1, len(points)):
+            d = (points[i][0] - points[j][0]) ** 2 + (points[i][1] - points[j][1]) ** 2
+            if best is None or d > best[0]:
+                best = (d, points[i], points[j])
+
+    joined = a.copy()
+    (joined["x1"], joined["y1"]), (joined["x2"], joined["y2"]) = best[1], best[2]
+    joined["length"] = int(math.sqrt(best[0]))
+    return joined
+
+
+def stitch_segments(upper, lower, seam_top, seam_bottom):
+    """
+    Merges the segments of two vertically overlapping bands. Segments of the
+    lower band that continue (or duplicate) an upper band segment in the
+    overlap rows seam_top..seam_bottom are joined into it.
+
+    Returns:
+        list: Stitched segments (same schema).
+    """
+    result = list(upper)
+    upper_idx = [i for i, s in enumerate(result)
+                 if max(s["y1"], s["y2"]) >= seam_top - STITCH_DISTANCE]
+
+    for seg in lower:
+        joined = False
+        if min(seg["y1"], seg["y2"]) <= seam_bottom + STITCH_DISTANCE:
+            for i in upper_idx:
+                longer, shorter = (result[i], seg) if result[i]["length"] >= seg["length"] else (seg, result[i])
+                if _collinear(longer, shorter):
+                    result[i] = _join(longer, shorter)
+                    joined = True
+                    break
+        if not joined:
+            result.append(seg)
+    return result
+
+
+def process_tiles(tiles, offset_y=0, logs=False, pyramid=False):
+    """
+    Runs detection on tiles that are already in memory (e.g. windowed sensor
+    captures) instead of reading them from a BMP file.
 
+    Args:
+        tiles: Iterable of (tile_x_offset, tile_img) pairs. Each tile only has
+               to stay valid until the next one is requested.
+        offset_y: Y offset of the tiles' first row in the full frame.
+        logs: Boolean flag to enable logging of the results.
 
-def detect_segments(img, length=30, min_degree=0, max_degree=180):
+    Returns:
+        dict: {tile_x_offset: [segment_dict, ...]}, same as process_image().
+    """
+    results = {}
+    for tile_x_offset, tile_img in tiles:
+        print("offset", tile_x_offset)
+        results[tile_x_offset] = detect_tile_segments(
+            tile_img, tile_x_offset, offset_y, pyramid=pyramid)
+
+    if logs:
+        try:
+            log("logs.txt", message=results, function_name="process_tiles")
+        except Exception as log_error:
+            print(f"Logging failed: {log_error}")
+
+    return results
+
+
+def process_frame(img, coords, offset_y=0, tile_w=None, tile_h=None, logs=False, pyramid=False):
+    """
+    Runs detection directly on an in-memory frame (e.g. the sensor frame
+    buffer) without writing it to SD or copying tiles. Each ROI tile is
+    passed to find_line_segments() as a roi window of the frame.
+
+    Args:
+        img: GRAYSCALE image object holding the full frame.
+        coords: ROI dict (env.txt format).
+        offset_y: First frame row of the tiles.
+        tile_w: Tile width in pixels (default: roi_tile_width()).
+        tile_h: Tile height in pixels (default: rest of the frame).
+        logs: Boolean flag to enable logging of the results.
+        pyramid: Use the coarse-to-fine detector.
+
+    Returns:
+        dict: {tile_x_offset: [segment_dict, ...]}, same as process_image().
+              Coordinates are full-frame (rho is relative to the frame origin).
+    """
+    if tile_w is None:
+        tile_w = roi_tile_width(coords, img.width())
+    if tile_h is None:
+        tile_h = img.height() - offset_y
+
+    results = {}
+    for tile_x_offset in sorted(int(v) for v in coords.values()):
+        print("offset", tile_x_offset)
+        w = min(tile_w, img.width() - tile_x_offset)
+        h = min(tile_h, img.height() - offset_y)
+        detect = detect_segments_pyramid if pyramid else detect_segments
+        results[tile_x_offset] = detect(img, roi=(tile_x_offset, offset_y, w, h))
+
+    if logs:
+        try:
+            log("logs.txt", message=results, function_name="process_frame")
+        except Exception as log_error:
+            print(f"Logging failed: {log_error}")
+
+    return results
+
+
+def detect_tile_segments(tile_img, tile_x_offset, offset_y=0, pyramid=False):
+    """
+    Detects segments in one tile and shifts them into full-frame coordinates
+    (rho recomputed relative to the frame origin, as in process_frame()).
+    """
+    detect = detect_segments_pyramid if pyramid else detect_segments
+    global_segments = []
+    for segment in detect(tile_img):
+        global_segment = segment.copy()
+
+        # Add the X-offset and Y-offset to the coordinates
+        global_segment["x1"] += tile_x_offset
+        global_segment["x2"] += tile_x_offset
+        global_segment["y1"] += offset_y
+        global_segment["y2"] += offset_y
+        # find_line_segments() on the tile gives a tile-local rho
+        rad = math.radians(global_segment["theta"])
+        global_segment["rho"] = int(global_segment["x1"] * math.cos(rad) +
+                                    global_segment["y1"] * math.sin(rad))
+
+        global_segments.append(global_segment)
+
+    return global_segments
+
+# Line Segment Detection Function
+
+
+def detect_segments(img, length=SEGMENT_MIN_LENGTH, min_degree=0, max_degree=180, roi=None):
     """
     Detects line segments in a given image object and filters them based on length
 
-    ... (Docstring details omitted) ...
+    roi=(x, y, w, h) restricts the search to part of the image; coordinates
+    are then still relative to the whole image.
     """
     segments = []
 
     # img.find_line_segments() returns 'line' objects
-    for line in img.find_line_segments(merge_distance=10, max_theta_difference=30):
+    if roi is None:
+        lines = img.find_line_segments(merge_distance=MERGE_DISTANCE,
+                                       max_theta_difference=MAX_THETA_DIFFERENCE)
+    else:
+        lines = img.find_line_segments(roi=roi, merge_distance=MERGE_DISTANCE,
+                                       max_theta_difference=MAX_THETA_DIFFERENCE)
+
+    for line in lines:
 
         # Filter based on length and angle (theta)
         if (line.length() > length) and (min_degree <= line.theta()) and (line.theta() <= max_degree):
@@ -240,6 +550,69 @@ def detect_segments(img, length=30, min_degree=0, max_degree=180):
     return segments
 
 
+def _merge_bands(bands):
+    """Merges overlapping (y_start, y_end) row bands."""
+    merged = []
+    for y0, y1 in sorted(bands):
+        if merged and y0 <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], y1)
+        else:
+            merged.append([y0, y1])
+    return merged
+
+
+def detect_segments_pyramid(img, roi=None, scale=PYRAMID_SCALE, margin=PYRAMID_MARGIN,
+                            length=SEGMENT_MIN_LENGTH):
+    """
+    Coarse-to-fine line segment detection.
+
+    Detects at 1/scale resolution to find the row bands that contain edge
+    candidates (theta within PYRAMID_EDGE_THETA), then runs detect_segments()
+    at full resolution only on those bands (plus margin rows). Other coarse
+    segments (e.g. the vertical cutoff line) are scaled back up as-is.
+
+    Output has the same schema and coordinate frame as detect_segments().
+    """
+    if roi is None:
+        roi = (0, 0, img.width(), img.height())
+    x0, y0, w, h = roi
+
+    # 1. Coarse pass
+    coarse = img.copy(roi=roi, x_scale=1.0 / scale, y_scale=1.0 / scale)
+    coarse_segments = detect_segments(coarse, length=length / scale)
+    coarse = None
+
+    bands = []
+    segments = []
+    for seg in coarse_segments:
+        theta = seg["theta"]
+        gx1, gy1 = x0 + seg["x1"] * scale, y0 + seg["y1"] * scale
+        gx2, gy2 = x0 + seg["x2"] * scale, y0 + seg["y2"] * scale
+
+        if PYRAMID_EDGE_THETA[0] <= theta <= PYRAMID_EDGE_THETA[1]:
+            top = max(y0, min(gy1, gy2) - margin)
+            bottom = min(y0 + h, max(gy1, gy2) + scale + margin)
+            bands.append((top, bottom))
+        else:
+            rad = math.radians(theta)
+            segments.append({
+                "x1": gx1, "y1": gy1, "x2": gx2, "y2": gy2,
+                "length": seg["length"] * scale,
+                "theta": theta,
+                "rho": int(gx1 * math.cos(rad) + gy1 * math.sin(rad)),
+            })
+
+    # 2. Fine pass on the candidate strips only
+    bands = _merge_bands(bands)
+    rows = 0
+    for top, bottom in bands:
+        rows += bottom - top
+        segments.extend(detect_segments(img, length=length, roi=(x0, top, w, bottom - top)))
+
+    print("Pyramid: {} strips, {} of {} rows refined".format(len(bands), rows, h))
+    return segments
+
+
 # log_file = "process_img.json"
 # output_img = 'output.bmp'
 # img_file = "IMG/21.bmp"
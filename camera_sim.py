@@ -0,0 +1,151 @@
+# camera_sim.py
+# Simulated camera speaking the command protocol (host testing, no hardware)
+
+import io
+import os
+import json
+import asyncio
+from command_server import CommandServer, StreamTransport, start_tcp
+from pipeline import analyze
+from result_protocol import encode_result
+
+# -----------------------------------------------------------------------------
+# Stands in for UART.py on a host. SNAPSHOT / ANALYZE / PING / STOP behave
+# like on the camera, with the same command_server (queue, merging, tags).
+# ANALYZE replays recorded detection output (pre_process.json as written by
+# main.py, or a JSON list of them) through the real analysis stages
+# (pipeline.analyze) and pushes the result_protocol frames. Capture and
+# detection time is simulated with latency_ms. Without a recording, a few
+# synthetic frames (synth_cassette) are rendered and detected at start
+# (host_detect), with their suggested ROI layout.
+#
+# A simulator is served over TCP (start_sim) or a pty (start_sim_pty), so
+# host_client can drive tens of them like real stations.
+#
+# Functions Summary:
+# 1. load_recording(path) / synthetic_recording(frames, seed)
+# 2. build_sim_server(transport, recording, coords, latency_ms)
+# 3. start_sim(recording, port, ...) / start_sim_pty(recording, ...)
+# -----------------------------------------------------------------------------
+
+SIM_LATENCY_MS = 150
+SIM_COORDS = {"LEFT_ROI": "200", "CENTER_ROI": "800", "RIGHT_ROI": "1500"}
+SYNTH_FRAMES = 4          # Rendered frames when there is no recording
+SYNTH_RESOLUTION = "VGA"
+
+
+def load_recording(path):
+    """
+    Loads recorded detection results.
+
+    Returns:
+        list: [{offset_x (int): [segment_dict, ...]}, ...]
+    """
+    with open(path, "r") as f:
+        data = json.load(f)
+    if isinstance(data, dict):
+        data = [data]
+    # JSON turns the int offsets into strings; the filters add them to x
+    return [{int(k): v for k, v in frame.items()} for frame in data]
+
+
+def synthetic_recording(frames=SYNTH_FRAMES, seed=0):
+    """
+    Detection output of rendered cassette frames (no recording needed).
+
+    Returns:
+        tuple: ([{offset_x: [segment_dict, ...]}, ...], ROI dict)
+    """
+    from synth_cassette import render_cassette
+    from host_detect import detect_stream
+    recording = []
+    coords = None
+    for i in range(frames):
+        frame, width, height, truth = render_cassette(SYNTH_RESOLUTION, seed=seed + i)
+        coords = truth["rois"]
+        recording.append(detect_stream(io.BytesIO(bytes(frame)), coords,
+                                       width=width, height=height))
+    return recording, coords
+
+
+def _recording(recording_path, sim_args):
+    if recording_path is None:
+        recording, coords = synthetic_recording()
+        sim_args.setdefault("coords", coords)
+        return recording
+    return load_recording(recording_path)
+
+
+def build_sim_server(transport, recording, coords=None, latency_ms=SIM_LATENCY_MS):
+    """Command server with the camera commands, backed by a recording."""
+    if coords is None:
+        coords = SIM_COORDS
+    state = {"seq": 0, "frame": 0}
+    server = CommandServer(transport)
+
+    async def snapshot(server, args):
+        await asyncio.sleep(latency_ms / 1000)
+
+    async def analyze_frame(server, args):
+        options = [a.upper() for a in args]
+        mode = "VIRTUAL_SLOTS" if "VIRTUAL_SLOTS" in options else "GAP_ANALYSIS"
+        await asyncio.sleep(latency_ms / 1000)
+        pre_process = recording[state["frame"] % len(recording)]
+        state["frame"] += 1
+        result = analyze(pre_process, coords, mode=mode)
+        state["seq"] = (state["seq"] + 1) & 0xFFFF
+        segments = pre_process if "SEGMENTS" in options else None
+        for data in encode_result(result, seq=state["seq"], segments=segments):
+            server.send(data)
+        return "OK {}".format(state["seq"])
+
+    async def stop(server, args):
+        server.clear_queue()
+        return "STOPPED"
+
+    async def ping(server, args):
+        return "PONG"
+
+    server.register("SNAPSHOT", snapshot, merge=True)
+    # Every ANALYZE gets its own result (seq), so pipelined requests are not merged
+    server.register("ANALYZE", analyze_frame)
+    server.register("STOP", stop, immediate=True)
+    server.register("PING", ping, immediate=True)
+    return server
+
+
+async def start_sim(recording_path=None, host="127.0.0.1", port=0, **sim_args):
+    """
+    Serves a simulated camera over TCP (recording_path None = synthetic frames).
+
+    Returns:
+        tuple: (asyncio server, "tcp://host:port")
+    """
+    recording = _recording(recording_path, sim_args)
+    server = await start_tcp(lambda t: build_sim_server(t, recording, **sim_args), host, port)
+    port = server.sockets[0].getsockname()[1]
+    return server, "tcp://{}:{}".format(host, port)
+
+
+async def start_sim_pty(recording_path=None, **sim_args):
+    """
+    Serves a simulated camera on a pty, like a USB VCP device.
+
+    Returns:
+        tuple: (serve task, slave device path for host_client)
+    """
+    from host_client import open_fd
+    import tty
+    master, slave = os.openpty()
+    tty.setraw(slave)
+    path = os.ttyname(slave)
+    os.set_blocking(master, False)
+    reader, writer = await open_fd(master)
+    recording = _recording(recording_path, sim_args)
+    server = build_sim_server(StreamTransport(reader, writer), recording, **sim_args)
+    return asyncio.create_task(server.serve()), path
+
+# ---------USAGE-----------
+# server, url = await start_sim("pre_process.json", port=8765)  # file must exist
+# task, path = await start_sim_pty()                           # synthetic frames
+# python3 host_client.py --sim 20 --rounds 10
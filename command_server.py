@@ -0,0 +1,346 @@
+# command_server.py
+# Non-blocking line-framed command server (USB VCP on the camera, streams on a host)
+
+try:
+    import uasyncio as asyncio
+except ImportError:
+    import asyncio
+import time
+
+try:
+    from time import ticks_ms, ticks_diff
+except ImportError:
+    def ticks_ms():
+        return int(time.monotonic() * 1000)
+
+    def ticks_diff(a, b):
+        return a - b
+
+# -----------------------------------------------------------------------------
+# Replaces the USB VCP polling loop of UART.py. Three tasks run side by side:
+#   - reader: bytes from the transport -> complete lines (LineFramer), so a
+#             command split across reads is reassembled and several commands
+#             in one read are all seen
+#   - worker: executes queued commands one at a time (capture, analysis)
+#   - writer: sends replies/results from the outbox as they are produced
+# Commands are registered with a handler coroutine. Immediate commands
+# (STOP, PING, ...) are answered by the reader without waiting for the queue.
+#
+# Line protocol (ASCII, one command per line, \n or \r\n):
+#     [#<tag>] <COMMAND> [args...]
+# Replies echo the tag so a host can pipeline several commands:
+#     [#<tag>] OK [text] | ERROR: <text> | BUSY | MERGED | UNKNOWN
+# Untagged commands get untagged replies ("OK", "STOPPED", ...).
+# A queued command that is already waiting (e.g. a burst of SNAPSHOT
+# triggers) can be merged into the pending one (merge=True); a full queue
+# answers BUSY.
+#
+# Diagnostics go through server.log(), which is silent while server.quiet is
+# set: on the camera print() shares the VCP with the binary frames, and a
+# GETFRAME transfer (frame_transfer) sets it while its chunks are streaming.
+#
+# Transports only need "async read() -> bytes" (b"" = closed) and
+# "async write(bytes)":
+#   - VCPTransport: pyb.USB_VCP on the camera
+#   - StreamTransport: asyncio stream pair (TCP socket / pipe) on a host
+#
+# Functions Summary:
+# 1. LineFramer.feed(data) -> [line, ...]
+# 2. CommandServer.register(name, handler, ...)
+# 3. CommandServer.serve() / stop()
+# 4. status(server, args) - built-in STATUS command / parse_status(text)
+# 5. start_tcp(server_factory, host, port)
+# -----------------------------------------------------------------------------
+
+POLL_MS = 5               # VCP poll interval (was 100 ms in the old loop)
+READ_CHUNK = 256
+MAX_LINE = 256            # Longer lines are dropped (garbage / missing newline)
+QUEUE_MAX = 16            # Pending commands before BUSY
+
+
+class VCPTransport:
+    """pyb.USB_VCP as a transport (polled, never blocks the scheduler)."""
+
+    def __init__(self, usb, poll_ms=POLL_MS):
+        self.usb = usb
+        self.poll_ms = poll_ms
+
+    async def read(self):
+        while True:
+            if self.usb.isconnected() and self.usb.any():
+                return self.usb.read(READ_CHUNK) or b""
+            await asyncio.sleep(self.poll_ms / 1000)
+
+    async def write(self, data):
+        view = memoryview(data)
+        while view:
+            written = self.usb.write(view)
+            if written:
+                view = view[written:]
+            else:
+                await asyncio.sleep(self.poll_ms / 1000)
+
+
+class StreamTransport:
+    """asyncio StreamReader/StreamWriter pair as a transport."""
+
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+
+    async def read(self):
+        return await self.reader.read(READ_CHUNK)
+
+    async def write(self, data):
+        self.writer.write(data)
+        await self.writer.drain()
+
+
+class LineFramer:
+    """Splits a byte stream into lines; keeps partial lines across reads."""
+
+    def __init__(self, max_line=MAX_LINE):
+        self.buffer = b""
+        self.max_line = max_line
+        self.dropped = 0
+
+    def feed(self, data):
+        self.buffer += data
+        lines = []
+        while True:
+            index = self.buffer.find(b"\n")
+            if index < 0:
+                break
+            line = self.buffer[:index].strip()
+            self.buffer = self.buffer[index + 1:]
+            if line:
+                lines.append(line)
+        if len(self.buffer) > self.max_line:
+            self.buffer = b""
+            self.dropped += 1
+        return lines
+
+
+def parse_command(line):
+    """
+    Splits a command line into (tag, command, args).
+
+    Returns:
+        tuple: (tag or None, COMMAND upper-cased, [args])
+    """
+    parts = line.decode().split()
+    tag = None
+    if parts and parts[0].startswith("#"):
+        tag = parts.pop(0)[1:]
+    if not parts:
+        return tag, "", []
+    return tag, parts[0].upper(), parts[1:]
+
+
+class CommandServer:
+    """
+    Line-framed command server over one transport.
+
+    Handlers are coroutines handler(server, args) returning the reply text
+    (None = plain OK). An exception becomes an ERROR reply.
+    """
+
+    def __init__(self, transport, queue_max=QUEUE_MAX):
+        self.transport = transport
+        self.queue_max = queue_max
+        self.framer = LineFramer()
+        self.handlers = {}
+        self.queue = []
+        self.outbox = []
+        self.queue_event = asyncio.Event()
+        self.outbox_event = asyncio.Event()
+        self.running = False
+        self.reader_task = None
+        self.quiet = 0            # > 0: diagnostics muted (binary transfer streaming)
+        self.stats = {"received": 0, "executed": 0, "merged": 0, "busy": 0,
+                      "errors": 0, "unknown": 0, "max_queue": 0, "max_wait_ms": 0}
+        self.register("STATUS", status, immediate=True)
+
+    def register(self, name, handler, immediate=False, merge=False):
+        """
+        Registers a command.
+
+        Args:
+            name: Command name (case-insensitive).
+            handler: Coroutine handler(server, args) -> reply text or None.
+            immediate: Run in the reader task instead of queueing.
+            merge: A repeat of a command that is still queued is merged into
+                   it (answered MERGED) instead of being queued again.
+        """
+        self.handlers[name.upper()] = (handler, immediate, merge)
+
+    def send(self, data):
+        """Queues raw bytes (reply line or binary frame) for the writer."""
+        self.outbox.append(data)
+        self.outbox_event.set()
+
+    def log(self, *args):
+        """print() unless a binary transfer is streaming."""
+        if not self.quiet:
+            print(*args)
+
+    def reply(self, tag, text):
+        if tag is not None:
+            text = "#{} {}".format(tag, text)
+        self.send((text + "\r\n").encode())
+
+    def clear_queue(self):
+        """Drops queued commands (e.g. on STOP); returns how many were dropped."""
+        dropped = len(self.queue)
+        for tag, name, args, received in self.queue:
+            self.reply(tag, "STOPPED")
+        self.queue = []
+        return dropped
+
+    async def _execute(self, handler, tag, args):
+        try:
+            result = await handler(self, args)
+            self.reply(tag, "OK" if result is None else result)
+        except Exception as e:
+            self.stats["errors"] += 1
+            self.log("Command failed: {}".format(e))
+            self.reply(tag, "ERROR: {}".format(e))
+
+    async def _dispatch(self, line):
+        tag, name, args = parse_command(line)
+        self.stats["received"] += 1
+        self.log("Received command:", name, args)
+
+        entry = self.handlers.get(name)
+        if entry is None:
+            self.stats["unknown"] += 1
+            self.reply(tag, "UNKNOWN {}".format(name))
+            return
+        handler, immediate, merge = entry
+
+        if immediate:
+            await self._execute(handler, tag, args)
+            return
+
+        if merge:
+            for queued in self.queue:
+                if queued[1] == name and queued[2] == args:
+                    self.stats["merged"] += 1
+                    self.reply(tag, "MERGED")
+                    return
+        if len(self.queue) >= self.queue_max:
+            self.stats["busy"] += 1
+            self.reply(tag, "BUSY")
+            return
+
+        self.queue.append((tag, name, args, ticks_ms()))
+        self.stats["max_queue"] = max(self.stats["max_queue"], len(self.queue))
+        self.queue_event.set()
+
+    async def _reader(self):
+        while self.running:
+            data = await self.transport.read()
+            if not data:
+                self.log("Transport closed")
+                self.running = False
+                break
+            for line in self.framer.feed(data):
+                await self._dispatch(line)
+        self.queue_event.set()
+        self.outbox_event.set()
+
+    async def _worker(self):
+        while self.running:
+            if not self.queue:
+                self.queue_event.clear()
+                await self.queue_event.wait()
+                continue
+            tag, name, args, received = self.queue.pop(0)
+            waited = ticks_diff(ticks_ms(), received)
+            self.stats["max_wait_ms"] = max(self.stats["max_wait_ms"], waited)
+            await self._execute(self.handlers[name][0], tag, args)
+            self.stats["executed"] += 1
+            # Let the reader and writer run between commands
+            await asyncio.sleep(0)
+
+    async def _writer(self):
+        while self.running or self.outbox:
+            if not self.outbox:
+                if not self.running:
+                    break
+                self.outbox_event.clear()
+                await self.outbox_event.wait()
+                continue
+            await self.transport.write(self.outbox.pop(0))
+
+    def spawn(self, coro):
+        """Runs a background coroutine (e.g. a frame transfer) next to the worker."""
+        return asyncio.create_task(coro)
+
+    async def serve(self):
+        """Runs the reader, worker and writer tasks until the transport closes or stop()."""
+        self.running = True
+        worker = asyncio.create_task(self._worker())
+        writer = asyncio.create_task(self._writer())
+        self.reader_task = asyncio.create_task(self._reader())
+        try:
+            await self.reader_task
+        except asyncio.CancelledError:
+            pass  # stop() woke the reader out of a blocking read
+        self.reader_task = None
+        await writer
+        worker.cancel()
+
+    def stop(self):
+        """Stops serving after the pending output has been written."""
+        self.running = False
+        self.queue_event.set()
+        self.outbox_event.set()
+        # The reader may be waiting for input that never comes (called from
+        # an immediate command, the reader itself ends after this line)
+        if self.reader_task is not None and self.reader_task is not asyncio.current_task():
+            self.reader_task.cancel()
+
+
+async def status(server, args):
+    """STATUS: queue depth and counters (built in)."""
+    stats = server.stats
+    return "QUEUE {} MAXQ {} WAIT {} RX {} EXEC {} MERGED {} BUSY {} ERR {}".format(
+        len(server.queue), stats["max_queue"], stats["max_wait_ms"], stats["received"],
+        stats["executed"], stats["merged"], stats["busy"], stats["errors"])
+
+
+def parse_status(text):
+    """STATUS reply text -> dict of ints."""
+    parts = text.split()
+    keys = {"QUEUE": "queue", "MAXQ": "max_queue", "WAIT": "max_wait_ms", "RX": "received",
+            "EXEC": "executed", "MERGED": "merged", "BUSY": "busy", "ERR": "errors"}
+    return {keys[parts[i]]: int(parts[i + 1])
+            for i in range(0, len(parts) - 1, 2) if parts[i] in keys}
+
+
+async def start_tcp(server_factory, host="127.0.0.1", port=8765):
+    """
+    Serves every TCP connection with its own CommandServer (host stand-in
+    for the VCP, works with uasyncio on network-capable boards too).
+
+    Args:
+        server_factory: Callable server_factory(transport) -> CommandServer
+                        with its commands registered.
+    """
+    async def handle(reader, writer):
+        try:
+            await server_factory(StreamTransport(reader, writer)).serve()
+        except asyncio.CancelledError:
+            pass  # Server shutting down
+        finally:
+            writer.close()
+
+    return await asyncio.start_server(handle, host, port)
+
+# ---------USAGE-----------
+# async def snapshot(server, args):
+#     sensor.snapshot().save("UART.jpg")
+# server = CommandServer(VCPTransport(USB_VCP()))
+# server.register("SNAPSHOT", snapshot, merge=True)
+# asyncio.run(server.serve())
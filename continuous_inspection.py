@@ -0,0 +1,127 @@
+# continuous_inspection.py
+# Continuous inspection loop with capture/process overlap (NO sensor.reset(), NO __main__)
+
+import sensor
+import time
+import sensor_state
+from exposure_calibration import calibrated_snapshot
+from take_img import CAPTURE_FRAMESIZE
+
+# -----------------------------------------------------------------------------
+# With more than one frame buffer the sensor keeps exposing and reading out
+# the next frame into a free buffer while the CPU analyzes the frame returned
+# by sensor.snapshot(). Each cycle then costs max(capture, analysis) instead
+# of capture + analysis.
+#
+# Per frame we record:
+#   wait_ms    - time blocked in sensor.snapshot() (sensor slower than CPU)
+#   analyze_ms - time spent in the analyze callback
+#   latency_ms - frame ready (snapshot returned) -> result produced; the wait
+#                for the frame is not part of it (the sensor gives no
+#                exposure timestamp, so snapshot() returning is the earliest
+#                point the frame is known to be ready)
+# -----------------------------------------------------------------------------
+
+FRAME_BUFFERS = 2      # 2 = double buffering, 3 = triple buffering
+REPORT_EVERY = 10      # Print a throughput/latency report every N frames
+
+
+def _summary(stats, elapsed_ms):
+    frames = len(stats)
+    if not frames:
+        return {"frames": 0, "fps": 0.0}
+    latencies = [s["latency_ms"] for s in stats]
+    waits = [s["wait_ms"] for s in stats]
+    return {
+        "frames": frames,
+        "fps": round(frames * 1000.0 / elapsed_ms, 2) if elapsed_ms else 0.0,
+        "latency_avg_ms": round(sum(latencies) / frames, 1),
+        "latency_max_ms": max(latencies),
+        "wait_avg_ms": round(sum(waits) / frames, 1),
+    }
+
+
+def run_continuous(analyze, coords=None, frames=0, buffers=FRAME_BUFFERS,
+                   on_result=None, report_every=REPORT_EVERY):
+    """
+    Captures and analyzes frames back to back with capture/process overlap.
+
+    Exposure is locked once (calibrated_snapshot) and then held, so the
+    sensor streams at a fixed configuration.
+
+    Args:
+        analyze: Callable analyze(img) -> result. img is only valid until the
+                 callback returns (the buffer is handed back to the sensor).
+        coords: Optional ROI dict for ROI-restricted metering.
+        frames: Number of frames to process (0 = run forever).
+        buffers: Number of sensor frame buffers (>= 2 for overlap).
+        on_result: Optional callable on_result(index, result, frame_stats).
+        report_every: Print a report every N frames (0 = never).
+
+    Returns:
+        dict: Summary with frames, fps, latency_avg_ms, latency_max_ms, wait_avg_ms.
+    """
+    # First frame: calibrates (or re-uses the locked exposure) at the final framesize
+    img, exp, gain = calibrated_snapshot(CAPTURE_FRAMESIZE, coords=coords)
+
+    # Buffers are allocated for the current framesize, so they are set after
+    # calibration; a reallocation invalidates img, so the pipe is refilled
+    if sensor_state.set_framebuffers(buffers):
+        sensor_state.settle()
+        img = sensor.snapshot()
+    ready = time.ticks_ms()
+    print("Continuous inspection: {} buffers, exposure {} us, gain {} dB".format(
+        buffers, exp, gain))
+
+    stats = []
+    window = []
+    start = time.ticks_ms()
+    window_start = start
+    index = 0
+    wait_ms = 0
+
+    while True:
+        started = time.ticks_ms()
+        result = analyze(img)
+        done = time.ticks_ms()
+
+        frame_stats = {
+            "wait_ms": wait_ms,
+            "analyze_ms": time.ticks_diff(done, started),
+            "latency_ms": time.ticks_diff(done, ready),
+        }
+        stats.append(frame_stats)
+        window.append(frame_stats)
+
+        if on_result:
+            on_result(index, result, frame_stats)
+
+        index += 1
+        if report_every and index % report_every == 0:
+            report = _summary(window, time.ticks_diff(done, window_start))
+            print("[{}] {} fps, latency avg {} ms (max {}), wait avg {} ms".format(
+                index, report["fps"], report["latency_avg_ms"],
+                report["latency_max_ms"], report["wait_avg_ms"]))
+            window = []
+            window_start = done
+
+        if frames and index >= frames:
+            break
+
+        # Next frame was exposing while we analyzed; usually returns at once
+        before = time.ticks_ms()
+        img = sensor.snapshot()
+        ready = time.ticks_ms()
+        wait_ms = time.ticks_diff(ready, before)
+
+    summary = _summary(stats, time.ticks_diff(time.ticks_ms(), start))
+    print("Continuous inspection done: {}".format(summary))
+    return summary
+
+# ---------USAGE-----------
+# from bmp_line_detection import process_frame
+# from filter import filter_line_segments
+# coords = load_env("env.txt")
+# def analyze(img):
+#     return filter_line_segments(process_frame(img, coords), offset_y=0)
+# run_continuous(analyze, coords=coords, frames=100)
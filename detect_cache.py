@@ -0,0 +1,194 @@
+# detect_cache.py
+# Persistent per-tile detection cache keyed by frame content hash
+
+import os
+import json
+import hashlib
+import binascii
+from bmp_line_detection import (process_image, read_frame_header, tile_geometry,
+                                SEGMENT_MIN_LENGTH, MERGE_DISTANCE, MAX_THETA_DIFFERENCE,
+                                TILE_MEMORY_BUDGET, BAND_OVERLAP)
+
+# -----------------------------------------------------------------------------
+# Re-running the analysis over archived frames with different downstream
+# settings (MAX_GAP, MIN_GAP, FIXED_HEIGHT, ...) does not change detection,
+# so process_image() output is cached per tile under
+#     (frame content hash, ROI offset, detector parameters, tile geometry)
+# One JSON file per entry in CACHE_DIR plus an index holding the LRU order.
+# The oldest entries are evicted once CACHE_MAX_ENTRIES is exceeded.
+#
+# Functions Summary:
+# 1. frame_hash(img_path)
+# 2. cached_process_image(img_path, coords, ...)
+# 3. cache_stats() / cache_clear()
+# -----------------------------------------------------------------------------
+
+CACHE_DIR = "detect_cache"
+CACHE_MAX_ENTRIES = 256
+INDEX_FILE = "index.json"
+HASH_CHUNK = 4096
+
+_stats = {"hits": 0, "misses": 0, "evictions": 0}
+
+
+def _hex(data):
+    return binascii.hexlify(data).decode()
+
+
+def _ensure_dir(path):
+    try:
+        os.mkdir(path)
+    except OSError:
+        pass  # Already exists
+
+
+def _load_index(cache_dir):
+    try:
+        with open(cache_dir + "/" + INDEX_FILE, "r") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return []
+
+
+def _save_index(cache_dir, order):
+    with open(cache_dir + "/" + INDEX_FILE, "w") as f:
+        json.dump(order, f)
+
+
+def frame_hash(img_path):
+    """SHA-256 of the frame file contents (hex), read in chunks."""
+    h = hashlib.sha256()
+    with open(img_path, "rb") as f:
+        while True:
+            chunk = f.read(HASH_CHUNK)
+            if not chunk:
+                break
+            h.update(chunk)
+    return _hex(h.digest())
+
+
+def detector_params(offset_y, sensor_type, tile_w, pyramid=False, band_rows=None):
+    """
+    Everything besides the pixels that changes process_image() output.
+    band_rows matters because banded tiles are detected band by band and
+    stitched, which does not give exactly the segments of one whole tile.
+    """
+    return {
+        "sensor_type": sensor_type,
+        "offset_y": offset_y,
+        "tile_w": tile_w,
+        "band_rows": band_rows,
+        "band_overlap": BAND_OVERLAP,
+        "pyramid": pyramid,
+        "length": SEGMENT_MIN_LENGTH,
+        "merge_distance": MERGE_DISTANCE,
+        "max_theta_difference": MAX_THETA_DIFFERENCE,
+    }
+
+
+def entry_key(frame_digest, offset_x, params):
+    """Cache key of one tile."""
+    text = "{}|{}|{}".format(frame_digest, offset_x, json.dumps(sorted(params.items())))
+    return _hex(hashlib.sha256(text.encode()).digest())[:32]
+
+
+def cached_process_image(img_path, coords, offset_y=0, sensor_type="VGA", logs=False,
+                         pyramid=False, memory_budget=TILE_MEMORY_BUDGET,
+                         cache_dir=CACHE_DIR, max_entries=CACHE_MAX_ENTRIES):
+    """
+    Same as process_image(), but tiles already detected for this frame
+    content and detector parameters are loaded from the cache.
+
+    Returns:
+        dict: {tile_x_offset: [segment_dict, ...]} or None on failure.
+    """
+    try:
+        digest = frame_hash(img_path)
+        with open(img_path, "rb") as f:
+            _, width, height, _, _ = read_frame_header(f, sensor_type=sensor_type)
+    except OSError:
+        print(f"An error occurred: Image file '{img_path}' not found (OSError).")
+        return None
+    except ValueError as e:
+        print(f"An error occurred: {e}")
+        return None
+
+    _ensure_dir(cache_dir)
+    order = _load_index(cache_dir)
+    # Tile width depends on the whole ROI layout and band height on the
+    # memory budget, so fix both before splitting the layout into cached and
+    # missing tiles (the missing ones are detected with the same geometry)
+    geometry = tile_geometry(width, height, coords, offset_y=offset_y,
+                             memory_budget=memory_budget)
+    tile_w = geometry["tile_w"]
+    params = detector_params(offset_y, sensor_type, tile_w, pyramid, geometry["band_rows"])
+
+    results = {}
+    missing = {}
+    keys = {}
+    for name, value in coords.items():
+        offset_x = int(value)
+        key = entry_key(digest, offset_x, params)
+        keys[offset_x] = key
+        try:
+            with open(cache_dir + "/" + key + ".json", "r") as f:
+                results[offset_x] = json.load(f)
+            _stats["hits"] += 1
+            if key in order:
+                order.remove(key)
+            order.append(key)
+        except (OSError, ValueError):
+            missing[name] = value
+            _stats["misses"] += 1
+
+    print("Detection cache: {} hit, {} miss".format(len(results), len(missing)))
+
+    if missing:
+        fresh = process_image(img_path, coords=missing, offset_y=offset_y,
+                              sensor_type=sensor_type, logs=logs, pyramid=pyramid,
+                              tile_w=tile_w, memory_budget=geometry["memory_budget"])
+        if fresh is None:
+            return None
+        for offset_x, segments in fresh.items():
+            key = keys[offset_x]
+            with open(cache_dir + "/" + key + ".json", "w") as f:
+                json.dump(segments, f)
+            if key in order:
+                order.remove(key)
+            order.append(key)
+            results[offset_x] = segments
+
+    # LRU eviction
+    while len(order) > max_entries:
+        old = order.pop(0)
+        try:
+            os.remove(cache_dir + "/" + old + ".json")
+        except OSError:
+            pass
+        _stats["evictions"] += 1
+
+    _save_index(cache_dir, order)
+    return results
+
+
+def cache_stats():
+    """Returns hit/miss/eviction counters since start."""
+    return dict(_stats)
+
+
+def cache_clear(cache_dir=CACHE_DIR):
+    """Removes all cached entries and the index."""
+    for key in _load_index(cache_dir):
+        try:
+            os.remove(cache_dir + "/" + key + ".json")
+        except OSError:
+            pass
+    _save_index(cache_dir, [])
+
+# ---------USAGE-----------
+# coords = load_env("env.txt")
+# for max_gap in (30, 40, 50):
+#     pre_process = cached_process_image("IMG_2796.bin", coords, sensor_type="FHD")
+#     filtered = filter_line_segments(pre_process, offset_y=0)
+#     gaps = normalize_gaps(filtered, max_gap=max_gap, min_gap=20, segment_index=0)
+# print(cache_stats())
@@ -0,0 +1,194 @@
+# empty_reference.py
+# Empty-cassette reference model: slot occupancy by differencing
+
+import json
+from estimate import virtual_slot_windows
+from bmp_line_detection import roi_tile_width
+
+# -----------------------------------------------------------------------------
+# For a fixed station the empty cassette looks the same every time. We store,
+# once per station, the per-row mean intensity of each ROI band of an empty
+# cassette together with the box geometry. A new frame is then compared with
+# the reference only inside the virtual slot windows (see
+# estimate.virtual_slot_windows):
+#   - intensity: mean of the window
+#   - gradient:  mean absolute row-to-row difference of the window (a wafer
+#                edge adds a strong horizontal edge)
+# A clear difference means Occupied, a clear match Empty. Anything in between
+# is Ambiguous, and the caller falls back to the full line-segment pipeline.
+#
+# Functions Summary:
+# 1. capture_reference(img, coords, box_top, box_height, ...)
+# 2. load_reference(station)
+# 3. reference_occupancy(img, reference, ...)
+# 4. fast_occupancy(img, reference, fallback, ...)
+# -----------------------------------------------------------------------------
+
+REFERENCE_FILE = "empty_ref_{}.json"
+
+# Decision thresholds on the combined difference score (0-255 scale)
+GRADIENT_WEIGHT = 2.0
+EMPTY_MAX_SCORE = 6.0       # score <= this -> Empty
+OCCUPIED_MIN_SCORE = 15.0   # score >= this -> Occupied
+
+
+def row_profile(img, x, w, y0, y1):
+    """Mean intensity of every row y0 <= y < y1 of a column band."""
+    y0 = max(0, int(y0))
+    y1 = min(img.height(), int(y1))
+    return [img.get_statistics(roi=(x, y, w, 1)).mean() for y in range(y0, y1)]
+
+
+def window_features(profile):
+    """Returns (mean, gradient) of a row-mean profile."""
+    if not profile:
+        return 0.0, 0.0
+    mean = sum(profile) / len(profile)
+    if len(profile) < 2:
+        return mean, 0.0
+    grad = sum(abs(profile[i + 1] - profile[i]) for i in range(len(profile) - 1))
+    return mean, grad / (len(profile) - 1)
+
+
+def capture_reference(img, coords, box_top, box_height, station="default",
+                      tile_w=None):
+    """
+    Stores the empty-cassette reference of the ROI bands for a station.
+
+    Args:
+        img: GRAYSCALE frame of the EMPTY cassette.
+        coords: ROI dict (env.txt format).
+        box_top, box_height: Box geometry of that frame
+                             (get_box_reference_metrics()).
+        station: Station name, used in the file name.
+        tile_w: Band width (default: roi_tile_width(), the detection tiles).
+
+    Returns:
+        dict: The stored reference.
+    """
+    if tile_w is None:
+        tile_w = roi_tile_width(coords, img.width())
+    reference = {
+        "width": img.width(),
+        "height": img.height(),
+        "tile_w": tile_w,
+        "box_top": box_top,
+        "box_height": box_height,
+        "rois": {},
+    }
+    for value in coords.values():
+        offset_x = int(value)
+        w = min(tile_w, img.width() - offset_x)
+        reference["rois"][str(offset_x)] = row_profile(img, offset_x, w, 0, img.height())
+
+    filename = REFERENCE_FILE.format(station)
+    with open(filename, "w") as f:
+        json.dump(reference, f)
+    print("Empty reference saved to {}".format(filename))
+    return reference
+
+
+def load_reference(station="default"):
+    """Loads a station's empty reference, or None if there is none."""
+    try:
+        with open(REFERENCE_FILE.format(station), "r") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def reference_occupancy(img, reference, roi_offset=800, box_top=None,
+                        box_height=None, **window_args):
+    """
+    Decides per-slot occupancy by differencing against the empty reference.
+
+    Args:
+        img: GRAYSCALE frame, same resolution as the reference.
+        reference: Loaded reference (load_reference()).
+        roi_offset: ROI band to inspect (CENTER_ROI in analyze_virtual_slots).
+        box_top, box_height: Box geometry (defaults to the reference's).
+        window_args: Extra arguments for virtual_slot_windows().
+
+    Returns:
+        tuple: (inventory, ambiguous) with the analyze_virtual_slots() schema
+               plus a "score" per slot, and the list of ambiguous slot ids.
+    """
+    if img.width() != reference["width"] or img.height() != reference["height"]:
+        raise ValueError("Frame {}x{} does not match reference {}x{}".format(
+            img.width(), img.height(), reference["width"], reference["height"]))
+
+    ref_profile = reference["rois"].get(str(roi_offset))
+    if ref_profile is None:
+        raise ValueError("ROI {} not in reference".format(roi_offset))
+
+    if box_top is None:
+        box_top = reference["box_top"]
+    if box_height is None:
+        box_height = reference["box_height"]
+    w = min(reference["tile_w"], img.width() - roi_offset)
+
+    # The reference profile is indexed by the reference frame's rows, so each
+    # slot is compared with the same slot's window in the reference box
+    ref_windows = virtual_slot_windows(reference["box_top"], reference["box_height"],
+                                       **window_args)
+
+    inventory = {}
+    ambiguous = []
+    live_windows = virtual_slot_windows(box_top, box_height, **window_args)
+    for (i, expected_y, win_top, win_bottom), ref_window in zip(live_windows, ref_windows):
+        y0 = max(0, int(win_top))
+        y1 = min(img.height(), int(win_bottom) + 1)
+        ref_y0 = max(0, int(ref_window[2]))
+        ref_y1 = min(len(ref_profile), int(ref_window[3]) + 1)
+
+        live_mean, live_grad = window_features(row_profile(img, roi_offset, w, y0, y1))
+        ref_mean, ref_grad = window_features(ref_profile[ref_y0:ref_y1])
+        score = abs(live_mean - ref_mean) + GRADIENT_WEIGHT * abs(live_grad - ref_grad)
+
+        if score >= OCCUPIED_MIN_SCORE:
+            status = "Occupied"
+        elif score <= EMPTY_MAX_SCORE:
+            status = "Empty"
+        else:
+            status = "Ambiguous"
+            ambiguous.append(f"Slot_{i}")
+
+        inventory[f"Slot_{i}"] = {
+            "status": status,
+            "expected_y": round(expected_y, 1),
+            "actual_y": None,
+            "score": round(score, 1),
+        }
+
+    return inventory, ambiguous
+
+
+def fast_occupancy(img, reference, fallback, **occupancy_args):
+    """
+    Reference differencing with fallback to the full pipeline.
+
+    Args:
+        img: GRAYSCALE frame.
+        reference: Loaded reference, or None (always falls back).
+        fallback: Callable fallback(img) -> inventory (full line-segment pipeline).
+        occupancy_args: Extra arguments for reference_occupancy().
+
+    Returns:
+        tuple: (inventory, used_fallback)
+    """
+    if reference is None:
+        print("No empty reference, running full pipeline")
+        return fallback(img), True
+
+    inventory, ambiguous = reference_occupancy(img, reference, **occupancy_args)
+    if ambiguous:
+        print("Reference ambiguous for {}, running full pipeline".format(ambiguous))
+        return fallback(img), True
+    return inventory, False
+
+# ---------USAGE-----------
+# Once, with the cassette empty:
+# capture_reference(img, coords, box_top, box_height, station="ST01")
+# Every cycle:
+# ref = load_reference("ST01")
+# inventory, used_fallback = fast_occupancy(img, ref, full_pipeline, roi_offset=800)
@@ -82,36 +82,52 @@ def get_box_reference_metrics(boundary_dict, left_key=200, right_key=1500):
 
     return actual_top, actual_height
 
-def analyze_virtual_slots(filtered_groups, box_top, box_height, center_offset=800):
+def virtual_slot_windows(box_top, box_height, slots=24, reference_height=920.0,
+                         start_pos=100.0, pitch=30.0):
     """
-    Creates 24 virtual windows starting 100px from the box top and checks for disks.
+    Computes the virtual slot windows for a box, scaled from the reference
+    geometry (reference_height, start_pos and pitch are in reference pixels).
 
-    Args:
-        filtered_groups: Dict of filtered lines.
-        box_top: The average Y coordinate of the box's top boundary.
-        box_height: The average vertical height of the box (Bottom Y - Top Y).
+    Returns:
+        list: [(slot_number, expected_y, win_top, win_bottom), ...]
     """
     # Calculate Scaling Factor (Current Height / Reference Height)
-    S = box_height / 920.0
+    S = box_height / reference_height
 
     # Scaled reference values
-    scaled_offset = 100.0 * S
-    scaled_pitch = 30.0 * S
+    scaled_offset = start_pos * S
+    scaled_pitch = pitch * S
     window_half_height = scaled_pitch / 2.0  # Window size to prevent overlap
 
+    windows = []
+    for i in range(1, slots + 1):
+        # Calculate the expected center Y for this slot
+        expected_y = box_top + scaled_offset + ((i - 1) * scaled_pitch)
+        windows.append((i, expected_y,
+                        expected_y - window_half_height,
+                        expected_y + window_half_height))
+    return windows
+
+
+def analyze_virtual_slots(filtered_groups, box_top, box_height, center_offset=800, windows=None):
+    """
+    Creates 24 virtual windows starting 100px from the box top and checks for disks.
+
+    Args:
+        filtered_groups: Dict of filtered lines.
+        box_top: The average Y coordinate of the box's top boundary.
+        box_height: The average vertical height of the box (Bottom Y - Top Y).
+        windows: Optional precomputed slot windows (e.g. pose_tracker.predicted_windows()).
+    """
     # Get center detections from the 800 offset
     center_disks = filtered_groups.get(center_offset, [])
 
     inventory = {}
 
-    for i in range(1, 25):  # Slots 1 through 24
-        # Calculate the expected center Y for this slot
-        expected_y = box_top + scaled_offset + ((i - 1) * scaled_pitch)
-
-        # Define the virtual bounding box (Window)
-        win_top = expected_y - window_half_height
-        win_bottom = expected_y + window_half_height
+    if windows is None:
+        windows = virtual_slot_windows(box_top, box_height)
 
+    for i, expected_y, win_top, win_bottom in windows:
         # Check if any detected disk falls within this window
         found_disk = None
         for disk in center_disks:
@@ -2,12 +2,15 @@
 OV5640 exposure calibration + calibrated capture.
 
 Used by the pipeline for calibrated grayscale binary capture.
-Only calls sensor.reset() when run as a script.
+Only calls sensor.reset() when run as a script. All sensor configuration
+goes through sensor_state, which skips settings that are already applied.
 """
 
 import sensor
 import time
 import os
+import sensor_state
+from bmp_line_detection import roi_tile_width
 
 # -------------------------------------------------
 # SD mount (your firmware uses /sdcard)
@@ -50,6 +53,10 @@ EXPOSURE_DOWN_FACTOR = 0.85
 # Histogram sampling
 SAMPLE_STEP = 4
 
+# ROI-restricted metering: env.txt ROI offsets are columns of the final
+# capture; each band is as wide as the detection tiles (roi_tile_width())
+FRAME_SIZES = sensor_state.FRAME_SIZES
+
 # Output (raw grayscale bytes)
 OUT_PATH = SD_ROOT + "/final.bmp"
 
@@ -60,16 +67,17 @@ OUT_PATH = SD_ROOT + "/final.bmp"
 def clamp(x, lo, hi):
     return lo if x < lo else hi if x > hi else x
 
+# Sensor writes go through sensor_state so unchanged settings are skipped
+# and the settle is only paid when something actually changed.
+
 def settle(ms):
-    sensor.skip_frames(time=ms)
+    sensor_state.settle(ms)
 
 def force_exposure(us):
-    sensor.set_auto_exposure(False)
-    sensor.set_auto_exposure(False, exposure_us=int(us))
+    sensor_state.set_exposure(us)
 
 def force_gain(db):
-    sensor.set_auto_gain(False)
-    sensor.set_auto_gain(False, gain_db=float(db))
+    sensor_state.set_gain(db)
 
 # -------------------------------------------------
 # RGB -> luminance
@@ -91,15 +99,59 @@ def rgb_to_luma(px):
 # Histogram utilities
 # -------------------------------------------------
 
-def histogram_from_image(img):
+def roi_bands_for_meter(coords, meter_w, frame_w, tile_w=None):
+    """
+    Map ROI column offsets (capture resolution) onto the metering frame.
+
+    Returns:
+        list: Sorted [(x_start, x_end), ...] column ranges at meter_w.
+    """
+    if tile_w is None:
+        tile_w = roi_tile_width(coords, frame_w)
+    scale = meter_w / frame_w
+    bands = []
+    for value in coords.values():
+        x0 = int(int(value) * scale)
+        x1 = int((int(value) + tile_w) * scale)
+        x0 = clamp(x0, 0, meter_w - 1)
+        x1 = clamp(x1, x0 + 1, meter_w)
+        bands.append((x0, x1))
+    return sorted(bands)
+
+
+def roi_bands_in_window(coords, window, tile_w=None):
+    """
+    ROI column bands (capture resolution) relative to a sensor window
+    (x, y, w, h), clipped to it. Bands outside the window are dropped.
+    """
+    if tile_w is None:
+        tile_w = roi_tile_width(coords)
+    win_x, _, win_w, _ = window
+    bands = []
+    for value in coords.values():
+        x0 = clamp(int(value) - win_x, 0, win_w)
+        x1 = clamp(int(value) + tile_w - win_x, 0, win_w)
+        if x1 > x0:
+            bands.append((x0, x1))
+    return sorted(bands)
+
+
+def histogram_from_image(img, bands=None):
     w, h = img.width(), img.height()
+    if not bands:
+        bands = [(0, w)]
+    gray = img.format() == sensor.GRAYSCALE
+    # Keep the sample count of a QVGA meter frame at higher resolutions
+    step = SAMPLE_STEP * max(1, w // 320)
     bins = [0] * 256
     total = 0
-    for y in range(0, h, SAMPLE_STEP):
-        for x in range(0, w, SAMPLE_STEP):
-            y8 = rgb_to_luma(img.get_pixel(x, y))
-            bins[y8] += 1
-            total += 1
+    for x0, x1 in bands:
+        for y in range(0, h, step):
+            for x in range(x0, x1, step):
+                px = img.get_pixel(x, y)
+                y8 = px if gray else rgb_to_luma(px)
+                bins[y8] += 1
+                total += 1
     return bins, total
 
 
@@ -120,33 +172,82 @@ def clip_fractions(bins, total):
     hi = sum(bins[250:256]) / total if total else 0
     return lo, hi
 
+
+def meter(img, bands=None):
+    """Returns (q10, q50, q95, clip_lo, clip_hi) of the sampled histogram."""
+    bins, total = histogram_from_image(img, bands)
+    q10 = quantile(bins, total, 0.10)
+    q50 = quantile(bins, total, 0.50)
+    q95 = quantile(bins, total, 0.95)
+    clip_lo, clip_hi = clip_fractions(bins, total)
+    return q10, q50, q95, clip_lo, clip_hi
+
+
+def exposure_ok(stats):
+    """Returns (shadows_ok, mids_ok, highs_ok) for meter() stats."""
+    q10, q50, q95, clip_lo, clip_hi = stats
+    shadows_ok = (q10 >= TARGET_Q10) and (clip_lo <= MAX_CLIP_LO)
+    mids_ok    = abs(q50 - TARGET_Q50) <= 20
+    highs_ok   = (q95 <= TARGET_Q95) and (clip_hi <= MAX_CLIP_HI)
+    return shadows_ok, mids_ok, highs_ok
+
 # -------------------------------------------------
 # Exposure calibration
 # -------------------------------------------------
 
-def calibrate(verbose=True):
+# Last locked (exposure_us, gain_db); used as the starting point of the
+# next calibration so an in-range ROI histogram skips the auto baseline.
+last_lock = None
+
+
+def calibrate(verbose=True, coords=None, frame_w=1920, start=None):
+    """
+    Iteratively meters and locks exposure/gain.
+
+    Args:
+        verbose: Print per-iteration histogram stats.
+        coords: Optional ROI dict (env.txt format). When given, only the ROI
+                column bands are sampled instead of the whole frame.
+        frame_w: Width of the capture the ROI offsets refer to.
+        start: Optional (exposure_us, gain_db) to start from. Defaults to the
+               last locked values; None on first run uses the auto baseline.
+
+    Returns:
+        tuple: (exposure_us, gain_db)
+    """
+    global last_lock
     print("Calibrating exposure…")
 
-    sensor.set_pixformat(METER_PIXFORMAT)
-    sensor.set_framesize(METER_FRAMESIZE)
-    sensor.set_auto_whitebal(False)
+    sensor_state.set_pixformat(METER_PIXFORMAT)
+    sensor_state.set_framesize(METER_FRAMESIZE)
+    sensor_state.set_whitebal(False)
 
-    # Start from auto baseline
-    sensor.set_auto_exposure(True)
-    sensor.set_auto_gain(True)
-    settle(800)
+    bands = None
+    if coords:
+        bands = roi_bands_for_meter(coords, sensor.width(), frame_w)
+        print("Metering ROI bands:", bands)
 
-    try:
-        exp = sensor.get_exposure_us()
-    except:
-        exp = 20000
-    try:
-        gain = sensor.get_gain_db()
-    except:
-        gain = 6.0
+    if start is None:
+        start = last_lock
 
-    sensor.set_auto_exposure(False)
-    sensor.set_auto_gain(False)
+    if start is None:
+        # Start from auto baseline
+        sensor_state.set_auto(True)
+        settle(800)
+
+        try:
+            exp = sensor.get_exposure_us()
+        except:
+            exp = 20000
+        try:
+            gain = sensor.get_gain_db()
+        except:
+            gain = 6.0
+    else:
+        # Previous lock; the first iteration exits if it is still in range
+        exp, gain = start
+
+    sensor_state.set_auto(False)
 
     force_exposure(exp)
     force_gain(gain)
@@ -154,12 +255,8 @@ def calibrate(verbose=True):
 
     for i in range(MAX_ITERS):
         img = sensor.snapshot()
-        bins, total = histogram_from_image(img)
-
-        q10 = quantile(bins, total, 0.10)
-        q50 = quantile(bins, total, 0.50)
-        q95 = quantile(bins, total, 0.95)
-        clip_lo, clip_hi = clip_fractions(bins, total)
+        stats = meter(img, bands)
+        q10, q50, q95, clip_lo, clip_hi = stats
 
         if verbose:
             print(
@@ -173,9 +270,7 @@ def calibrate(verbose=True):
                 "clip_hi", round(clip_hi,3)
             )
 
-        shadows_ok = (q10 >= TARGET_Q10) and (clip_lo <= MAX_CLIP_LO)
-        mids_ok    = abs(q50 - TARGET_Q50) <= 20
-        highs_ok   = (q95 <= TARGET_Q95) and (clip_hi <= MAX_CLIP_HI)
+        shadows_ok, mids_ok, highs_ok = exposure_ok(stats)
 
         if shadows_ok and mids_ok and highs_ok:
             break
@@ -202,55 +297,97 @@ def calibrate(verbose=True):
             settle(200)
 
     print("Locked exposure:", int(exp), "gain:", round(gain,1))
+    last_lock = (int(exp), float(gain))
     return int(exp), float(gain)
 
 # -------------------------------------------------
 # Calibrated capture (for pipeline)
 # -------------------------------------------------
 
-def capture_and_save_grayscale(filename, framesize=None):
+def calibrated_snapshot(framesize, coords=None, window=None):
     """
-    Calibrate, capture GRAYSCALE image at max resolution, and save to file.
+    Take a GRAYSCALE snapshot with locked exposure, calibrating only when needed.
+
+    When the sensor is still in GRAYSCALE capture mode at this framesize with
+    a locked exposure, the frame is taken directly (only the window is
+    changed if it differs) and exposure is re-metered only if the ROI
+    histogram of that frame is out of range.
 
     Args:
-        filename: Path to save the image (.bin for raw grayscale)
-        framesize: sensor framesize constant (default: sensor.WQXGA2 for 2592x1944)
+        framesize: sensor framesize constant
+        coords: Optional ROI dict; restricts metering to the ROI bands
+        window: Optional sensor window (x, y, w, h) at framesize; None = full frame
 
     Returns:
-        dict: Metadata with exposure_us, gain_db, width, height
+        tuple: (img, exposure_us, gain_db). img lives in the frame buffer.
     """
-    # Default to maximum resolution for OV5640
-    if framesize is None:
-        framesize = sensor.WQXGA2  # 2592x1944 (5MP)
+    frame_w = FRAME_SIZES.get(framesize, (1920, 1080))[0]
 
-    exp, gain = calibrate(verbose=True)
+    if last_lock is not None and sensor_state.matches(
+            pixformat=sensor.GRAYSCALE, framesize=framesize):
+        print("Capture mode unchanged, checking exposure...")
+        sensor_state.set_windowing(window)
+        sensor_state.settle()
+        img = sensor.snapshot()
+
+        bands = None
+        if coords and window:
+            bands = roi_bands_in_window(coords, window)
+        elif coords:
+            bands = roi_bands_for_meter(coords, img.width(), frame_w)
+        shadows_ok, mids_ok, highs_ok = exposure_ok(meter(img, bands))
+        if shadows_ok and mids_ok and highs_ok:
+            exp, gain = last_lock
+            return img, exp, gain
+
+    exp, gain = calibrate(verbose=True, coords=coords, frame_w=frame_w)
 
     print("Switching to GRAYSCALE capture mode...")
-    sensor.set_pixformat(sensor.GRAYSCALE)
+    sensor_state.set_pixformat(sensor.GRAYSCALE)
 
-    # Step up through resolutions for stability (OV5640 quirk)
+    # sensor_state steps up through SXGA for stability (OV5640 quirk)
     print("Setting framesize (step-up)...")
     try:
-        sensor.set_framesize(sensor.SXGA)  # 1280x1024 first
-        settle(200)
-        sensor.set_framesize(framesize)    # Then target resolution
+        sensor_state.set_framesize(framesize)
     except Exception as e:
         print("Failed to set framesize: {}, trying fallback...".format(e))
+        window = None  # window coordinates refer to the requested framesize
         try:
-            sensor.set_framesize(sensor.UXGA)  # Try 1600x1200
+            sensor_state.set_framesize(sensor.UXGA)  # Try 1600x1200
         except:
-            sensor.set_framesize(sensor.VGA)   # Last resort
+            sensor_state.set_framesize(sensor.VGA)   # Last resort
 
-    sensor.set_auto_whitebal(False)
+    sensor_state.set_windowing(window)
+    sensor_state.set_whitebal(False)
     force_exposure(exp)
     force_gain(gain)
 
     print("Settling...")
-    settle(1000)  # Longer settle for high res
+    sensor_state.settle()
 
     # Capture image
     print("Capturing snapshot...")
     img = sensor.snapshot()
+    return img, exp, gain
+
+
+def capture_and_save_grayscale(filename, framesize=None, coords=None):
+    """
+    Calibrate, capture GRAYSCALE image at max resolution, and save to file.
+
+    Args:
+        filename: Path to save the image (.bin for raw grayscale)
+        framesize: sensor framesize constant (default: sensor.WQXGA2 for 2592x1944)
+        coords: Optional ROI dict; restricts metering to the ROI bands
+
+    Returns:
+        dict: Metadata with exposure_us, gain_db, width, height
+    """
+    # Default to maximum resolution for OV5640
+    if framesize is None:
+        framesize = sensor.WQXGA2  # 2592x1944 (5MP)
+
+    img, exp, gain = calibrated_snapshot(framesize, coords=coords)
     w, h = img.width(), img.height()
     print("Captured: {}x{}".format(w, h))
 
@@ -270,15 +407,9 @@ def capture_and_save_grayscale(filename, framesize=None):
 def capture_final(exp, gain):
     print("Capturing final image…")
 
-    sensor.set_pixformat(FINAL_PIXFORMAT)
-    settle(300)
-
-    sensor.set_framesize(sensor.SXGA)
-    settle(300)
-    sensor.set_framesize(FINAL_FRAMESIZE)
-    settle(600)
-
-    sensor.set_auto_whitebal(False)
+    sensor_state.set_pixformat(FINAL_PIXFORMAT)
+    sensor_state.set_framesize(FINAL_FRAMESIZE)
+    sensor_state.set_whitebal(False)
 
     force_exposure(min(exp, FINAL_EXPOSURE_MAX_US))
     force_gain(gain)
@@ -304,7 +435,7 @@ def main():
     if "sdcard" not in os.listdir("/"):
         raise OSError("SD card not mounted at /sdcard")
 
-    sensor.reset()
+    sensor_state.reset()
 
     exp, gain = calibrate(verbose=True)
     capture_final(exp, gain)
@@ -0,0 +1,143 @@
+# frame_gate.py
+# Frame-change gating: skip analysis when the ROI bands have not changed
+
+from bmp_line_detection import roi_tile_width
+
+# -----------------------------------------------------------------------------
+# A frame's signature is the mean intensity of GATE_BLOCKS horizontal blocks
+# in each ROI band ({offset_x: [mean, ...]}), which costs a few dozen
+# get_statistics() calls instead of a full detection pass. If every block of
+# the new frame is within GATE_TOLERANCE of the last analyzed frame, the
+# cached result is returned as-is.
+#
+# Functions Summary:
+# 1. roi_signature(img, coords, ...)
+# 2. changed_rois(signature_a, signature_b, tolerance)
+# 3. gated(img, coords, analyze, ...)
+# 4. gate_stats() / gate_reset()
+# -----------------------------------------------------------------------------
+
+GATE_BLOCKS = 36       # ~one slot pitch per block on a 1080-row FHD band
+GATE_TOLERANCE = 4     # Max mean difference per block (0-255) for a "match"
+
+_gate = {"signature": None, "result": None, "hits": 0, "misses": 0}
+
+
+def roi_signature(img, coords, tile_w=None, blocks=GATE_BLOCKS,
+                  offset_y=0, tile_h=None):
+    """
+    Computes a low-resolution signature of the ROI bands.
+
+    Args:
+        img: GRAYSCALE image holding the full frame.
+        coords: ROI dict (env.txt format).
+        tile_w: ROI band width in pixels (default: roi_tile_width(), the
+                detection tile width).
+        blocks: Number of horizontal blocks per band.
+        offset_y: First frame row of the bands.
+        tile_h: Band height (default: rest of the frame).
+
+    Returns:
+        dict: {offset_x: [block_mean, ...]}
+    """
+    if tile_w is None:
+        tile_w = roi_tile_width(coords, img.width())
+    if tile_h is None:
+        tile_h = img.height() - offset_y
+    block_h = max(1, tile_h // blocks)
+
+    signature = {}
+    for offset_x in sorted(int(v) for v in coords.values()):
+        w = min(tile_w, img.width() - offset_x)
+        means = []
+        for b in range(blocks):
+            y = offset_y + b * block_h
+            if y >= offset_y + tile_h:
+                break
+            h = min(block_h, offset_y + tile_h - y)
+            means.append(img.get_statistics(roi=(offset_x, y, w, h)).mean())
+        signature[offset_x] = means
+    return signature
+
+
+def changed_rois(signature_a, signature_b, tolerance=GATE_TOLERANCE):
+    """
+    Compares two signatures.
+
+    Returns:
+        list: Offsets whose bands differ by more than tolerance in any block
+              (or that are missing from one of the signatures).
+    """
+    if signature_a is None or signature_b is None:
+        keys = set(signature_a or {}) | set(signature_b or {})
+        return sorted(keys)
+
+    changed = []
+    for offset_x in sorted(set(signature_a) | set(signature_b)):
+        a = signature_a.get(offset_x)
+        b = signature_b.get(offset_x)
+        if a is None or b is None or len(a) != len(b):
+            changed.append(offset_x)
+            continue
+        for mean_a, mean_b in zip(a, b):
+            if abs(mean_a - mean_b) > tolerance:
+                changed.append(offset_x)
+                break
+    return changed
+
+
+def gated(img, coords, analyze, tolerance=GATE_TOLERANCE, **signature_args):
+    """
+    Runs analyze(img) only if the ROI bands changed since the last analyzed
+    frame, otherwise returns the cached result.
+
+    Args:
+        img: GRAYSCALE image holding the full frame.
+        coords: ROI dict (env.txt format).
+        analyze: Callable analyze(img) -> result (e.g. inventory / gap results).
+        tolerance: Max mean difference per block for a match.
+        signature_args: Extra arguments for roi_signature().
+
+    Returns:
+        The result of analyze(img) or the cached one.
+    """
+    signature = roi_signature(img, coords, **signature_args)
+
+    if _gate["signature"] is not None and not changed_rois(
+            _gate["signature"], signature, tolerance):
+        _gate["hits"] += 1
+        print("Frame gate: unchanged, using cached result")
+        return _gate["result"]
+
+    _gate["misses"] += 1
+    result = analyze(img)
+
+    # Keep the reference of the analyzed frame, so slow drift still triggers
+    _gate["signature"] = signature
+    _gate["result"] = result
+    return result
+
+
+def gate_stats():
+    """Returns the hit/miss counters of the gate."""
+    total = _gate["hits"] + _gate["misses"]
+    return {
+        "hits": _gate["hits"],
+        "misses": _gate["misses"],
+        "hit_rate": round(_gate["hits"] / total, 3) if total else 0.0,
+    }
+
+
+def gate_reset():
+    """Drops the cached signature/result and clears the counters."""
+    _gate["signature"] = None
+    _gate["result"] = None
+    _gate["hits"] = 0
+    _gate["misses"] = 0
+
+# ---------USAGE-----------
+# from continuous_inspection import run_continuous
+# def analyze(img):
+#     return filter_line_segments(process_frame(img, coords), offset_y=0)
+# run_continuous(lambda img: gated(img, coords, analyze), coords=coords, frames=100)
+# print(gate_stats())
@@ -0,0 +1,264 @@
+# frame_transfer.py
+# Chunked, resumable frame transfer over the command server (GETFRAME)
+
+try:
+    import uasyncio as asyncio
+except ImportError:
+    import asyncio
+import binascii
+from bmp_line_detection import roi_tile_width
+from result_protocol import (encode_frame_info, encode_frame_chunk, encode_frame_end,
+                             MSG_FRAME_INFO, MSG_FRAME_CHUNK, MSG_FRAME_END)
+
+# -----------------------------------------------------------------------------
+# GETFRAME pulls a frame off a station without removing the SD card.
+#
+# Camera side: prepare_transfer() copies the frame (whole frame, JPEG
+# compressed or raw, or raw ROI column bands only) into a transfer buffer
+# with an id, and send_transfer() streams it as result_protocol frames:
+#     MSG_FRAME_INFO  (id, size, width, height, format, chunk, crc32, bands)
+#     MSG_FRAME_CHUNK (id, offset, data) ...
+#     MSG_FRAME_END   (id, size, crc32)
+# It runs as a background task of the command server and only queues the
+# next chunk while the outbox is short, so analysis commands keep running
+# and their replies are interleaved with the chunks. The last KEEP_TRANSFERS
+# buffers are kept, so an interrupted transfer resumes from a byte offset
+# (RESUME <id> <offset>, a chunk boundary) without capturing again. Only one
+# transfer streams at a time; start_transfer() refuses a second one while
+# the first is still being sent (the command replies BUSY).
+#
+# Host side: FrameReceiver reassembles chunks from FrameDecoder events,
+# checks the CRC and reports where to resume after a gap.
+#
+# Functions Summary:
+# 1. prepare_transfer(img, fmt, coords, ...)
+# 2. start_transfer(server, transfer, offset) / send_transfer(server, transfer, offset, chunk)
+# 3. get_transfer(transfer_id) / active_transfer()
+# 4. FrameReceiver.handle(event) / resume_offset()
+# 5. save_received(result, path)
+# -----------------------------------------------------------------------------
+
+CHUNK_SIZE = 2048
+JPEG_QUALITY = 80
+OUTBOX_LIMIT = 4          # Chunks queued ahead of the VCP writer
+KEEP_TRANSFERS = 1        # Transfer buffers kept for RESUME
+
+_transfers = {}
+_state = {"next_id": 0, "active": None}
+
+
+def _crc(data):
+    return binascii.crc32(data) & 0xFFFFFFFF
+
+
+def prepare_transfer(img, fmt="JPEG", coords=None, tile_w=None, quality=JPEG_QUALITY):
+    """
+    Copies a frame into a new transfer buffer.
+
+    Args:
+        img: GRAYSCALE frame (its buffer may be reused once this returns).
+        fmt: "JPEG" (compressed on the camera) or "RAW".
+        coords: ROI dict; if given, only the ROI column bands are sent (RAW),
+                concatenated band after band (tile_w wide, default
+                roi_tile_width() like the detection tiles).
+        quality: JPEG quality.
+
+    Returns:
+        dict: {id, data, width, height, format, bands, crc}
+
+    Raises:
+        ValueError: JPEG requested for ROI bands.
+        MemoryError: Frame does not fit the heap (use JPEG or ROI bands).
+    """
+    width, height = img.width(), img.height()
+    bands = []
+    if coords:
+        if fmt != "RAW":
+            raise ValueError("ROI band transfers are RAW only")
+        if tile_w is None:
+            tile_w = roi_tile_width(coords, width)
+        parts = []
+        for x in sorted(int(v) for v in coords.values()):
+            w = min(tile_w, width - x)
+            if w <= 0:
+                continue
+            parts.append(bytes(img.copy(roi=(x, 0, w, height)).bytearray()))
+            bands.append((x, w))
+        data = b"".join(parts)
+    elif fmt == "JPEG":
+        try:
+            data = bytes(img.compressed(quality=quality).bytearray())
+        except MemoryError:
+            # Not enough heap for a second image: compress the frame buffer in place
+            data = bytes(img.compress(quality=quality).bytearray())
+    else:
+        data = bytes(img.bytearray())
+
+    _state["next_id"] = (_state["next_id"] + 1) & 0xFFFF
+    transfer = {"id": _state["next_id"], "data": data, "width": width, "height": height,
+                "format": fmt, "bands": bands, "crc": _crc(data)}
+
+    while len(_transfers) >= KEEP_TRANSFERS:
+        _transfers.pop(min(_transfers))
+    _transfers[transfer["id"]] = transfer
+    print("Transfer {}: {} bytes {}".format(transfer["id"], len(data), fmt))
+    return transfer
+
+
+def get_transfer(transfer_id):
+    """A kept transfer buffer, or None."""
+    return _transfers.get(transfer_id)
+
+
+def active_transfer():
+    """Id of the transfer being streamed, or None."""
+    return _state["active"]
+
+
+def start_transfer(server, transfer, offset=0, chunk=CHUNK_SIZE):
+    """
+    Starts streaming a transfer in the background.
+
+    Returns:
+        bool: False if another transfer is still streaming (nothing started).
+
+    Raises:
+        ValueError: offset outside the data or not on a chunk boundary.
+    """
+    size = len(transfer["data"])
+    if offset < 0 or (offset >= size and size) or offset % chunk:
+        raise ValueError("offset {} not a chunk boundary below {}".format(offset, size))
+    if _state["active"] is not None:
+        return False
+    # Marked here, not in the task, so a command right after this one sees it
+    _state["active"] = transfer["id"]
+    server.spawn(send_transfer(server, transfer, offset=offset, chunk=chunk))
+    return True
+
+
+async def send_transfer(server, transfer, offset=0, chunk=CHUNK_SIZE):
+    """
+    Streams a transfer from a byte offset (background task of the server,
+    see start_transfer()).
+    """
+    data = transfer["data"]
+    size = len(data)
+    # print() would land between (or inside) the chunks on the VCP
+    server.quiet += 1
+    try:
+        server.send(encode_frame_info(transfer["id"], size, transfer["width"],
+                                      transfer["height"], transfer["format"], chunk,
+                                      transfer["crc"], transfer["bands"]))
+        view = memoryview(data)
+        while offset < size:
+            # Backpressure: only a few chunks ahead of the writer
+            while len(server.outbox) >= OUTBOX_LIMIT:
+                await asyncio.sleep(0.002)
+            end = min(size, offset + chunk)
+            server.send(encode_frame_chunk(transfer["id"], offset, bytes(view[offset:end])))
+            offset = end
+            await asyncio.sleep(0)
+        server.send(encode_frame_end(transfer["id"], size, transfer["crc"]))
+        # Stay quiet until the last frame has left the outbox
+        while server.outbox:
+            await asyncio.sleep(0.002)
+    finally:
+        server.quiet -= 1
+        if _state["active"] == transfer["id"]:
+            _state["active"] = None
+
+
+class FrameReceiver:
+    """
+    Host-side reassembly of GETFRAME transfers.
+
+    Feed it every ("frame", msg_type, payload) event from FrameDecoder;
+    handle() returns the finished transfer (dict with "data") once the END
+    frame arrived and the CRC matched. After a gap (lost or corrupted chunk)
+    chunks are ignored until the transfer is resumed at resume_offset().
+    """
+
+    def __init__(self):
+        self.info = None
+        self.data = None
+        self.offset = 0
+
+    def resume_offset(self):
+        return self.offset
+
+    def handle(self, event):
+        if event[0] != "frame":
+            return None
+        msg_type, payload = event[1], event[2]
+
+        if msg_type == MSG_FRAME_INFO:
+            if self.info is None or self.info["transfer_id"] != payload["transfer_id"]:
+                self.info = payload
+                self.data = bytearray(payload["size"])
+                self.offset = 0
+            return None
+
+        if self.info is None or payload["transfer_id"] != self.info["transfer_id"]:
+            return None
+
+        if msg_type == MSG_FRAME_CHUNK:
+            start = payload["offset"]
+            chunk = payload["data"]
+            if start <= self.offset < start + len(chunk):
+                self.data[start:start + len(chunk)] = chunk
+                self.offset = start + len(chunk)
+            return None
+
+        if msg_type == MSG_FRAME_END:
+            if self.offset < self.info["size"]:
+                print("Transfer {} incomplete, resume at {}".format(
+                    self.info["transfer_id"], self.offset))
+                return None
+            if _crc(bytes(self.data)) != self.info["crc"]:
+                print("Transfer {} CRC mismatch, restarting".format(self.info["transfer_id"]))
+                self.offset = 0
+                return None
+            result = dict(self.info)
+            result["data"] = bytes(self.data)
+            self.info = None
+            self.data = None
+            self.offset = 0
+            return result
+        return None
+
+
+def save_received(result, path):
+    """
+    Writes a finished transfer: JPEG as is, a raw frame as a headerless raw
+    file (readable by process_image), ROI bands as one raw file per band
+    (path_<x>.bin).
+
+    Returns:
+        list: Written file names.
+    """
+    if not result["bands"]:
+        with open(path, "wb") as f:
+            f.write(result["data"])
+        return [path]
+
+    written = []
+    base = path.rsplit(".", 1)[0]
+    pos = 0
+    for x, w in result["bands"]:
+        size = w * result["height"]
+        name = "{}_{}.bin".format(base, x)
+        with open(name, "wb") as f:
+            f.write(result["data"][pos:pos + size])
+        pos += size
+        written.append(name)
+    return written
+
+# ---------USAGE-----------
+# Camera (command handler):
+# transfer = prepare_transfer(img, fmt="JPEG")
+# if not start_transfer(server, transfer): return "BUSY"
+# Host:
+# receiver = FrameReceiver()
+# for event in decoder.feed(data):
+#     done = receiver.handle(event)
+#     if done: save_received(done, "station1.jpg")
@@ -61,6 +61,18 @@ def check_lines_in_file(filename: str, offset_1: int, offset_2: int, fixed_heigh
         print(f"Error opening or reading file {filename}: {e}")
         return 0
 
+    return check_lines(data, offset_1, offset_2, fixed_height=fixed_height, width=width)
+
+
+def check_lines(data, offset_1, offset_2, fixed_height=5, width=50):
+    """
+    Same as check_lines_in_file(), on normalize_gaps() output already in
+    memory (no JSON file round trip).
+
+    Returns:
+        tuple: (count, hit_array), or 0 if a required offset has no lines.
+    """
+
     # 2. EXTRACT AND PARSE REQUIRED LINES
     lines1 = []  # Lines for Bounding Boxes (offset_1)
     lines2 = []  # Lines for Intersection Check (offset_2)
@@ -70,8 +82,7 @@ def check_lines_in_file(filename: str, offset_1: int, offset_2: int, fixed_heigh
     parse_lines(offset_2, data, lines2)
 
     if not lines1 or not lines2:
-        print(f"Could not find required line segments (Offset {
-              offset_1} or {offset_2}) in the file.")
+        print(f"Could not find required line segments (Offset {offset_1} or {offset_2}) in the file.")
         return 0
 
     # 3. CREATE BOUNDING BOXES (from lines1)
@@ -199,15 +210,13 @@ def normalize_gaps(
     sorted_offsets = sorted(segments_by_offset.keys())
 
     if not sorted_offsets or segment_index >= len(sorted_offsets) or segment_index < -len(sorted_offsets):
-        print(f"Error: Segment index {
-              segment_index} is out of range or no offsets found.")
+        print(f"Error: Segment index {segment_index} is out of range or no offsets found.")
         return {}
 
     TARGET_OFFSET_X = sorted_offsets[segment_index]
     target_segments = segments_by_offset[TARGET_OFFSET_X]
 
-    print(f"Targeting Segment Index {segment_index} (Offset X: {
-          TARGET_OFFSET_X}) for normalization.")
+    print(f"Targeting Segment Index {segment_index} (Offset X: {TARGET_OFFSET_X}) for normalization.")
 
     # 2. Apply vertical spacing (Min Gap removal and Max Gap filling)
     target_segments.sort(key=lambda s: (
@@ -277,8 +286,7 @@ def normalize_gaps(
     MAX_IMAGE_HEIGHT = 1080  # Assuming FHD height for the vertical span
 
     if len(final_segments_target) < MIN_REQUIRED_SEGMENTS:
-        print(f"\n[QC Check] Segment count ({len(final_segments_target)}) is below minimum ({
-              MIN_REQUIRED_SEGMENTS}). Extending from the bottom...")
+        print(f"\n[QC Check] Segment count ({len(final_segments_target)}) is below minimum ({MIN_REQUIRED_SEGMENTS}). Extending from the bottom...")
 
         segments_to_add = MIN_REQUIRED_SEGMENTS - len(final_segments_target)
 
@@ -337,8 +345,7 @@ def normalize_gaps(
             }
             final_segments_target.append(new_segment)
 
-        print(f"Total segments after extending from bottom: {
-              len(final_segments_target)}")
+        print(f"Total segments after extending from bottom: {len(final_segments_target)}")
 
     # 6. Combining the results
 
@@ -348,8 +355,7 @@ def normalize_gaps(
 
     final_segments = final_segments_target
 
-    print(f"Total segments after normalization at Offset {
-          TARGET_OFFSET_X}: {len(final_segments_target)}")
+    print(f"Total segments after normalization at Offset {TARGET_OFFSET_X}: {len(final_segments_target)}")
 
     # Add back all the untouched segments
     for offset, segments in segments_by_offset.items():
@@ -0,0 +1,199 @@
+# geometry_correction.py
+# Geometric correction of detected segment endpoints (no image warping)
+
+import json
+import math
+from lens_lut import correct_point
+
+# -----------------------------------------------------------------------------
+# Straightening the frame before find_line_segments costs a full resample.
+# Slot analysis only needs corrected segment coordinates, so this stage runs
+# between detection (process_image / process_frame) and filter_line_segments
+# and moves the two endpoints of every segment:
+#   1. lens distortion, via the lens_lut tables (if given)
+#   2. a 3x3 homography (perspective / cassette tilt), if the model has one
+# theta, rho and length are then recomputed from the corrected endpoints, so
+# a tilted cassette edge comes back into the 80-120 degree horizontal window.
+# The cost is proportional to the number of segments, not pixels.
+#
+# The model is a small JSON file (MODEL_FILE) loaded at boot:
+#   {"homography": [h0, ..., h8] or null}
+#
+# Functions Summary:
+# 1. homography_from_points(src, dst) / rotation_homography(angle, cx, cy)
+# 2. tilt_angle(segment_data_dict, ...)
+# 3. correct_segment(seg, model, lut, origin_x, origin_y)
+# 4. correct_segments(segment_data_dict, model, lut)
+# 5. save_model(model) / load_model()
+# -----------------------------------------------------------------------------
+
+MODEL_FILE = "geometry_model.json"
+TILT_MIN_LENGTH = 60      # Segments used to measure the cassette tilt
+TILT_MAX_ANGLE = 20       # Only segments within +-20 deg of horizontal
+
+
+def apply_homography(h, x, y):
+    """Maps (x, y) through the 3x3 homography h (row-major list of 9)."""
+    w = h[6] * x + h[7] * y + h[8]
+    if abs(w) < 1e-9:
+        return x, y
+    return (h[0] * x + h[1] * y + h[2]) / w, (h[3] * x + h[4] * y + h[5]) / w
+
+
+def _solve(a, b):
+    """Solves a x = b (Gaussian elimination with partial pivoting)."""
+    n = len(b)
+    m = [row[:] + [b[i]] for i, row in enumerate(a)]
+    for col in range(n):
+        pivot = max(range(col, n), key=lambda r: abs(m[r][col]))
+        if abs(m[pivot][col]) < 1e-12:
+            raise ValueError("Degenerate point configuration")
+        m[col], m[pivot] = m[pivot], m[col]
+        for r in range(col + 1, n):
+            f = m[r][col] / m[col][col]
+            for c in range(col, n + 1):
+                m[r][c] -= f * m[col][c]
+    x = [0.0] * n
+    for r in range(n - 1, -1, -1):
+        x[r] = (m[r][n] - sum(m[r][c] * x[c] for c in range(r + 1, n))) / m[r][r]
+    return x
+
+
+def homography_from_points(src, dst):
+    """
+    Homography mapping 4 source points onto 4 destination points, e.g. the
+    measured cassette corners onto their ideal (rectified) positions.
+
+    Args:
+        src, dst: [(x, y), ...] with 4 points each.
+
+    Returns:
+        list: Row-major 3x3 homography (9 floats).
+    """
+    if len(src) != 4 or len(dst) != 4:
+        raise ValueError("homography_from_points needs exactly 4 point pairs")
+    a = []
+    b = []
+    for (x, y), (u, v) in zip(src, dst):
+        a.append([x, y, 1, 0, 0, 0, -u * x, -u * y])
+        b.append(u)
+        a.append([0, 0, 0, x, y, 1, -v * x, -v * y])
+        b.append(v)
+    return _solve(a, b) + [1.0]
+
+
+def rotation_homography(angle, cx, cy):
+    """Homography rotating by angle degrees (clockwise on screen) about (cx, cy)."""
+    rad = math.radians(angle)
+    c = math.cos(rad)
+    s = math.sin(rad)
+    return [c, -s, cx - c * cx + s * cy,
+            s, c, cy - s * cx - c * cy,
+            0.0, 0.0, 1.0]
+
+
+def tilt_angle(segment_data_dict, min_length=TILT_MIN_LENGTH, max_angle=TILT_MAX_ANGLE):
+    """
+    Median angle (degrees, screen coordinates) of the long near-horizontal
+    segments, i.e. how far the cassette is tilted. 0.0 if none were found.
+    """
+    angles = []
+    for segment_list in segment_data_dict.values():
+        for seg in segment_list:
+            dx = seg["x2"] - seg["x1"]
+            dy = seg["y2"] - seg["y1"]
+            if dx < 0:
+                dx, dy = -dx, -dy
+            if math.sqrt(dx * dx + dy * dy) < min_length:
+                continue
+            angle = math.degrees(math.atan2(dy, dx))
+            if abs(angle) <= max_angle:
+                angles.append(angle)
+    if not angles:
+        return 0.0
+    angles.sort()
+    return angles[len(angles) // 2]
+
+
+def _correct_point(x, y, model, lut):
+    if lut is not None:
+        x, y = correct_point(lut, x, y)
+    if model is not None and model.get("homography"):
+        x, y = apply_homography(model["homography"], x, y)
+    return x, y
+
+
+def correct_segment(seg, model=None, lut=None, origin_x=0, origin_y=0):
+    """
+    Corrects the endpoints of one segment (frame coordinates) and recomputes
+    theta (normal angle, 90 = horizontal), rho (relative to origin_x/origin_y,
+    by default the frame origin like the detectors) and length.
+
+    Returns:
+        dict: New segment dict with the same keys.
+    """
+    x1, y1 = _correct_point(seg["x1"], seg["y1"], model, lut)
+    x2, y2 = _correct_point(seg["x2"], seg["y2"], model, lut)
+    dx = x2 - x1
+    dy = y2 - y1
+
+    theta = int(round(math.degrees(math.atan2(dy, dx)) + 90)) % 180
+    rad = math.radians(theta)
+    corrected = dict(seg)
+    corrected.update({
+        "x1": int(round(x1)), "y1": int(round(y1)),
+        "x2": int(round(x2)), "y2": int(round(y2)),
+        "length": int(round(math.sqrt(dx * dx + dy * dy))),
+        "theta": theta,
+        "rho": int((x1 - origin_x) * math.cos(rad) + (y1 - origin_y) * math.sin(rad)),
+    })
+    return corrected
+
+
+def correct_segments(segment_data_dict, model=None, lut=None):
+    """
+    Corrects every segment of a detection result.
+
+    Args:
+        segment_data_dict: {offset_x: [segment_dict, ...]} as returned by
+                           process_image() / process_tiles() / process_frame()
+                           or host_detect (all give rho relative to the
+                           frame origin).
+        model: Loaded geometry model (load_model()) or None.
+        lut: lens_lut.station_lut() tables or None.
+
+    Returns:
+        dict: Same structure with corrected segments (rho still relative to
+              the frame origin, as in the input).
+    """
+    if not segment_data_dict or (model is None and lut is None):
+        return segment_data_dict
+    corrected = {}
+    for offset_x, segment_list in segment_data_dict.items():
+        corrected[offset_x] = [correct_segment(seg, model, lut) for seg in segment_list]
+    return corrected
+
+
+def save_model(model, filename=MODEL_FILE):
+    """Stores the geometry model as JSON."""
+    with open(filename, "w") as f:
+        json.dump(model, f)
+    print("Geometry model saved to {}".format(filename))
+
+
+def load_model(filename=MODEL_FILE):
+    """Loads the geometry model, or None if there is none."""
+    try:
+        with open(filename, "r") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+# ---------USAGE-----------
+# Once per station, from a frame with the cassette in place:
+# angle = tilt_angle(pre_process)
+# save_model({"homography": rotation_homography(-angle, 960, 540)})
+# Every frame:
+# model = load_model()
+# pre_process = correct_segments(process_frame(img, coords), model=model)
+# filtered = filter_line_segments(pre_process, offset_y=0)
@@ -0,0 +1,173 @@
+# host_batch.py
+# Re-analyzes a directory (or glob) of captured frames on the host with a process pool
+
+import os
+import io
+import sys
+import glob
+import json
+import time
+import argparse
+import contextlib
+from multiprocessing import Pool
+from utils import load_env, roi_coords
+from host_detect import detect_file
+from pipeline import analyze
+
+# -----------------------------------------------------------------------------
+# Runs the main.py chain on saved frames instead of one image at a time on a
+# camera:
+#     detect_file (host stand-in for process_image)
+#     -> GAP_ANALYSIS:  filter_line_segments -> normalize_gaps -> check_lines
+#     -> VIRTUAL_SLOTS: analyze_virtual_slots
+# Frames are independent, so they are spread over a multiprocessing Pool (one
+# process per core, no shared state) and scale with the number of cores. The
+# chatty prints of the pipeline stages are muted in the workers. All results
+# go into one JSON file: {"env", "summary", "frames": [...]} in input order.
+#
+# Functions Summary:
+# 1. find_frames(inputs)
+# 2. analyze_frame(img_path, coords, modes, ...)
+# 3. run_batch(frames, coords, modes, workers, ...)
+# -----------------------------------------------------------------------------
+
+FRAME_EXTENSIONS = (".bin", ".bmp", ".raw")
+MODES = ("GAP_ANALYSIS", "VIRTUAL_SLOTS")
+
+
+def find_frames(inputs):
+    """
+    Frame files from directories, glob patterns and file names.
+
+    Returns:
+        list: Sorted, de-duplicated paths.
+    """
+    frames = set()
+    for item in inputs:
+        if os.path.isdir(item):
+            for name in os.listdir(item):
+                if name.lower().endswith(FRAME_EXTENSIONS):
+                    frames.add(os.path.join(item, name))
+        else:
+            frames.update(p for p in glob.glob(item) if os.path.isfile(p))
+    return sorted(frames)
+
+
+def analyze_frame(img_path, coords, modes=MODES, offset_y=0, width=None, height=None,
+                  sensor_type=None, quiet=True, name=None):
+    """
+    Detection and analysis of one frame file.
+
+    Args:
+        img_path: BMP or headerless raw frame (file name or binary file object).
+        coords: ROI dict (env.txt format).
+        modes: Pipeline modes to run.
+        quiet: Mute the prints of the pipeline stages.
+        name: Frame name in the result (default: img_path).
+
+    Returns:
+        dict: {frame, segments, detect_ms, analyze_ms, <mode>: result, ...}
+              or {frame, error}.
+    """
+    result = {"frame": name or img_path}
+    sink = io.StringIO() if quiet else sys.stdout
+    try:
+        with contextlib.redirect_stdout(sink):
+            start = time.perf_counter()
+            pre_process = detect_file(img_path, coords, offset_y=offset_y, width=width,
+                                      height=height, sensor_type=sensor_type)
+            detected = time.perf_counter()
+            for mode in modes:
+                result[mode] = analyze(pre_process, coords, mode=mode)
+            done = time.perf_counter()
+    except (OSError, ValueError) as e:
+        result["error"] = "{}: {}".format(type(e).__name__, e)
+        return result
+    result["segments"] = sum(len(v) for v in pre_process.values())
+    result["detect_ms"] = round((detected - start) * 1000, 1)
+    result["analyze_ms"] = round((done - detected) * 1000, 1)
+    return result
+
+
+def _run_job(job):
+    index, img_path, coords, options = job
+    return index, analyze_frame(img_path, coords, **options)
+
+
+def run_batch(frames, coords, modes=MODES, workers=None, progress=True, **options):
+    """
+    Analyzes frames in a process pool.
+
+    Args:
+        frames: Frame paths.
+        coords: ROI dict used for every frame.
+        workers: Processes (default: CPU count; 1 runs in this process).
+        options: analyze_frame() arguments (offset_y, width, height, sensor_type).
+
+    Returns:
+        tuple: ([frame result, ...] in input order, summary dict)
+    """
+    workers = workers or os.cpu_count() or 1
+    options["modes"] = tuple(modes)
+    jobs = [(i, path, coords, options) for i, path in enumerate(frames)]
+    results = [None] * len(jobs)
+
+    start = time.perf_counter()
+    if workers == 1 or len(jobs) < 2:
+        completed = map(_run_job, jobs)
+        pool = None
+    else:
+        pool = Pool(workers)
+        chunksize = max(1, len(jobs) // (workers * 8))
+        completed = pool.imap_unordered(_run_job, jobs, chunksize)
+    try:
+        for n, (index, result) in enumerate(completed, 1):
+            results[index] = result
+            if progress and (n % 50 == 0 or n == len(jobs)):
+                print("{}/{} frames".format(n, len(jobs)))
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+    elapsed = time.perf_counter() - start
+
+    ok = [r for r in results if "error" not in r]
+    summary = {
+        "frames": len(results),
+        "failed": len(results) - len(ok),
+        "workers": workers,
+        "elapsed_s": round(elapsed, 3),
+        "frames_per_second": round(len(results) / elapsed, 2) if elapsed else 0.0,
+        "detect_ms_mean": round(sum(r["detect_ms"] for r in ok) / len(ok), 1) if ok else None,
+    }
+    return results, summary
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Re-analyze captured frames on the host.")
+    parser.add_argument("inputs", nargs="+", help="Frame directories, glob patterns or files")
+    parser.add_argument("--env", default="env.txt", help="ROI configuration")
+    parser.add_argument("--mode", choices=MODES + ("ALL",), default="ALL")
+    parser.add_argument("--workers", type=int, help="Processes (default: CPU count)")
+    parser.add_argument("--offset-y", type=int, default=0)
+    parser.add_argument("--width", type=int, help="Width of headerless raw frames")
+    parser.add_argument("--height", type=int, help="Height of headerless raw frames")
+    parser.add_argument("--sensor-type", help="Raw frame size name (VGA, FHD, ...)")
+    parser.add_argument("--output", default="batch_results.json")
+    args = parser.parse_args()
+
+    coords = roi_coords(load_env(args.env))
+    frames = find_frames(args.inputs)
+    modes = MODES if args.mode == "ALL" else (args.mode,)
+    print("{} frames, ROIs {}".format(len(frames), coords))
+
+    results, summary = run_batch(frames, coords, modes=modes, workers=args.workers,
+                                 offset_y=args.offset_y, width=args.width,
+                                 height=args.height, sensor_type=args.sensor_type)
+    with open(args.output, "w") as f:
+        json.dump({"env": coords, "summary": summary, "frames": results}, f)
+    print(json.dumps(summary))
+
+# ---------USAGE-----------
+# python3 host_batch.py captures/2024-05-02/ --env env.txt --output day.json
+# python3 host_batch.py "captures/*/IMG_*.bin" --mode VIRTUAL_SLOTS --workers 8
@@ -0,0 +1,287 @@
+# host_client.py
+# Host-side asyncio client for the camera command protocol (many stations at once)
+
+import os
+import tty
+import json
+import time
+import asyncio
+import argparse
+from result_protocol import FrameDecoder, MSG_FRAME_INFO, MSG_FRAME_CHUNK, MSG_FRAME_END
+from frame_transfer import FrameReceiver
+
+# -----------------------------------------------------------------------------
+# One CameraClient per station. Connections are
+#   "tcp://host:port"       - command_server.start_tcp / camera_sim
+#   "/dev/ttyACM0", "/dev/pts/N" - USB VCP of a camera, or a simulator pty
+# (serial devices are opened raw; USB CDC ignores the baud rate).
+#
+# Every command is sent with a #tag (see command_server), so several
+# commands can be in flight per station (max_inflight) and replies are
+# matched to them. Result frames (result_protocol) arrive before the
+# "OK <seq>" reply of ANALYZE and are attached to it by seq. Each command has
+# its own timeout; a station that times out does not stall the others.
+#
+# Functions Summary:
+# 1. open_serial(path) / open_connection(url)
+# 2. CameraClient.command(name, *args, timeout) / analyze(mode) / get_frame(fmt)
+# 3. gather_inventories(urls, mode, rounds, ...)
+# -----------------------------------------------------------------------------
+
+COMMAND_TIMEOUT = 10.0    # Seconds per command
+MAX_INFLIGHT = 4          # Pipelined commands per station
+READ_CHUNK = 4096
+
+
+async def open_serial(path):
+    """Opens a tty (USB VCP or pty) as an asyncio (reader, writer) pair."""
+    fd = os.open(path, os.O_RDWR | os.O_NOCTTY | os.O_NONBLOCK)
+    if os.isatty(fd):
+        tty.setraw(fd)
+    return await open_fd(fd)
+
+
+async def open_fd(fd):
+    """Wraps a non-blocking file descriptor into an asyncio (reader, writer) pair."""
+    loop = asyncio.get_running_loop()
+    reader = asyncio.StreamReader()
+    read_file = os.fdopen(fd, "rb", buffering=0)
+    write_file = os.fdopen(os.dup(fd), "wb", buffering=0)
+    await loop.connect_read_pipe(lambda: asyncio.StreamReaderProtocol(reader), read_file)
+    transport, protocol = await loop.connect_write_pipe(
+        lambda: asyncio.StreamReaderProtocol(asyncio.StreamReader()), write_file)
+    writer = asyncio.StreamWriter(transport, protocol, reader, loop)
+    return reader, writer
+
+
+async def open_connection(url):
+    """(reader, writer) for a tcp://host:port URL or a serial device path."""
+    if url.startswith("tcp://"):
+        host, _, port = url[6:].rpartition(":")
+        return await asyncio.open_connection(host or "127.0.0.1", int(port))
+    return await open_serial(url)
+
+
+class CameraClient:
+    """Tagged, pipelined command client for one camera."""
+
+    def __init__(self, url, timeout=COMMAND_TIMEOUT, max_inflight=MAX_INFLIGHT):
+        self.url = url
+        self.timeout = timeout
+        self.inflight = asyncio.Semaphore(max_inflight)
+        self.decoder = FrameDecoder()
+        self.receiver = FrameReceiver()
+        self.pending = {}       # tag -> future of the reply line
+        self.results = {}       # seq -> [decoded result frames]
+        self.transfers = {}     # transfer_id -> future of the finished transfer
+        self.finished = {}      # transfer_id -> transfer nobody waited for yet
+        self.untagged = []      # Lines without a tag (prints of the camera)
+        self.next_tag = 0
+        self.reader = None
+        self.writer = None
+        self.task = None
+
+    async def connect(self):
+        self.reader, self.writer = await open_connection(self.url)
+        self.task = asyncio.create_task(self._read_loop())
+        return self
+
+    async def close(self):
+        if self.task:
+            self.task.cancel()
+        if self.writer:
+            self.writer.close()
+        for future in self.pending.values():
+            if not future.done():
+                future.set_exception(ConnectionError("connection closed"))
+        self.pending = {}
+
+    async def _read_loop(self):
+        while True:
+            data = await self.reader.read(READ_CHUNK)
+            if not data:
+                break
+            for event in self.decoder.feed(data):
+                if event[0] == "line":
+                    self._on_line(event[1])
+                elif event[1] in (MSG_FRAME_INFO, MSG_FRAME_CHUNK, MSG_FRAME_END):
+                    self._on_transfer(event)
+                else:
+                    self.results.setdefault(event[2]["seq"], []).append(event[2])
+        for future in self.pending.values():
+            if not future.done():
+                future.set_exception(ConnectionError("connection closed"))
+
+    def _on_line(self, line):
+        if not line.startswith("#"):
+            self.untagged.append(line)
+            del self.untagged[:-20]
+            return
+        tag, _, text = line[1:].partition(" ")
+        future = self.pending.pop(tag, None)
+        if future is not None and not future.done():
+            future.set_result(text)
+
+    def _on_transfer(self, event):
+        done = self.receiver.handle(event)
+        if event[1] == MSG_FRAME_END and done is None and self.receiver.info is not None:
+            # Gap or CRC error: ask for the rest
+            info = self.receiver.info
+            self.writer.write("RESUME {} {}\n".format(
+                info["transfer_id"], self.receiver.resume_offset()).encode())
+        if done is not None:
+            future = self.transfers.pop(done["transfer_id"], None)
+            if future is not None and not future.done():
+                future.set_result(done)
+            else:
+                # Finished before get_frame() got to wait for it
+                self.finished[done["transfer_id"]] = done
+
+    async def command(self, name, *args, timeout=None):
+        """
+        Sends one command and waits for its reply.
+
+        Returns:
+            str: Reply text without the tag (e.g. "OK 12", "BUSY").
+
+        Raises:
+            asyncio.TimeoutError: No reply within the timeout.
+        """
+        async with self.inflight:
+            self.next_tag += 1
+            tag = str(self.next_tag)
+            future = asyncio.get_running_loop().create_future()
+            self.pending[tag] = future
+            line = " ".join(["#" + tag, name] + [str(a) for a in args]) + "\n"
+            self.writer.write(line.encode())
+            await self.writer.drain()
+            try:
+                return await asyncio.wait_for(future, timeout or self.timeout)
+            finally:
+                self.pending.pop(tag, None)
+
+    async def analyze(self, mode="VIRTUAL_SLOTS", segments=False, timeout=None):
+        """
+        Runs ANALYZE on the camera.
+
+        Returns:
+            dict: {reply, seq, inventory / gaps / segments (decoded frames)}
+        """
+        args = [mode] + (["SEGMENTS"] if segments else [])
+        reply = await self.command("ANALYZE", *args, timeout=timeout)
+        result = {"reply": reply}
+        parts = reply.split()
+        if parts and parts[0] == "OK" and len(parts) > 1:
+            seq = int(parts[1])
+            result["seq"] = seq
+            for frame in self.results.pop(seq, []):
+                result.update({k: v for k, v in frame.items() if k != "seq"})
+        return result
+
+    async def get_frame(self, fmt="JPEG", roi=False, timeout=None):
+        """
+        Pulls a frame with GETFRAME (resuming after gaps).
+
+        Returns:
+            dict: Finished transfer (see frame_transfer.FrameReceiver).
+        """
+        args = [fmt] + (["ROI"] if roi else [])
+        reply = await self.command("GETFRAME", *args, timeout=timeout)
+        parts = reply.split()
+        if not parts or parts[0] != "OK":
+            raise RuntimeError("GETFRAME failed: {}".format(reply))
+        transfer_id = int(parts[1])
+        if transfer_id in self.finished:
+            return self.finished.pop(transfer_id)
+        future = asyncio.get_running_loop().create_future()
+        self.transfers[transfer_id] = future
+        try:
+            return await asyncio.wait_for(future, timeout or self.timeout * 6)
+        finally:
+            self.transfers.pop(transfer_id, None)
+
+
+async def _station_rounds(url, mode, rounds, timeout, max_inflight):
+    client = CameraClient(url, timeout=timeout, max_inflight=max_inflight)
+    results = []
+    try:
+        await client.connect()
+        start = time.monotonic()
+        tasks = [asyncio.create_task(client.analyze(mode)) for _ in range(rounds)]
+        for task in tasks:
+            try:
+                result = await task
+            except (asyncio.TimeoutError, ConnectionError) as e:
+                result = {"error": type(e).__name__}
+            result["done_s"] = round(time.monotonic() - start, 3)
+            results.append(result)
+    except OSError as e:
+        results.append({"error": str(e)})
+    finally:
+        await client.close()
+    return results
+
+
+async def gather_inventories(urls, mode="VIRTUAL_SLOTS", rounds=1, timeout=COMMAND_TIMEOUT,
+                             max_inflight=MAX_INFLIGHT):
+    """
+    Runs ANALYZE rounds on all stations concurrently.
+
+    Returns:
+        tuple: ({url: [result, ...]}, summary dict with per_second and inventories_per_second)
+    """
+    start = time.monotonic()
+    per_station = await asyncio.gather(*[
+        _station_rounds(url, mode, rounds, timeout, max_inflight) for url in urls])
+    elapsed = time.monotonic() - start
+    results = dict(zip(urls, per_station))
+    replies = [r.get("reply", "").split(" ")[0] for rs in per_station for r in rs]
+    ok = replies.count("OK")
+    merged = replies.count("MERGED")
+    summary = {"stations": len(urls), "analyses": ok, "merged": merged,
+               "errors": len(replies) - ok - merged,
+               "elapsed_s": round(elapsed, 3),
+               # Answered requests, and of those the ones that delivered an inventory
+               "per_second": round((ok + merged) / elapsed, 1) if elapsed else 0.0,
+               "inventories_per_second": round(ok / elapsed, 1) if elapsed else 0.0}
+    return results, summary
+
+
+async def _main(args):
+    servers = []
+    urls = list(args.urls)
+    if args.sim:
+        from camera_sim import start_sim
+        for i in range(args.sim):
+            server, url = await start_sim(args.recording, port=0, latency_ms=args.latency_ms)
+            servers.append(server)
+            urls.append(url)
+    results, summary = await gather_inventories(urls, mode=args.mode, rounds=args.rounds,
+                                                timeout=args.timeout)
+    for server in servers:
+        server.close()
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"summary": summary, "results": results}, f)
+    print(json.dumps(summary))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Drive many cameras concurrently.")
+    parser.add_argument("urls", nargs="*", help="tcp://host:port or serial device paths")
+    parser.add_argument("--mode", default="VIRTUAL_SLOTS")
+    parser.add_argument("--rounds", type=int, default=1)
+    parser.add_argument("--timeout", type=float, default=COMMAND_TIMEOUT)
+    parser.add_argument("--sim", type=int, default=0, help="Start N simulated cameras")
+    parser.add_argument("--recording",
+                        help="Recorded detection output replayed by the simulator "
+                             "(must exist; default: synthetic frames)")
+    parser.add_argument("--latency-ms", type=int, default=150,
+                        help="Simulated capture + detection time")
+    parser.add_argument("--output", help="Write all results as JSON")
+    asyncio.run(_main(parser.parse_args()))
+
+# ---------USAGE-----------
+# python3 host_client.py /dev/ttyACM0 /dev/ttyACM1 --rounds 5
+# python3 host_client.py --sim 32 --rounds 10
+# python3 host_client.py --sim 4 --rounds 10 --recording pre_process.json  # file must exist
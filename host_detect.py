@@ -0,0 +1,230 @@
+# host_detect.py
+# Pure-Python line segment detection for host tools (no OpenMV image module)
+
+import math
+from bmp_line_detection import (read_frame_header, read_tile_rows, roi_tile_width,
+                                SEGMENT_MIN_LENGTH)
+
+# -----------------------------------------------------------------------------
+# Host tools (batch reprocessing, spool and HTTP services) run the analysis on
+# PCs, where find_line_segments() is not available. This detector is a small
+# stand-in with the same output as process_image(): the frame file is read
+# with the same header/tile helpers and every ROI tile gives a list of
+# {x1, y1, x2, y2, length, theta, rho} segments in frame coordinates.
+#
+# Only what the filters look at is detected:
+#   - horizontal edges (wafer / slot edges, theta around 90): the row-to-row
+#     intensity step is thinned to one pixel per column, edge pixels are
+#     collected into runs along each row, and runs on neighbouring rows that
+#     continue each other (staircase of a tilted line) are chained and fitted
+#     with a straight line.
+#   - vertical edges (cassette cutoff, theta around 0/180): the same on the
+#     transposed tile.
+# Thresholds are looser than the camera's detector is strict; results are
+# comparable in position, not segment for segment.
+#
+# Functions Summary:
+# 1. detect_tile(pixels, w, h, length, threshold)
+# 2. detect_file(img_path, coords, offset_y, ...) / detect_stream(img, coords, ...)
+# -----------------------------------------------------------------------------
+
+EDGE_THRESHOLD = 24       # Min intensity step (over 2 px) of an edge pixel
+RUN_GAP = 2               # Missing edge pixels bridged inside a run
+MIN_RUN = 3               # Shortest run kept
+CHAIN_OVERLAP = 3         # Runs on neighbouring rows may overlap this much
+
+
+def _runs(lines, threshold):
+    """
+    Edge runs along lines (rows of the tile, or columns for vertical edges).
+
+    The edge strength across lines is |line[i+1] - line[i-1]|, thinned to its
+    maximum across lines.
+
+    Returns:
+        list: (start, end, line_index) runs, end inclusive.
+    """
+    n = len(lines)
+    if n < 3:
+        return []
+    size = len(lines[0])
+    grad = [[0] * size]
+    for i in range(1, n - 1):
+        grad.append([abs(a - b) for a, b in zip(lines[i + 1], lines[i - 1])])
+    grad.append([0] * size)
+
+    runs = []
+    for i in range(1, n - 1):
+        start = last = None
+        for pos, (up, g, down) in enumerate(zip(grad[i - 1], grad[i], grad[i + 1])):
+            if g < threshold or g < up or g <= down:
+                continue
+            if start is not None and pos - last > RUN_GAP + 1:
+                if last - start + 1 >= MIN_RUN:
+                    runs.append((start, last, i))
+                start = None
+            if start is None:
+                start = pos
+            last = pos
+        if start is not None and last - start + 1 >= MIN_RUN:
+            runs.append((start, last, i))
+    return runs
+
+
+def _chain(runs):
+    """
+    Chains runs on neighbouring lines that continue each other.
+
+    Returns:
+        list: Chains (lists of runs), ordered along the line.
+    """
+    runs.sort()
+    open_chains = []
+    chains = []
+    for run in runs:
+        start, end, index = run
+        best = None
+        still_open = []
+        for chain in open_chains:
+            last_start, last_end, last_index, step = chain[-1]
+            if last_end < start - RUN_GAP - 1:
+                chains.append(chain)
+                continue
+            still_open.append(chain)
+            d = index - last_index
+            if abs(d) > 1 or last_end > start + CHAIN_OVERLAP:
+                continue
+            # A straight line steps in one direction only
+            direction = chain[0][3]
+            if d and direction and d != direction:
+                continue
+            if best is None or last_end > best[-1][1]:
+                best = chain
+        open_chains = still_open
+        if best is None:
+            open_chains.append([(start, end, index, 0)])
+        else:
+            d = index - best[-1][2]
+            if d and not best[0][3]:
+                best[0] = best[0][:3] + (d,)
+            best.append((start, end, index, d))
+    return chains + open_chains
+
+
+def _fit(chain):
+    """Least-squares line through a chain -> (along0, across0, along1, across1)."""
+    weight = sx = sy = sxx = sxy = 0.0
+    for start, end, index, _ in chain:
+        n = end - start + 1
+        mid = (start + end) / 2.0
+        weight += n
+        sx += n * mid
+        sy += n * index
+        sxx += n * (mid * mid + (n * n - 1) / 12.0)
+        sxy += n * mid * index
+    a0 = chain[0][0]
+    a1 = max(run[1] for run in chain)
+    denominator = weight * sxx - sx * sx
+    slope = (weight * sxy - sx * sy) / denominator if denominator else 0.0
+    offset = (sy - slope * sx) / weight
+    return a0, offset + slope * a0, a1, offset + slope * a1
+
+
+def _segment(x1, y1, x2, y2):
+    x1, y1, x2, y2 = int(round(x1)), int(round(y1)), int(round(x2)), int(round(y2))
+    theta = int(round(math.degrees(math.atan2(y2 - y1, x2 - x1)) + 90)) % 180
+    rad = math.radians(theta)
+    return {"x1": x1, "y1": y1, "x2": x2, "y2": y2,
+            "length": int(round(math.hypot(x2 - x1, y2 - y1))),
+            "theta": theta,
+            "rho": int(round(x1 * math.cos(rad) + y1 * math.sin(rad)))}
+
+
+def detect_tile(pixels, w, h, length=SEGMENT_MIN_LENGTH, threshold=EDGE_THRESHOLD):
+    """
+    Detects horizontal and vertical edge segments in one grayscale tile.
+
+    Args:
+        pixels: w * h bytes, top-down rows.
+        length: Segments must be longer than this (as detect_segments()).
+        threshold: Edge strength threshold.
+
+    Returns:
+        list: Segment dicts in tile coordinates.
+    """
+    pixels = bytes(pixels)
+    rows = [pixels[y * w:(y + 1) * w] for y in range(h)]
+    columns = [pixels[x::w] for x in range(w)]
+
+    segments = []
+    for chain in _chain(_runs(rows, threshold)):
+        x1, y1, x2, y2 = _fit(chain)
+        segments.append(_segment(x1, y1, x2, y2))
+    for chain in _chain(_runs(columns, threshold)):
+        y1, x1, y2, x2 = _fit(chain)
+        segments.append(_segment(x1, y1, x2, y2))
+    return [s for s in segments if s["length"] > length]
+
+
+def detect_stream(img, coords, offset_y=0, width=None, height=None, sensor_type=None,
+                  tile_w=None, length=SEGMENT_MIN_LENGTH, threshold=EDGE_THRESHOLD):
+    """
+    detect_file() on an open binary file object (file, or io.BytesIO of an
+    uploaded frame).
+    """
+    results = {}
+    data_offset, Width, Height, file_row_size, bottom_up = read_frame_header(
+        img, width, height, sensor_type)
+    if tile_w is None:
+        tile_w = roi_tile_width(coords, Width)
+    rows = max(0, Height - offset_y)
+
+    for tile_x_offset in sorted(int(v) for v in coords.values()):
+        w = min(tile_w, Width - tile_x_offset)
+        if w <= 0 or rows == 0:
+            continue
+        data = read_tile_rows(img, data_offset, file_row_size, Height,
+                              tile_x_offset, w, offset_y, rows, bottom_up)
+        segments = detect_tile(data, w, rows, length=length, threshold=threshold)
+        for s in segments:
+            s["x1"] += tile_x_offset
+            s["x2"] += tile_x_offset
+            s["y1"] += offset_y
+            s["y2"] += offset_y
+            rad = math.radians(s["theta"])
+            s["rho"] = int(round(s["x1"] * math.cos(rad) + s["y1"] * math.sin(rad)))
+        results[tile_x_offset] = segments
+    return results
+
+
+def detect_file(img_path, coords, offset_y=0, width=None, height=None, sensor_type=None,
+                tile_w=None, length=SEGMENT_MIN_LENGTH, threshold=EDGE_THRESHOLD):
+    """
+    process_image() for host tools: detects segments in every ROI tile of a
+    BMP or headerless raw frame file.
+
+    Args:
+        img_path: Frame file name, or an open binary file object.
+        coords: ROI dict (env.txt format).
+        offset_y: First frame row of the tiles.
+        width, height, sensor_type: Frame size of raw files (see read_frame_header()).
+        tile_w: Tile width (default: roi_tile_width()).
+
+    Returns:
+        dict: {tile_x_offset: [segment_dict, ...]} in frame coordinates.
+
+    Raises:
+        OSError: File cannot be read.
+        ValueError: Frame size cannot be determined.
+    """
+    args = dict(offset_y=offset_y, width=width, height=height, sensor_type=sensor_type,
+                tile_w=tile_w, length=length, threshold=threshold)
+    if hasattr(img_path, "read"):
+        return detect_stream(img_path, coords, **args)
+    with open(img_path, "rb") as img:
+        return detect_stream(img, coords, **args)
+
+# ---------USAGE-----------
+# coords = roi_coords(load_env("env.txt"))
+# pre_process = detect_file("IMG_2796.bin", coords)
+# result = pipeline.analyze(pre_process, coords, mode="VIRTUAL_SLOTS")
@@ -0,0 +1,286 @@
+# http_service.py
+# Local HTTP analysis service (POST a frame, get the slot inventory back as JSON)
+
+import io
+import os
+import json
+import time
+import threading
+import argparse
+from urllib.parse import urlparse, parse_qs
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from concurrent.futures import ProcessPoolExecutor
+from utils import load_env, roi_coords
+from host_batch import analyze_frame, MODES
+from host_detect import detect_tile
+
+# -----------------------------------------------------------------------------
+# Endpoints (bound to localhost by default):
+#
+#   POST /analyze   body: one BMP or headerless raw frame
+#   POST /batch     body: several frames back to back, sizes in the
+#                   X-Frame-Sizes header ("307200,307200"), optional names in
+#                   X-Frame-Names - analyzed in parallel, answered together
+#   GET  /health    worker count, pending frames, counters
+#
+# Options as query parameters: mode (VIRTUAL_SLOTS, GAP_ANALYSIS or ALL),
+# width / height / sensor_type (raw frames), offset_y, and the ROI layout as
+# LEFT_ROI=..&CENTER_ROI=..&RIGHT_ROI=.. (or an X-ROI header with the same
+# "KEY=value,KEY=value"); without one the layout of env.txt is used.
+#
+# Frames are analyzed (host_batch.analyze_frame) in a process pool that is
+# started and warmed up before the first request. Every frame result has its
+# timings: receive_ms (request body), queue_ms (waiting for a worker),
+# detect_ms, analyze_ms and total_ms. More than MAX_PENDING frames in flight
+# are refused with 503 and Retry-After, so a burst cannot pile up unbounded.
+#
+# Functions Summary:
+# 1. request_options(query, headers, default_coords)
+# 2. AnalysisHandler (POST /analyze, POST /batch, GET /health)
+# 3. make_server(host, port, env_file, workers)
+# -----------------------------------------------------------------------------
+
+HOST = "127.0.0.1"
+PORT = 8080
+ENV_FILE = "env.txt"
+DEFAULT_MODE = "VIRTUAL_SLOTS"
+MAX_BODY = 64 * 1024 * 1024   # Bytes per request
+MAX_PENDING = 64              # Frames in flight before requests are refused
+REQUEST_TIMEOUT = 60.0        # Seconds per frame
+
+
+def _warm(_):
+    # Forces the worker process up and runs the detector once
+    detect_tile(bytes(range(256)) * 16, 64, 64)
+    return True
+
+
+def _analyze_upload(name, data, coords, modes, options, submitted):
+    started = time.time()
+    result = analyze_frame(io.BytesIO(data), coords, modes, name=name, **options)
+    result["queue_ms"] = round((started - submitted) * 1000, 1)
+    return result
+
+
+def request_options(query, headers, default_coords):
+    """
+    Analysis options of a request.
+
+    Returns:
+        tuple: (coords, modes, analyze_frame() options)
+
+    Raises:
+        ValueError: Malformed option.
+    """
+    params = {k: v[-1] for k, v in query.items()}
+    coords = {k: v for k, v in params.items() if k.endswith("_ROI")}
+    if not coords and headers.get("X-ROI"):
+        for item in headers["X-ROI"].split(","):
+            key, _, value = item.partition("=")
+            coords[key.strip()] = value.strip()
+    coords = coords or dict(default_coords)
+    for value in coords.values():
+        int(value)
+
+    mode = params.get("mode", DEFAULT_MODE).upper()
+    if mode == "ALL":
+        modes = MODES
+    elif mode in MODES:
+        modes = (mode,)
+    else:
+        raise ValueError("Unknown mode {}".format(mode))
+
+    options = {"offset_y": int(params.get("offset_y", 0))}
+    for key in ("width", "height"):
+        if key in params:
+            options[key] = int(params[key])
+    if "sensor_type" in params:
+        options["sensor_type"] = params["sensor_type"].upper()
+    return coords, modes, options
+
+
+class AnalysisHandler(BaseHTTPRequestHandler):
+    """Request handler; the server carries the pool and the counters."""
+
+    protocol_version = "HTTP/1.1"
+
+    def _send_json(self, status, data, headers=None):
+        body = json.dumps(data).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, fmt, *args):
+        if self.server.verbose:
+            print("{} {}".format(self.address_string(), fmt % args))
+
+    def do_GET(self):
+        if urlparse(self.path).path != "/health":
+            self._send_json(404, {"error": "Not found"})
+            return
+        server = self.server
+        with server.lock:
+            stats = dict(server.stats, pending=server.pending)
+        stats["workers"] = server.workers
+        self._send_json(200, stats)
+
+    def do_POST(self):
+        start = time.perf_counter()
+        url = urlparse(self.path)
+        if url.path not in ("/analyze", "/batch"):
+            self._send_json(404, {"error": "Not found"})
+            return
+
+        try:
+            length = int(self.headers.get("Content-Length") or 0)
+        except ValueError:
+            length = 0
+        if length <= 0 or length > MAX_BODY:
+            self.close_connection = True
+            self._send_json(413 if length > MAX_BODY else 400,
+                            {"error": "Body of 1..{} bytes required".format(MAX_BODY)})
+            return
+        body = self.rfile.read(length)
+        received = time.perf_counter()
+
+        try:
+            coords, modes, options = request_options(parse_qs(url.query), self.headers,
+                                                     self.server.coords)
+            frames = self._split(url.path, body)
+        except ValueError as e:
+            self._send_json(400, {"error": str(e)})
+            return
+
+        if not self.server.reserve(len(frames)):
+            self._send_json(503, {"error": "Busy"}, {"Retry-After": "1"})
+            return
+        # A slot is released when its frame is done in the pool, not when the
+        # request gives up waiting, so timed-out work still counts as pending
+        submitted = time.time()
+        futures = []
+        try:
+            for name, data in frames:
+                future = self.server.executor.submit(_analyze_upload, name, data, coords,
+                                                     modes, options, submitted)
+                future.add_done_callback(self.server.release_one)
+                futures.append(future)
+        finally:
+            self.server.release(len(frames) - len(futures))
+        results = []
+        for future in futures:
+            try:
+                results.append(future.result(timeout=REQUEST_TIMEOUT))
+            except Exception as e:
+                results.append({"error": "{}: {}".format(type(e).__name__, e)})
+
+        done = time.perf_counter()
+        receive_ms = round((received - start) * 1000, 1)
+        total_ms = round((done - start) * 1000, 1)
+        for result in results:
+            result["receive_ms"] = receive_ms
+            result["total_ms"] = total_ms
+        self.server.count(results)
+
+        if url.path == "/analyze":
+            result = results[0]
+            self._send_json(422 if "error" in result else 200, result)
+        else:
+            self._send_json(200, {"frames": results, "total_ms": total_ms,
+                                  "failed": sum(1 for r in results if "error" in r)})
+
+    def _split(self, path, body):
+        if path == "/analyze":
+            return [(self.headers.get("X-Frame-Name", "frame"), body)]
+        sizes = [int(s) for s in self.headers.get("X-Frame-Sizes", "").split(",") if s.strip()]
+        if not sizes or sum(sizes) != len(body):
+            raise ValueError("X-Frame-Sizes must add up to the body length")
+        names = [n.strip() for n in self.headers.get("X-Frame-Names", "").split(",")]
+        frames = []
+        pos = 0
+        for i, size in enumerate(sizes):
+            name = names[i] if i < len(names) and names[i] else "frame_{}".format(i)
+            frames.append((name, body[pos:pos + size]))
+            pos += size
+        return frames
+
+
+class AnalysisServer(ThreadingHTTPServer):
+    """ThreadingHTTPServer with the worker pool and the request counters."""
+
+    daemon_threads = True
+
+    def __init__(self, address, coords, workers=None, verbose=False):
+        super().__init__(address, AnalysisHandler)
+        self.coords = coords
+        self.verbose = verbose
+        self.workers = workers or os.cpu_count() or 1
+        self.executor = ProcessPoolExecutor(self.workers)
+        self.lock = threading.Lock()
+        self.pending = 0
+        self.stats = {"frames": 0, "failed": 0, "refused": 0, "total_ms_max": 0.0}
+        # Pre-warm: start every worker before the first request
+        list(self.executor.map(_warm, range(self.workers)))
+
+    def reserve(self, n):
+        with self.lock:
+            if self.pending + n > MAX_PENDING:
+                self.stats["refused"] += n
+                return False
+            self.pending += n
+            return True
+
+    def release(self, n):
+        with self.lock:
+            self.pending -= n
+
+    def release_one(self, _future):
+        self.release(1)
+
+    def count(self, results):
+        with self.lock:
+            for result in results:
+                self.stats["frames"] += 1
+                self.stats["failed"] += "error" in result
+                self.stats["total_ms_max"] = max(self.stats["total_ms_max"], result["total_ms"])
+
+    def server_close(self):
+        super().server_close()
+        self.executor.shutdown(cancel_futures=True)
+
+
+def make_server(host=HOST, port=PORT, env_file=ENV_FILE, workers=None, verbose=False):
+    """
+    Creates the service with a warmed-up worker pool (call serve_forever()).
+    """
+    coords = roi_coords(load_env(env_file))
+    server = AnalysisServer((host, port), coords, workers=workers, verbose=verbose)
+    print("Analysis service on http://{}:{} ({} workers, ROIs {})".format(
+        host, server.server_address[1], server.workers, coords))
+    return server
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local HTTP frame analysis service.")
+    parser.add_argument("--host", default=HOST)
+    parser.add_argument("--port", type=int, default=PORT)
+    parser.add_argument("--env", default=ENV_FILE, help="Default ROI configuration")
+    parser.add_argument("--workers", type=int, help="Processes (default: CPU count)")
+    parser.add_argument("--verbose", action="store_true", help="Log every request")
+    args = parser.parse_args()
+
+    server = make_server(args.host, args.port, args.env, args.workers, args.verbose)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+# ---------USAGE-----------
+# python3 http_service.py --port 8080 --workers 4
+# curl --data-binary @IMG_2796.bin "http://127.0.0.1:8080/analyze?LEFT_ROI=60&CENTER_ROI=260&RIGHT_ROI=440"
+# curl --data-binary @frames.bin -H "X-Frame-Sizes: 307200,307200" "http://127.0.0.1:8080/batch?mode=ALL"
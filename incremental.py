@@ -0,0 +1,131 @@
+# incremental.py
+# Incremental per-ROI reprocessing on partial frame changes
+
+from bmp_line_detection import process_frame, roi_tile_width
+from frame_gate import roi_signature, changed_rois, GATE_TOLERANCE
+
+# -----------------------------------------------------------------------------
+# Keeps the last detection result of every ROI tile together with the tile's
+# signature (see frame_gate). On a new frame only the tiles whose signature
+# changed are re-detected; the others keep their cached segments. The merged
+# {offset_x: segments} dict is then handed to the downstream stages
+# (filter_line_segments / normalize_gaps / ...), which are re-run only if at
+# least one tile changed. The downstream stages are not split per ROI because
+# the vertical cutoff in filter_line_segments is shared by all tiles; they are
+# cheap next to detection.
+#
+# Functions Summary:
+# 1. incremental_detect(img, coords, ...)
+# 2. incremental_analyze(img, coords, downstream, ...)
+# 3. incremental_stats() / incremental_reset()
+# -----------------------------------------------------------------------------
+
+_cache = {
+    "signature": {},   # {offset_x: [block_mean, ...]} at the last detection
+    "segments": {},    # {offset_x: [segment_dict, ...]}
+    "result": None,    # Last downstream result
+}
+_stats = {"frames": 0, "tiles_detected": 0, "tiles_total": 0}
+
+
+def incremental_detect(img, coords, offset_y=0, tile_w=None, tile_h=None,
+                       tolerance=GATE_TOLERANCE):
+    """
+    Re-detects only the ROI tiles whose content changed.
+
+    Args:
+        img: GRAYSCALE image holding the full frame.
+        coords: ROI dict (env.txt format).
+        offset_y, tile_w, tile_h: Tile geometry, as in process_frame(). tile_w
+                                  defaults to roi_tile_width() of the full layout.
+        tolerance: Max block mean difference for a tile to count as unchanged.
+
+    Returns:
+        tuple: (segments, changed) where segments is the merged
+               {offset_x: [segment_dict, ...]} (same as process_image()) and
+               changed is the list of re-detected offsets.
+    """
+    if tile_w is None:
+        tile_w = roi_tile_width(coords, img.width())
+    signature = roi_signature(img, coords, tile_w=tile_w, offset_y=offset_y, tile_h=tile_h)
+
+    cached_sig = _cache["signature"]
+    cached_seg = _cache["segments"]
+
+    # ROIs no longer configured
+    for offset_x in list(cached_seg):
+        if offset_x not in signature:
+            cached_seg.pop(offset_x)
+            cached_sig.pop(offset_x, None)
+
+    changed = []
+    for offset_x in signature:
+        if offset_x not in cached_seg or changed_rois(
+                {offset_x: cached_sig.get(offset_x)},
+                {offset_x: signature[offset_x]}, tolerance):
+            changed.append(offset_x)
+
+    if changed:
+        print("Incremental: re-detecting tiles {}".format(changed))
+        fresh = process_frame(img, {str(x): str(x) for x in changed},
+                              offset_y=offset_y, tile_w=tile_w, tile_h=tile_h)
+        for offset_x in changed:
+            cached_seg[offset_x] = fresh.get(offset_x, [])
+            # Reference moves only for re-detected tiles, so slow drift in an
+            # unchanged tile still triggers once it exceeds the tolerance
+            cached_sig[offset_x] = signature[offset_x]
+
+    _stats["frames"] += 1
+    _stats["tiles_detected"] += len(changed)
+    _stats["tiles_total"] += len(signature)
+
+    return dict(cached_seg), changed
+
+
+def incremental_analyze(img, coords, downstream, **detect_args):
+    """
+    Incremental detection followed by the downstream stages.
+
+    Args:
+        img: GRAYSCALE image holding the full frame.
+        coords: ROI dict (env.txt format).
+        downstream: Callable downstream(segments) -> result, e.g. filtering
+                    and gap / virtual slot analysis.
+        detect_args: Extra arguments for incremental_detect().
+
+    Returns:
+        The downstream result (cached one if no tile changed).
+    """
+    segments, changed = incremental_detect(img, coords, **detect_args)
+    if changed or _cache["result"] is None:
+        _cache["result"] = downstream(segments)
+    return _cache["result"]
+
+
+def incremental_stats():
+    """Returns how many tiles were re-detected out of all tiles seen."""
+    total = _stats["tiles_total"]
+    return {
+        "frames": _stats["frames"],
+        "tiles_detected": _stats["tiles_detected"],
+        "tiles_total": total,
+        "detect_fraction": round(_stats["tiles_detected"] / total, 3) if total else 0.0,
+    }
+
+
+def incremental_reset():
+    """Drops all cached tiles/results and clears the counters."""
+    _cache["signature"] = {}
+    _cache["segments"] = {}
+    _cache["result"] = None
+    for key in _stats:
+        _stats[key] = 0
+
+# ---------USAGE-----------
+# def downstream(segments):
+#     filtered = filter_line_segments(segments, offset_y=0)
+#     boundaries = extract_boundary_segments(filtered)
+#     box_top, box_height = get_box_reference_metrics(boundaries)
+#     return analyze_virtual_slots(filtered, box_top, box_height, center_offset=800)
+# run_continuous(lambda img: incremental_analyze(img, coords, downstream), coords=coords)
+# print(incremental_stats())
@@ -0,0 +1,225 @@
+# lens_lut.py
+# Precomputed lens-correction tables for segment endpoints in the ROI bands
+
+import math
+import struct
+from bmp_line_detection import roi_tile_width
+
+# -----------------------------------------------------------------------------
+# img.lens_corr(strength) (see calibration.py) warps the whole frame with the
+# radial model
+#     d_raw = d_corr * atan(k * r) / (k * r) / zoom,   k = strength / half_diag
+# where d is the offset from the frame center and r = |d_corr|. The analysis
+# only looks at a few ROI column bands and, in the end, at segment endpoints,
+# so instead of warping every frame we sample the inverse model once on a
+# coarse grid over each band ("dst": raw -> corrected position, closed form
+# r_corr = tan(k * zoom * r_raw) / k) and correct only the detected endpoints
+# (correct_point). Grid nodes sit at exact multiples of the grid step; the
+# last row / column of nodes lies past the band edge (the model is evaluated
+# there too), so every cell is a full grid step and positions between nodes
+# are interpolated bilinearly.
+#
+# The tables are keyed by strength, zoom, resolution, grid step and ROI
+# layout and written to LUT_FILE, so a station loads them at boot
+# (station_lut) and only rebuilds them when one of those changes.
+#
+# Functions Summary:
+# 1. build_lut(width, height, coords, strength, ...)
+# 2. save_lut(lut, filename) / load_lut(filename)
+# 3. station_lut(width, height, coords, strength, ...)
+# 4. correct_point(lut, x, y)
+# -----------------------------------------------------------------------------
+
+LUT_FILE = "lens_lut.bin"
+LUT_MAGIC = b"LLUT"
+LUT_VERSION = 2
+LENS_STRENGTH = 1.8       # Same default as calibration.calibrate()
+LENS_ZOOM = 1.0
+GRID_STEP = 16            # Grid node spacing in pixels
+
+# magic, version, width, height, grid, strength, zoom, roi count
+_HEADER = "<4sHHHHffH"
+# offset_x, band width, grid columns, grid rows
+_ROI_HEADER = "<HHHH"
+
+
+def _model(width, height, strength, zoom):
+    half_w = width / 2.0
+    half_h = height / 2.0
+    k = strength / math.sqrt(half_w * half_w + half_h * half_h)
+    return half_w, half_h, k
+
+
+def distort(x, y, width, height, strength=LENS_STRENGTH, zoom=LENS_ZOOM):
+    """Corrected -> raw position (the lens_corr model)."""
+    cx, cy, k = _model(width, height, strength, zoom)
+    dx = x - cx
+    dy = y - cy
+    r = math.sqrt(dx * dx + dy * dy) * k
+    scale = 1.0 if r < 0.00001 else math.atan(r) / r
+    return cx + scale * dx / zoom, cy + scale * dy / zoom
+
+
+def undistort(x, y, width, height, strength=LENS_STRENGTH, zoom=LENS_ZOOM):
+    """Raw -> corrected position (inverse of distort())."""
+    cx, cy, k = _model(width, height, strength, zoom)
+    dx = x - cx
+    dy = y - cy
+    a = math.sqrt(dx * dx + dy * dy) * k * zoom
+    # Beyond pi/2 the model has no inverse (pixel was cropped by lens_corr)
+    a = min(a, math.pi / 2 - 0.01)
+    scale = zoom if a < 0.00001 else math.tan(a) / a * zoom
+    return cx + scale * dx, cy + scale * dy
+
+
+def lut_params(width, height, coords, strength=LENS_STRENGTH, zoom=LENS_ZOOM,
+               grid=GRID_STEP, tile_w=None):
+    """
+    Everything the tables depend on (compared on load). The bands are the
+    detection tiles (tile_w defaults to roi_tile_width()).
+    """
+    if tile_w is None:
+        tile_w = roi_tile_width(coords, width)
+    bands = []
+    for value in sorted(int(v) for v in coords.values()):
+        bands.append((value, max(0, min(tile_w, width - value))))
+    return {"width": width, "height": height, "grid": grid,
+            "strength": strength, "zoom": zoom, "bands": bands}
+
+
+def _grid(x0, w, height, grid, mapping):
+    # Nodes at exact multiples of grid, the last ones past the band edge
+    cols = (w - 1) // grid + 2
+    rows = (height - 1) // grid + 2
+    table = []
+    for j in range(rows):
+        y = j * grid
+        for i in range(cols):
+            table.extend(mapping(x0 + i * grid, y))
+    return cols, rows, table
+
+
+def build_lut(width, height, coords, strength=LENS_STRENGTH, zoom=LENS_ZOOM,
+              grid=GRID_STEP, tile_w=None):
+    """
+    Samples the inverse lens model over every ROI band.
+
+    Returns:
+        dict: {params, bands: {offset_x: {w, cols, rows, dst}}}
+    """
+    params = lut_params(width, height, coords, strength, zoom, grid, tile_w)
+    lut = {"params": params, "bands": {}}
+    for x0, w in params["bands"]:
+        if w <= 0:
+            continue
+        cols, rows, dst = _grid(x0, w, height, grid,
+                                lambda x, y: undistort(x, y, width, height, strength, zoom))
+        lut["bands"][x0] = {"w": w, "cols": cols, "rows": rows, "dst": dst}
+    print("Lens LUT built for {}x{}, strength {}, {} bands".format(
+        width, height, strength, len(lut["bands"])))
+    return lut
+
+
+def save_lut(lut, filename=LUT_FILE):
+    """Writes the tables to a binary file (float32 grids)."""
+    p = lut["params"]
+    with open(filename, "wb") as f:
+        f.write(struct.pack(_HEADER, LUT_MAGIC, LUT_VERSION, p["width"], p["height"],
+                            p["grid"], p["strength"], p["zoom"], len(lut["bands"])))
+        for x0 in sorted(lut["bands"]):
+            band = lut["bands"][x0]
+            n = len(band["dst"])
+            f.write(struct.pack(_ROI_HEADER, x0, band["w"], band["cols"], band["rows"]))
+            f.write(struct.pack("<{}f".format(n), *band["dst"]))
+    print("Lens LUT saved to {}".format(filename))
+
+
+def load_lut(filename=LUT_FILE):
+    """Reads tables written by save_lut(), or None if missing/invalid."""
+    try:
+        with open(filename, "rb") as f:
+            head = f.read(struct.calcsize(_HEADER))
+            magic, version, width, height, grid, strength, zoom, count = struct.unpack(_HEADER, head)
+            if magic != LUT_MAGIC or version != LUT_VERSION:
+                return None
+            lut = {"params": {"width": width, "height": height, "grid": grid,
+                              "strength": strength, "zoom": zoom, "bands": []},
+                   "bands": {}}
+            for _ in range(count):
+                x0, w, cols, rows = struct.unpack(_ROI_HEADER, f.read(struct.calcsize(_ROI_HEADER)))
+                n = cols * rows * 2
+                fmt = "<{}f".format(n)
+                dst = list(struct.unpack(fmt, f.read(struct.calcsize(fmt))))
+                lut["bands"][x0] = {"w": w, "cols": cols, "rows": rows, "dst": dst}
+                lut["params"]["bands"].append((x0, w))
+            return lut
+    except (OSError, ValueError, struct.error):
+        return None
+
+
+def _matches(lut, params):
+    p = lut["params"]
+    return (p["width"] == params["width"] and p["height"] == params["height"] and
+            p["grid"] == params["grid"] and
+            abs(p["strength"] - params["strength"]) < 0.001 and
+            abs(p["zoom"] - params["zoom"]) < 0.001 and
+            [tuple(b) for b in p["bands"]] ==
+            [tuple(b) for b in params["bands"] if b[1] > 0])
+
+
+def station_lut(width, height, coords, strength=LENS_STRENGTH, zoom=LENS_ZOOM,
+                grid=GRID_STEP, tile_w=None, filename=LUT_FILE):
+    """
+    Loads the station's tables, rebuilding and saving them if the stored ones
+    were made for other parameters.
+    """
+    params = lut_params(width, height, coords, strength, zoom, grid, tile_w)
+    lut = load_lut(filename)
+    if lut is not None and _matches(lut, params):
+        return lut
+    lut = build_lut(width, height, coords, strength, zoom, grid, tile_w)
+    save_lut(lut, filename)
+    return lut
+
+
+def _find_band(lut, x):
+    for x0, band in lut["bands"].items():
+        if x0 <= x < x0 + band["w"]:
+            return x0, band
+    return None, None
+
+
+def _interpolate(table, band, grid, u, v):
+    cols = band["cols"]
+    i = min(max(int(u // grid), 0), cols - 2)
+    j = min(max(int(v // grid), 0), band["rows"] - 2)
+    fx = min(max(u / grid - i, 0.0), 1.0)
+    fy = min(max(v / grid - j, 0.0), 1.0)
+    a = (j * cols + i) * 2
+    b = a + 2
+    c = a + cols * 2
+    d = c + 2
+    out = []
+    for axis in (0, 1):
+        top = table[a + axis] + (table[b + axis] - table[a + axis]) * fx
+        bottom = table[c + axis] + (table[d + axis] - table[c + axis]) * fx
+        out.append(top + (bottom - top) * fy)
+    return out[0], out[1]
+
+
+def correct_point(lut, x, y):
+    """
+    Raw (detected) frame position -> lens-corrected position.
+
+    Points outside the tabulated bands are computed from the model directly.
+    """
+    x0, band = _find_band(lut, x)
+    if band is None:
+        p = lut["params"]
+        return undistort(x, y, p["width"], p["height"], p["strength"], p["zoom"])
+    return _interpolate(band["dst"], band, lut["params"]["grid"], x - x0, y)
+
+
+# ---------USAGE-----------
+# lut = station_lut(1920, 1080, coords, strength=1.8)     # Loads at boot, builds once
+# x, y = correct_point(lut, seg["x1"], seg["y1"])
@@ -0,0 +1,250 @@
+# load_test.py
+# Load generator for the camera command protocol (bursts, rates, command mixes)
+
+import json
+import time
+import random
+import asyncio
+import argparse
+from command_server import parse_status
+from result_protocol import FrameDecoder
+from host_client import open_connection
+
+# -----------------------------------------------------------------------------
+# Drives one command server (camera over USB VCP, camera_sim over TCP/pty)
+# open loop: commands are sent on schedule, whether or not earlier ones were
+# answered, the way a PLC fires triggers. Every command carries a #tag, so
+# each reply (OK / MERGED / BUSY / ERROR ...) is matched to its command and
+# timed. A STATUS poll samples the server's queue depth meanwhile.
+#
+# Reported:
+#   - command-to-reply latency percentiles per command, separately for
+#     executed commands (OK) and for MERGED / BUSY acknowledgements, which
+#     come back at once and would otherwise hide the real service time
+#   - merged (MERGED), dropped (BUSY or no reply before the drain timeout)
+#     and failed (ERROR / UNKNOWN) commands
+#   - queue depth samples and the server counters from a final STATUS
+#
+# Functions Summary:
+# 1. parse_mix("SNAPSHOT:0.8,PING:0.2")
+# 2. schedule(rate, duration, burst, ...)
+# 3. run_load(url, mix, rate, duration, ...)
+# 4. percentile(values, p)
+# -----------------------------------------------------------------------------
+
+DEFAULT_MIX = "SNAPSHOT:1"
+STATUS_EVERY = 0.1        # Seconds between queue depth samples
+DRAIN_TIMEOUT = 5.0       # Seconds to wait for outstanding replies at the end
+
+
+def parse_mix(text):
+    """'SNAPSHOT:0.8,ANALYZE VIRTUAL_SLOTS:0.2' -> [(command, weight), ...]"""
+    mix = []
+    for item in text.split(","):
+        command, _, weight = item.rpartition(":")
+        if not command:
+            command, weight = weight, "1"
+        mix.append((command.strip(), float(weight)))
+    return mix
+
+
+def schedule(rate, duration, burst=1, poisson=False, seed=None):
+    """
+    Send times (seconds from start) for the commands.
+
+    Args:
+        rate: Bursts per second.
+        duration: Seconds of load.
+        burst: Commands sent back to back per burst.
+        poisson: Exponential inter-arrival times instead of a fixed period.
+    """
+    rng = random.Random(seed)
+    times = []
+    t = 0.0
+    while t < duration:
+        times.extend([t] * burst)
+        t += rng.expovariate(rate) if poisson else 1.0 / rate
+    return times
+
+
+def percentile(values, p):
+    """p-th percentile (nearest rank) of a list, None if empty."""
+    if not values:
+        return None
+    values = sorted(values)
+    index = min(len(values) - 1, max(0, int(round(p / 100.0 * len(values) + 0.5)) - 1))
+    return values[index]
+
+
+async def run_load(url, mix=DEFAULT_MIX, rate=10.0, duration=5.0, burst=1, poisson=False,
+                   seed=None, status_every=STATUS_EVERY, drain_timeout=DRAIN_TIMEOUT):
+    """
+    Runs one load test.
+
+    Returns:
+        dict: Report (see module header).
+    """
+    rng = random.Random(seed)
+    mix = parse_mix(mix) if isinstance(mix, str) else mix
+    commands = [c for c, w in mix]
+    weights = [w for c, w in mix]
+
+    reader, writer = await open_connection(url)
+    decoder = FrameDecoder()
+    sent = {}         # tag -> (command, send time)
+    replies = {}      # tag -> (reply kind, latency ms)
+    depth = []
+    status = {}
+    done = asyncio.Event()
+    drained = asyncio.Event()
+
+    async def read_loop():
+        while True:
+            data = await reader.read(4096)
+            if not data:
+                break
+            now = time.monotonic()
+            for event in decoder.feed(data):
+                if event[0] != "line" or not event[1].startswith("#"):
+                    continue
+                tag, _, text = event[1][1:].partition(" ")
+                if tag.startswith("s"):
+                    status[tag] = parse_status(text)
+                    depth.append(status[tag].get("queue", 0))
+                elif tag in sent and tag not in replies:
+                    # "ERROR: <text>" -> ERROR
+                    kind = text.split(" ")[0].rstrip(":")
+                    replies[tag] = (kind, (now - sent[tag][1]) * 1000)
+                if done.is_set() and len(replies) == len(sent):
+                    drained.set()
+
+    async def status_loop():
+        n = 0
+        while not done.is_set():
+            n += 1
+            writer.write("#s{} STATUS\n".format(n).encode())
+            await asyncio.sleep(status_every)
+
+    reading = asyncio.create_task(read_loop())
+    polling = asyncio.create_task(status_loop())
+
+    start = time.monotonic()
+    for i, at in enumerate(schedule(rate, duration, burst, poisson, seed)):
+        delay = start + at - time.monotonic()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        command = rng.choices(commands, weights)[0]
+        tag = str(i)
+        sent[tag] = (command, time.monotonic())
+        writer.write("#{} {}\n".format(tag, command).encode())
+    await writer.drain()
+    load_s = time.monotonic() - start
+
+    done.set()
+    if len(replies) == len(sent):
+        drained.set()
+    try:
+        await asyncio.wait_for(drained.wait(), drain_timeout)
+    except asyncio.TimeoutError:
+        pass
+    polling.cancel()
+    writer.write(b"#sfinal STATUS\n")
+    await writer.drain()
+    await asyncio.sleep(status_every)
+    reading.cancel()
+    writer.close()
+
+    return _report(sent, replies, depth, status.get("sfinal", {}), load_s)
+
+
+def _report(sent, replies, depth, final_status, load_s):
+    per_command = {}
+    for tag, (command, t) in sent.items():
+        entry = per_command.setdefault(command, {"sent": 0, "ok": 0, "merged": 0, "busy": 0,
+                                                 "failed": 0, "no_reply": 0, "latency": [],
+                                                 "ack_latency": []})
+        entry["sent"] += 1
+        if tag not in replies:
+            entry["no_reply"] += 1
+            continue
+        kind, latency = replies[tag]
+        if kind == "MERGED":
+            entry["merged"] += 1
+            entry["ack_latency"].append(latency)
+        elif kind == "BUSY":
+            entry["busy"] += 1
+            entry["ack_latency"].append(latency)
+        elif kind in ("ERROR", "UNKNOWN", "STOPPED"):
+            entry["failed"] += 1
+        else:
+            entry["ok"] += 1
+            entry["latency"].append(latency)
+
+    for entry in per_command.values():
+        entry["latency_ms"] = _latency_summary(entry.pop("latency"))
+        entry["ack_latency_ms"] = _latency_summary(entry.pop("ack_latency"))
+
+    total = len(sent)
+    merged = sum(e["merged"] for e in per_command.values())
+    dropped = sum(e["busy"] + e["no_reply"] for e in per_command.values())
+    return {
+        "sent": total,
+        "offered_rate": round(total / load_s, 1) if load_s else 0.0,
+        "merged": merged,
+        "dropped": dropped,
+        "failed": sum(e["failed"] for e in per_command.values()),
+        "queue_depth": {"max": max(depth) if depth else 0,
+                        "mean": round(sum(depth) / len(depth), 2) if depth else 0.0,
+                        "samples": len(depth)},
+        "server": final_status,
+        "commands": per_command,
+    }
+
+
+def _latency_summary(latency):
+    summary = {p: _round(percentile(latency, p)) for p in (50, 90, 99)}
+    summary["max"] = _round(max(latency) if latency else None)
+    return summary
+
+
+def _round(value):
+    return None if value is None else round(value, 1)
+
+
+async def _main(args):
+    server = None
+    url = args.url
+    if url is None:
+        from camera_sim import start_sim
+        server, url = await start_sim(args.recording, latency_ms=args.latency_ms)
+    report = await run_load(url, mix=args.mix, rate=args.rate, duration=args.duration,
+                            burst=args.burst, poisson=args.poisson, seed=args.seed)
+    if server is not None:
+        server.close()
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text)
+    print(text)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load test a camera command server.")
+    parser.add_argument("url", nargs="?", help="tcp://host:port or serial device (default: simulator)")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help="e.g. 'SNAPSHOT:0.8,PING:0.2'")
+    parser.add_argument("--rate", type=float, default=10.0, help="Bursts per second")
+    parser.add_argument("--burst", type=int, default=1, help="Commands per burst")
+    parser.add_argument("--duration", type=float, default=5.0)
+    parser.add_argument("--poisson", action="store_true")
+    parser.add_argument("--seed", type=int)
+    parser.add_argument("--recording",
+                        help="Detection output (pre_process.json) the simulator replays; "
+                             "default: synthetic frames")
+    parser.add_argument("--latency-ms", type=int, default=150)
+    parser.add_argument("--output")
+    asyncio.run(_main(parser.parse_args()))
+
+# ---------USAGE-----------
+# python3 load_test.py --rate 20 --burst 3 --mix "SNAPSHOT:0.9,PING:0.1"
+# python3 load_test.py --mix "ANALYZE:1" --recording pre_process.json  # file must exist
+# python3 load_test.py /dev/ttyACM0 --rate 5 --duration 30 --output load.json
@@ -1,12 +1,17 @@
 from utils import log
 import time
 from gap import normalize_gaps, check_lines_in_file
-from utils import log_data_to_file, load_env
-from take_img import take_image
-from bmp_line_detection import process_image
-from estimate import extract_boundary_segments, get_box_reference_metrics
+from utils import log_data_to_file, load_env, roi_coords
+from take_img import (take_image, take_roi_tiles, take_frame, save_frame,
+                      EXPECTED_WIDTH, EXPECTED_HEIGHT)
+from bmp_line_detection import process_image, process_tiles, process_frame
+from detect_cache import cached_process_image
+from estimate import extract_boundary_segments, get_box_reference_metrics, virtual_slot_windows
 from filter import filter_line_segments
-import sensor
+import sensor_state
+from roi_discovery import station_layout
+from geometry_correction import correct_segments, load_model
+from lens_lut import station_lut
 
 
 
@@ -22,6 +27,14 @@ BBOX_WIDTH = 50
 LEFT_SEGMENT_INDEX = 0
 RIGHT_SEGMENT_INDEX = 2
 USE_CALIBRATED_CAPTURE = True
+METER_ROI_ONLY = True # Meter exposure on the ROI bands instead of the full frame
+CAPTURE_MODE = "DIRECT" # Options: "DIRECT" (frame buffer, no SD), "SD_FILE", "ROI_WINDOW" (windowed ROI readout, no SD)
+PERSIST_FRAME = False # DIRECT mode: save the frame to SD after the results are produced
+USE_DETECT_CACHE = True # Dummy/archived frames: reuse cached detection across parameter changes
+USE_PYRAMID = False # Coarse-to-fine detection (coarse pass, full-res refinement of edge strips)
+USE_GEOMETRY_CORRECTION = False # Correct segment endpoints with geometry_model.json (tilt/perspective)
+USE_LENS_LUT = False # Lens-correct segment endpoints with the station's lens_lut.bin tables
+DISCOVER_ROIS = False # DIRECT mode: find the ROI columns once per station and cache them in env.txt
 DUMMY_IMAGE_PATH = "IMG_2796.bin"
 # Used for Virutal slot detection
 VIRTUAL_HEIGHT = 920.0
@@ -33,7 +46,8 @@ VIRTUAL_GAP = 30.0
 # Boot sequence
 # ============================================================================
 
-sensor.reset()
+sensor_state.reset()
+geometry_model = load_model() if USE_GEOMETRY_CORRECTION else None
 
 # ============================================================================
 # Helper Functions
@@ -42,9 +56,9 @@ sensor.reset()
 def load_config():
     """Load configuration from env.txt file. Returns dict for process_image()."""
     try:
-        config = load_env("e.txt")
-        # Return dict format expected by process_image
-        return config
+        config = load_env("env.txt")
+        # Return dict format expected by process_image (ROI offsets only)
+        return roi_coords(config)
     except Exception as e:
         print("Warning: Could not load config from env.txt: {}".format(e))
         print("Using default ROI offsets")
@@ -59,29 +73,15 @@ def analyze_virtual_slots(filtered_groups, box_top, box_height, roi_config):
         box_top: The average Y coordinate of the box's top boundary.
         box_height: The average vertical height of the box (Bottom Y - Top Y).
     """
-    # Calculate Scaling Factor (Current Height / Reference Height)
-    S = box_height / VIRTUAL_HEIGHT
-
-
-    # Scaled reference values
-    scaled_offset = VIRTUAL_START_POS * S
-    scaled_pitch = VIRTUAL_GAP * S
-    window_half_height = scaled_pitch / 2.0  # Window size to prevent overlap
-
     # Get center detections from the 800 offset
     roi_center = int(roi_config.get("CENTER_ROI", 800))
     center_disks = filtered_groups.get(roi_center, [])
 
     inventory = {}
 
-    for i in range(1, 25):  # Slots 1 through 24
-        # Calculate the expected center Y for this slot
-        expected_y = box_top + scaled_offset + ((i - 1) * scaled_pitch)
-
-        # Define the virtual bounding box (Window)
-        win_top = expected_y - window_half_height
-        win_bottom = expected_y + window_half_height
-
+    windows = virtual_slot_windows(box_top, box_height, reference_height=VIRTUAL_HEIGHT,
+                                   start_pos=VIRTUAL_START_POS, pitch=VIRTUAL_GAP)
+    for i, expected_y, win_top, win_bottom in windows:
         # Check if any detected disk falls within this window
         found_disk = None
         for disk in center_disks:
@@ -101,13 +101,41 @@ def analyze_virtual_slots(filtered_groups, box_top, box_height, roi_config):
 roi_config = load_config()
 print("Loaded ROI config: {}".format(roi_config))
 
-if USE_CALIBRATED_CAPTURE:
-    print("Capturing calibrated image...")
-    image_path, img_width, img_height = take_image()
-else:
+if not USE_CALIBRATED_CAPTURE:
     print("Using dummy image: {}".format(DUMMY_IMAGE_PATH))
     image_path = DUMMY_IMAGE_PATH
     img_width, img_height = 1920, 1080  # Assume FHD for dummy
+elif CAPTURE_MODE == "ROI_WINDOW":
+    print("Capturing ROI windows...")
+    image_path = None
+    img_width, img_height = EXPECTED_WIDTH, EXPECTED_HEIGHT
+elif CAPTURE_MODE == "DIRECT":
+    print("Capturing calibrated frame (in memory)...")
+    image_path = None
+    frame, frame_meta = take_frame(coords=roi_config if METER_ROI_ONLY else None)
+    img_width, img_height = frame_meta["width"], frame_meta["height"]
+    if DISCOVER_ROIS:
+        roi_config = station_layout(frame, n=3)
+else:
+    print("Capturing calibrated image...")
+    image_path, img_width, img_height = take_image(coords=roi_config if METER_ROI_ONLY else None)
+
+# Lens tables for this resolution and ROI layout (loaded, rebuilt only if stale)
+lens_lut = station_lut(img_width, img_height, roi_config) if USE_LENS_LUT else None
+
+
+def run_detection():
+    """Runs segment detection on the captured frame (memory, ROI windows or file)."""
+    if image_path is None and CAPTURE_MODE == "DIRECT":
+        return process_frame(frame, roi_config, offset_y=OFFSET_Y, logs=False, pyramid=USE_PYRAMID)
+    if image_path is None:
+        return process_tiles(take_roi_tiles(roi_config), offset_y=OFFSET_Y, logs=False,
+                             pyramid=USE_PYRAMID)
+    if not USE_CALIBRATED_CAPTURE and USE_DETECT_CACHE:
+        return cached_process_image(image_path, coords=roi_config, offset_y=OFFSET_Y,
+                                    sensor_type="FHD", logs=False, pyramid=USE_PYRAMID)
+    return process_image(image_path, coords=roi_config, offset_y=OFFSET_Y,
+                         sensor_type="FHD", logs=False, pyramid=USE_PYRAMID)
 
 # ============================================================================
 # Main Pipeline
@@ -116,8 +144,7 @@ else:
 #--------------------- Virtual Slot Estimation Mode--------------
 if MODE == "VIRTUAL_SLOTS":
     print("--- Running Virtual Slot Estimation ---")
-    pre_process = process_image(image_path, coords=roi_config, offset_y=OFFSET_Y,
-                                sensor_type="FHD", logs=False)
+    pre_process = correct_segments(run_detection(), model=geometry_model, lut=lens_lut)
 
     log_data_to_file(pre_process, filename='pre_process.json')
 
@@ -178,8 +205,7 @@ if MODE == "VIRTUAL_SLOTS":
 #------------------------ Gap Analysis Mode -------------------------
 elif MODE == "GAP_ANALYSIS":
     print("--- Running Gap Analysis ---")
-    pre_process = process_image(image_path, coords=roi_config, offset_y=OFFSET_Y,
-                                sensor_type="FHD", logs=False)
+    pre_process = correct_segments(run_detection(), model=geometry_model, lut=lens_lut)
     log_data_to_file(pre_process, filename='pre_process.json')
 
     # Filter lines for horizontal consistency
@@ -216,3 +242,6 @@ elif MODE == "GAP_ANALYSIS":
     print(f"Right Gap Results: {right_results}")
     print(f"Right Array: {right_arr}")
 
+# Persist the frame only after the results are out (off the critical path)
+if USE_CALIBRATED_CAPTURE and CAPTURE_MODE == "DIRECT" and PERSIST_FRAME:
+    save_frame(frame)
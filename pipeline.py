@@ -0,0 +1,117 @@
+# pipeline.py
+# Analysis stages of main.py as a library (command server, host tools)
+
+from gap import normalize_gaps, check_lines
+from estimate import (extract_boundary_segments, get_box_reference_metrics,
+                      analyze_virtual_slots)
+from filter import filter_line_segments
+
+# -----------------------------------------------------------------------------
+# main.py runs the stages as a script and hands results over through JSON
+# files. analyze() runs the same chain on a detection result in memory:
+#   GAP_ANALYSIS:  filter_line_segments -> normalize_gaps (left/right)
+#                  -> check_lines (left/right hit arrays)
+#   VIRTUAL_SLOTS: extract_boundary_segments -> get_box_reference_metrics
+#                  -> analyze_virtual_slots (inventory)
+# Parameters default to the main.py configuration (PIPELINE_DEFAULTS).
+#
+# Functions Summary:
+# 1. analyze(pre_process, coords, mode, **params)
+# 2. gap_analysis(pre_process, coords, **params)
+# 3. virtual_slots(pre_process, coords, **params)
+# -----------------------------------------------------------------------------
+
+PIPELINE_DEFAULTS = {
+    "max_gap": 40,
+    "min_gap": 20,
+    "fixed_height": 10,
+    "bbox_width": 50,
+    "left_segment_index": 0,
+    "right_segment_index": 2,
+}
+
+
+def _rois(coords):
+    return (int(coords.get("LEFT_ROI", 200)),
+            int(coords.get("CENTER_ROI", 800)),
+            int(coords.get("RIGHT_ROI", 1500)))
+
+
+def _hits(result):
+    # check_lines() returns 0 instead of a tuple when an offset has no lines
+    if not result:
+        return 0, []
+    return result
+
+
+def gap_analysis(pre_process, coords, **params):
+    """
+    GAP_ANALYSIS mode of main.py.
+
+    Returns:
+        dict: {mode, left_count, left_hits, right_count, right_hits}
+    """
+    p = dict(PIPELINE_DEFAULTS)
+    p.update(params)
+    roi_left, roi_center, roi_right = _rois(coords)
+
+    filtered = filter_line_segments(pre_process, offset_y=0, logs=False)
+    left_gaps = normalize_gaps(filtered, max_gap=p["max_gap"], min_gap=p["min_gap"],
+                               segment_index=p["left_segment_index"])
+    right_gaps = normalize_gaps(filtered, max_gap=p["max_gap"], min_gap=p["min_gap"],
+                                segment_index=p["right_segment_index"])
+
+    left_count, left_hits = _hits(check_lines(left_gaps, roi_left, roi_center,
+                                              fixed_height=p["fixed_height"],
+                                              width=p["bbox_width"]))
+    right_count, right_hits = _hits(check_lines(right_gaps, roi_center, roi_right,
+                                                fixed_height=p["fixed_height"],
+                                                width=p["bbox_width"]))
+    return {"mode": "GAP_ANALYSIS",
+            "left_count": left_count, "left_hits": left_hits,
+            "right_count": right_count, "right_hits": right_hits}
+
+
+def virtual_slots(pre_process, coords, **params):
+    """
+    VIRTUAL_SLOTS mode of main.py.
+
+    Returns:
+        dict: {mode, box_top, box_height, inventory}
+    """
+    roi_left, roi_center, roi_right = _rois(coords)
+    boundaries = extract_boundary_segments(pre_process)
+    box_top, box_height = get_box_reference_metrics(boundaries, roi_left, roi_right)
+    inventory = analyze_virtual_slots(pre_process, box_top, box_height,
+                                      center_offset=roi_center,
+                                      windows=params.get("windows"))
+    return {"mode": "VIRTUAL_SLOTS", "box_top": box_top, "box_height": box_height,
+            "inventory": inventory}
+
+
+def analyze(pre_process, coords, mode="GAP_ANALYSIS", **params):
+    """
+    Runs the analysis stages of one mode on a detection result.
+
+    Args:
+        pre_process: {offset_x: [segment_dict, ...]} (process_image() /
+                     process_frame() output).
+        coords: ROI dict (env.txt format).
+        mode: "GAP_ANALYSIS" or "VIRTUAL_SLOTS".
+        params: Overrides of PIPELINE_DEFAULTS.
+
+    Returns:
+        dict: Mode result (see gap_analysis() / virtual_slots()).
+    """
+    if pre_process is None:
+        raise ValueError("No detection result")
+    if mode == "GAP_ANALYSIS":
+        return gap_analysis(pre_process, coords, **params)
+    if mode == "VIRTUAL_SLOTS":
+        return virtual_slots(pre_process, coords, **params)
+    raise ValueError("Unknown mode {}".format(mode))
+
+# ---------USAGE-----------
+# pre_process = process_frame(img, coords)
+# result = analyze(pre_process, coords, mode="VIRTUAL_SLOTS")
+# print(result["inventory"])
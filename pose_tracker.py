@@ -0,0 +1,197 @@
+# pose_tracker.py
+# Cassette pose tracking across frames to narrow the detection band
+
+from estimate import (extract_boundary_segments, get_box_reference_metrics,
+                      virtual_slot_windows)
+
+# -----------------------------------------------------------------------------
+# The cassette barely moves between consecutive frames of a station, so
+# box_top, box_height and the slot pitch are carried over instead of being
+# re-derived from a full-frame search every time. Each frame's measurement
+# (boundary segments of the left/right ROIs, disk spacing of the center ROI)
+# is blended into an exponential moving average, and a confidence value
+# grows with every consistent measurement and drops on misses or jumps.
+#
+# While the confidence is high, predicted_band() returns only the rows around
+# the expected cassette (offset_y / tile_h for process_frame)
+# and predicted_windows() the slot windows at the tracked pitch. With low
+# confidence (first frame, lost lock) the full frame is searched again.
+#
+# Functions Summary:
+# 1. measure_pose(filtered, ...)
+# 2. update_pose(measurement)
+# 3. predicted_band(frame_height, ...)
+# 4. predicted_windows(...)
+# 5. pose_state() / pose_reset()
+# -----------------------------------------------------------------------------
+
+POSE_ALPHA = 0.3          # EMA weight of a new measurement
+REACQUIRE_ALPHA = 0.7     # EMA weight while the confidence is still low
+CONFIDENCE_GAIN = 0.25    # Confidence added per consistent measurement
+CONFIDENCE_DECAY = 0.5    # Confidence multiplier on a miss / jump
+MIN_CONFIDENCE = 0.5      # Below this the full frame is searched
+MAX_JUMP = 0.1            # Max top/height change (fraction of box height) per frame
+SEARCH_MARGIN = 40        # Rows searched above/below the predicted box
+
+REFERENCE_HEIGHT = 920.0  # Same reference geometry as analyze_virtual_slots
+REFERENCE_PITCH = 30.0
+PITCH_TOLERANCE = 0.2     # Disk spacing accepted within +-20% of k * pitch
+
+_pose = {
+    "box_top": None,
+    "box_height": None,
+    "pitch": None,
+    "confidence": 0.0,
+    "frames": 0,
+    "misses": 0,
+}
+
+
+def _median(values):
+    values = sorted(values)
+    mid = len(values) // 2
+    if len(values) % 2:
+        return values[mid]
+    return (values[mid - 1] + values[mid]) / 2.0
+
+
+def measure_pose(filtered, left_key=200, right_key=1500, center_offset=800,
+                 reference_height=REFERENCE_HEIGHT, reference_pitch=REFERENCE_PITCH):
+    """
+    Measures the box geometry of one frame.
+
+    Args:
+        filtered: Filtered segments {offset_x: [segment_dict, ...]}.
+        left_key, right_key: ROIs holding the box boundaries.
+        center_offset: ROI holding the disks (pitch measurement).
+
+    Returns:
+        dict: {box_top, box_height, pitch} or None if no boundary was found.
+    """
+    boundaries = extract_boundary_segments(filtered)
+    if left_key not in boundaries and right_key not in boundaries:
+        return None
+    box_top, box_height = get_box_reference_metrics(boundaries, left_key, right_key)
+    if box_height <= 0:
+        return None
+
+    # Pitch from the box height, refined by the spacing of neighbouring disks
+    pitch = reference_pitch * box_height / reference_height
+    disks = sorted((s['y1'] + s['y2']) / 2.0 for s in filtered.get(center_offset, []))
+    spacings = []
+    for a, b in zip(disks, disks[1:]):
+        k = round((b - a) / pitch)
+        if k >= 1 and abs((b - a) / k - pitch) <= PITCH_TOLERANCE * pitch:
+            spacings.append((b - a) / k)
+    if spacings:
+        pitch = _median(spacings)
+
+    return {"box_top": box_top, "box_height": box_height, "pitch": pitch}
+
+
+def update_pose(measurement):
+    """
+    Blends a measurement into the tracked pose.
+
+    A measurement far from a confident estimate is treated as a miss; if the
+    confidence has dropped below MIN_CONFIDENCE it re-initialises the track.
+
+    Args:
+        measurement: measure_pose() result or None (nothing found).
+
+    Returns:
+        dict: The updated pose (see pose_state()).
+    """
+    _pose["frames"] += 1
+
+    if measurement is None:
+        _pose["misses"] += 1
+        _pose["confidence"] *= CONFIDENCE_DECAY
+        return pose_state()
+
+    if _pose["box_top"] is None:
+        _pose.update(measurement)
+        _pose["confidence"] = CONFIDENCE_GAIN
+        return pose_state()
+
+    limit = MAX_JUMP * _pose["box_height"]
+    jump = (abs(measurement["box_top"] - _pose["box_top"]) > limit or
+            abs(measurement["box_height"] - _pose["box_height"]) > limit)
+
+    if jump and _pose["confidence"] >= MIN_CONFIDENCE:
+        _pose["misses"] += 1
+        _pose["confidence"] *= CONFIDENCE_DECAY
+        print("Pose jump rejected: {}".format(measurement))
+        return pose_state()
+
+    if jump:
+        # Lock lost: restart the track from this measurement
+        _pose.update(measurement)
+        _pose["confidence"] = CONFIDENCE_GAIN
+        return pose_state()
+
+    alpha = POSE_ALPHA if _pose["confidence"] >= MIN_CONFIDENCE else REACQUIRE_ALPHA
+    for key in ("box_top", "box_height", "pitch"):
+        _pose[key] += alpha * (measurement[key] - _pose[key])
+    _pose["confidence"] = min(1.0, _pose["confidence"] + CONFIDENCE_GAIN)
+    return pose_state()
+
+
+def predicted_band(frame_height, margin=SEARCH_MARGIN):
+    """
+    Rows to search in the next frame.
+
+    Returns:
+        tuple: (offset_y, tile_h) for process_frame() (process_image() has no
+               tile_h and always reads to the frame bottom);
+               (0, None) = full frame (no confident track yet).
+    """
+    if _pose["box_top"] is None or _pose["confidence"] < MIN_CONFIDENCE:
+        return 0, None
+    top = max(0, int(_pose["box_top"] - margin))
+    bottom = min(frame_height, int(_pose["box_top"] + _pose["box_height"] + margin) + 1)
+    if bottom <= top:
+        return 0, None
+    return top, bottom - top
+
+
+def predicted_windows(slots=24, reference_height=REFERENCE_HEIGHT, start_pos=100.0):
+    """
+    Virtual slot windows at the tracked box geometry and pitch.
+
+    Returns:
+        list: [(slot_number, expected_y, win_top, win_bottom), ...] or None
+              if nothing is tracked yet.
+    """
+    if _pose["box_top"] is None:
+        return None
+    # virtual_slot_windows() takes the pitch in reference pixels
+    pitch = _pose["pitch"] * reference_height / _pose["box_height"]
+    return virtual_slot_windows(_pose["box_top"], _pose["box_height"], slots=slots,
+                                reference_height=reference_height,
+                                start_pos=start_pos, pitch=pitch)
+
+
+def pose_state():
+    """Returns a copy of the tracked pose."""
+    return dict(_pose)
+
+
+def pose_reset():
+    """Forgets the track; the next frame searches the full frame."""
+    for key in ("box_top", "box_height", "pitch"):
+        _pose[key] = None
+    _pose["confidence"] = 0.0
+    _pose["frames"] = 0
+    _pose["misses"] = 0
+
+# ---------USAGE-----------
+# def analyze(img):
+#     offset_y, tile_h = predicted_band(img.height())
+#     segments = process_frame(img, coords, offset_y=offset_y, tile_h=tile_h)
+#     filtered = filter_line_segments(segments, offset_y=0)
+#     update_pose(measure_pose(filtered))
+#     pose = pose_state()
+#     return analyze_virtual_slots(filtered, pose["box_top"], pose["box_height"],
+#                                  windows=predicted_windows())
+# run_continuous(analyze, coords=coords)
@@ -0,0 +1,294 @@
+# result_protocol.py
+# Compact framed binary protocol for analysis results (camera -> host)
+
+import struct
+import binascii
+
+# -----------------------------------------------------------------------------
+# Results are pushed to the host right after each analysis as binary frames
+# on the same USB VCP stream as the text replies of command_server:
+#
+#     magic (2) | type (1) | length (4, LE) | payload | crc32 (4, LE)
+#
+# The CRC (binascii.crc32) covers type, length and payload. Text reply lines
+# never start with the magic byte, so FrameDecoder on the host splits the
+# stream back into text lines and result frames. Frames with a bad CRC are
+# dropped, implausible lengths make it resynchronise on the next magic.
+#
+# Payloads (all little-endian, every payload starts with the result seq):
+#   MSG_INVENTORY: seq u16, count u8, per slot: status u8, expected_y u16,
+#                  actual_y u16 (y * 10, 0xFFFF = none)
+#   MSG_GAPS:      seq u16, count u8, per array: side u8, left/right count
+#                  u16, hits u8, hit bits (LSB first)
+#   MSG_SEGMENTS:  seq u16, groups u8, per group: offset_x u16, count u16,
+#                  per segment: x1 y1 x2 y2 u16, length u16, theta u8
+#   MSG_FRAME_INFO / MSG_FRAME_CHUNK / MSG_FRAME_END: image transfer, see
+#                  frame_transfer.py
+#
+# The module has no camera imports; the host uses it as its decoder library.
+#
+# Functions Summary:
+# 1. encode_frame(msg_type, payload)
+# 2. encode_inventory / encode_gaps / encode_segments / encode_frame_*
+# 3. decode_payload(msg_type, payload)
+# 4. FrameDecoder.feed(data) -> [("line", text) | ("frame", type, result)]
+# -----------------------------------------------------------------------------
+
+MAGIC = b"\xa5\x5a"
+MSG_INVENTORY = 1
+MSG_GAPS = 2
+MSG_SEGMENTS = 3
+MSG_FRAME_INFO = 4
+MSG_FRAME_CHUNK = 5
+MSG_FRAME_END = 6
+
+# transfer id u16, size u32, width u16, height u16, format u8, chunk u16,
+# crc32 u32, band count u8, then per band: x u16, w u16
+_FRAME_INFO = "<HIHHBHIB"
+# transfer id u16, offset u32, then the data
+_FRAME_CHUNK = "<HI"
+# transfer id u16, size u32, crc32 u32
+_FRAME_END = "<HII"
+FRAME_FORMATS = {"RAW": 0, "JPEG": 1}
+FRAME_FORMAT_NAMES = {code: name for name, code in FRAME_FORMATS.items()}
+
+_HEAD = "<2sBI"
+_HEAD_SIZE = struct.calcsize(_HEAD)
+MAX_PAYLOAD = 1 << 20     # Larger lengths are treated as corruption
+
+STATUS_CODES = {"Empty": 0, "Occupied": 1, "Ambiguous": 2}
+STATUS_NAMES = {code: name for name, code in STATUS_CODES.items()}
+NO_Y = 0xFFFF
+GAP_SIDES = {"left": 0, "right": 1}
+GAP_SIDE_NAMES = {code: name for name, code in GAP_SIDES.items()}
+
+
+def _crc(data):
+    return binascii.crc32(data) & 0xFFFFFFFF
+
+
+def encode_frame(msg_type, payload):
+    """Wraps a payload into a frame (magic, type, length, payload, crc32)."""
+    head = struct.pack(_HEAD, MAGIC, msg_type, len(payload))
+    return head + payload + struct.pack("<I", _crc(head[2:] + payload))
+
+
+def _u16(value):
+    return max(0, min(0xFFFF, int(value)))
+
+
+def _y10(y):
+    if y is None:
+        return NO_Y
+    return max(0, min(NO_Y - 1, int(round(y * 10))))
+
+
+def encode_inventory(inventory, seq=0):
+    """analyze_virtual_slots() inventory -> MSG_INVENTORY frame."""
+    slots = sorted(inventory.items(), key=lambda item: int(item[0].split('_')[1]))
+    parts = [struct.pack("<HB", seq & 0xFFFF, len(slots))]
+    for slot_id, data in slots:
+        parts.append(struct.pack("<BHH", STATUS_CODES.get(data["status"], 2),
+                                 _y10(data["expected_y"]), _y10(data["actual_y"])))
+    return encode_frame(MSG_INVENTORY, b"".join(parts))
+
+
+def encode_gaps(arrays, seq=0):
+    """
+    Gap hit arrays -> MSG_GAPS frame.
+
+    Args:
+        arrays: {"left": (count, hit_array), "right": (count, hit_array)}
+    """
+    parts = [struct.pack("<HB", seq & 0xFFFF, len(arrays))]
+    for side, (count, hits) in sorted(arrays.items()):
+        bits = bytearray((len(hits) + 7) // 8)
+        for i, hit in enumerate(hits):
+            if hit:
+                bits[i // 8] |= 1 << (i % 8)
+        parts.append(struct.pack("<BHB", GAP_SIDES[side], count, len(hits)))
+        parts.append(bytes(bits))
+    return encode_frame(MSG_GAPS, b"".join(parts))
+
+
+def encode_segments(segments, seq=0):
+    """{offset_x: [segment_dict, ...]} -> MSG_SEGMENTS frame."""
+    parts = [struct.pack("<HB", seq & 0xFFFF, len(segments))]
+    for offset_x in sorted(segments, key=int):
+        segment_list = segments[offset_x]
+        parts.append(struct.pack("<HH", int(offset_x), len(segment_list)))
+        for s in segment_list:
+            parts.append(struct.pack("<HHHHHB", _u16(s["x1"]), _u16(s["y1"]),
+                                     _u16(s["x2"]), _u16(s["y2"]),
+                                     _u16(s.get("length", 0)), int(s.get("theta", 0)) % 180))
+    return encode_frame(MSG_SEGMENTS, b"".join(parts))
+
+
+def encode_result(result, seq=0, segments=None):
+    """
+    All frames for one pipeline.analyze() result (plus optional segments).
+
+    Returns:
+        list: Encoded frames.
+    """
+    frames = []
+    if "inventory" in result:
+        frames.append(encode_inventory(result["inventory"], seq))
+    if "left_hits" in result:
+        frames.append(encode_gaps({"left": (result["left_count"], result["left_hits"]),
+                                   "right": (result["right_count"], result["right_hits"])}, seq))
+    if segments is not None:
+        frames.append(encode_segments(segments, seq))
+    return frames
+
+
+def encode_frame_info(transfer_id, size, width, height, fmt, chunk, crc, bands=()):
+    """Start of an image transfer (bands = [(x, w), ...] for ROI-only transfers)."""
+    payload = struct.pack(_FRAME_INFO, transfer_id, size, width, height,
+                          FRAME_FORMATS[fmt], chunk, crc, len(bands))
+    for x, w in bands:
+        payload += struct.pack("<HH", x, w)
+    return encode_frame(MSG_FRAME_INFO, payload)
+
+
+def encode_frame_chunk(transfer_id, offset, data):
+    """One chunk of an image transfer, starting at byte offset."""
+    return encode_frame(MSG_FRAME_CHUNK, struct.pack(_FRAME_CHUNK, transfer_id, offset) + data)
+
+
+def encode_frame_end(transfer_id, size, crc):
+    """End of an image transfer."""
+    return encode_frame(MSG_FRAME_END, struct.pack(_FRAME_END, transfer_id, size, crc))
+
+
+def _y(value):
+    return None if value == NO_Y else value / 10.0
+
+
+def decode_payload(msg_type, payload):
+    """Payload of a frame -> Python result dict."""
+    if msg_type == MSG_FRAME_INFO:
+        transfer_id, size, width, height, fmt, chunk, crc, count = struct.unpack_from(
+            _FRAME_INFO, payload, 0)
+        pos = struct.calcsize(_FRAME_INFO)
+        bands = []
+        for _ in range(count):
+            bands.append(struct.unpack_from("<HH", payload, pos))
+            pos += 4
+        return {"transfer_id": transfer_id, "size": size, "width": width, "height": height,
+                "format": FRAME_FORMAT_NAMES.get(fmt, str(fmt)), "chunk": chunk,
+                "crc": crc, "bands": bands}
+    if msg_type == MSG_FRAME_CHUNK:
+        transfer_id, offset = struct.unpack_from(_FRAME_CHUNK, payload, 0)
+        return {"transfer_id": transfer_id, "offset": offset,
+                "data": bytes(payload[struct.calcsize(_FRAME_CHUNK):])}
+    if msg_type == MSG_FRAME_END:
+        transfer_id, size, crc = struct.unpack_from(_FRAME_END, payload, 0)
+        return {"transfer_id": transfer_id, "size": size, "crc": crc}
+
+    seq, count = struct.unpack_from("<HB", payload, 0)
+    pos = 3
+    if msg_type == MSG_INVENTORY:
+        inventory = {}
+        for i in range(count):
+            status, expected_y, actual_y = struct.unpack_from("<BHH", payload, pos)
+            pos += 5
+            inventory["Slot_{}".format(i + 1)] = {
+                "status": STATUS_NAMES.get(status, "Ambiguous"),
+                "expected_y": _y(expected_y),
+                "actual_y": _y(actual_y),
+            }
+        return {"seq": seq, "inventory": inventory}
+
+    if msg_type == MSG_GAPS:
+        arrays = {}
+        for _ in range(count):
+            side, hit_count, n = struct.unpack_from("<BHB", payload, pos)
+            pos += 4
+            bits = payload[pos:pos + (n + 7) // 8]
+            pos += (n + 7) // 8
+            hits = [bool(bits[i // 8] & (1 << (i % 8))) for i in range(n)]
+            arrays[GAP_SIDE_NAMES.get(side, str(side))] = (hit_count, hits)
+        return {"seq": seq, "gaps": arrays}
+
+    if msg_type == MSG_SEGMENTS:
+        segments = {}
+        for _ in range(count):
+            offset_x, n = struct.unpack_from("<HH", payload, pos)
+            pos += 4
+            group = []
+            for _ in range(n):
+                x1, y1, x2, y2, length, theta = struct.unpack_from("<HHHHHB", payload, pos)
+                pos += 11
+                group.append({"x1": x1, "y1": y1, "x2": x2, "y2": y2,
+                              "length": length, "theta": theta})
+            segments[offset_x] = group
+        return {"seq": seq, "segments": segments}
+
+    return {"seq": seq, "raw": bytes(payload[3:])}
+
+
+class FrameDecoder:
+    """
+    Splits a byte stream into text lines and result frames.
+
+    feed() returns a list of events:
+        ("line", text)                    - a text reply line
+        ("frame", msg_type, payload_dict) - a decoded result frame
+    Frames with a bad CRC are dropped (counted in crc_errors).
+    """
+
+    def __init__(self, decode=True):
+        self.buffer = b""
+        self.decode = decode
+        self.crc_errors = 0
+
+    def feed(self, data):
+        self.buffer += data
+        events = []
+        while self.buffer:
+            if self.buffer.startswith(MAGIC):
+                if len(self.buffer) < _HEAD_SIZE:
+                    break
+                magic, msg_type, length = struct.unpack_from(_HEAD, self.buffer, 0)
+                if length > MAX_PAYLOAD:
+                    self.buffer = self.buffer[2:]  # Not a real frame, resync
+                    self.crc_errors += 1
+                    continue
+                total = _HEAD_SIZE + length + 4
+                if len(self.buffer) < total:
+                    break
+                payload = self.buffer[_HEAD_SIZE:_HEAD_SIZE + length]
+                crc = struct.unpack_from("<I", self.buffer, _HEAD_SIZE + length)[0]
+                if crc != _crc(self.buffer[2:_HEAD_SIZE] + payload):
+                    # Drop the whole damaged frame
+                    self.crc_errors += 1
+                    self.buffer = self.buffer[total:]
+                    continue
+                self.buffer = self.buffer[total:]
+                events.append(("frame", msg_type,
+                               decode_payload(msg_type, payload) if self.decode else payload))
+                continue
+
+            newline = self.buffer.find(b"\n")
+            magic = self.buffer.find(MAGIC)
+            if magic >= 0 and (newline < 0 or magic < newline):
+                # Text without line end in front of a frame
+                text = self.buffer[:magic]
+                self.buffer = self.buffer[magic:]
+            elif newline >= 0:
+                text = self.buffer[:newline]
+                self.buffer = self.buffer[newline + 1:]
+            else:
+                break
+            text = text.strip()
+            if text:
+                events.append(("line", text.decode("utf-8", "replace")))
+        return events
+
+# ---------USAGE-----------
+# Camera:
+# for frame in encode_result(result, seq=7): server.send(frame)
+# Host:
+# decoder = FrameDecoder()
+# for event in decoder.feed(serial.read(4096)): print(event)
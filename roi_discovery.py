@@ -0,0 +1,164 @@
+# roi_discovery.py
+# One-time ROI column discovery with the layout cached in the station config
+
+from utils import load_env, save_env, roi_coords
+from bmp_line_detection import MAX_TILE_W
+
+# -----------------------------------------------------------------------------
+# Wafer edges are horizontal lines, so a good ROI column is one with many
+# strong row-to-row intensity changes. The frame is cut into narrow vertical
+# strips; for every strip the row-mean profile is sampled (get_statistics) and
+# its edge energy is the summed absolute row-to-row difference. The N tile-wide
+# windows of strips with the highest energy, at least one tile width apart
+# (so two neighbouring windows on the same wafer edge are not both picked),
+# become the ROI layout. LEFT/CENTER/RIGHT are assigned by position, so the
+# picked windows must also span most of the frame (MIN_SPAN), i.e. reach both
+# cassette walls; otherwise discovery fails and env.txt is left alone.
+#
+# Discovery is slow (one statistics call per strip and sampled row), so it is
+# run once per station and the result is written to env.txt together with the
+# frame size it was found on (ROI_FRAME). station_layout() returns the cached
+# layout as long as the frame size matches.
+#
+# Functions Summary:
+# 1. column_edge_energy(img, strip_w, row_step, ...)
+# 2. pick_bands(energy, strip_w, n, tile_w, ...)
+# 3. discover_rois(img, n, ...)
+# 4. station_layout(img, env_file, n, rediscover)
+# -----------------------------------------------------------------------------
+
+ENV_FILE = "env.txt"
+STRIP_W = 16           # Column strip width (px) of the energy projection
+ROW_STEP = 4           # Sample every ROW_STEP-th row
+MIN_BAND_GAP = None    # Columns required between two picked bands (None = tile_w)
+MIN_SPAN = 0.5         # Picked bands must cover this fraction of the frame width
+ROI_NAMES = {
+    2: ("LEFT_ROI", "RIGHT_ROI"),
+    3: ("LEFT_ROI", "CENTER_ROI", "RIGHT_ROI"),
+}
+
+
+def column_edge_energy(img, strip_w=STRIP_W, row_step=ROW_STEP, y0=0, y1=None):
+    """
+    Horizontal-edge energy of every vertical strip of the frame.
+
+    Args:
+        img: GRAYSCALE frame.
+        strip_w: Strip width in pixels.
+        row_step: Row sampling step.
+        y0, y1: Rows to look at (default: whole frame).
+
+    Returns:
+        list: Energy per strip (strip i covers x = i*strip_w ...).
+    """
+    if y1 is None:
+        y1 = img.height()
+    energy = []
+    for x in range(0, img.width() - strip_w + 1, strip_w):
+        previous = None
+        total = 0.0
+        for y in range(y0, y1 - row_step + 1, row_step):
+            mean = img.get_statistics(roi=(x, y, strip_w, row_step)).mean()
+            if previous is not None:
+                total += abs(mean - previous)
+            previous = mean
+        energy.append(total)
+    return energy
+
+
+def pick_bands(energy, strip_w, n, tile_w=MAX_TILE_W, min_gap=MIN_BAND_GAP):
+    """
+    Greedily picks the n tile-wide windows of highest energy that are at
+    least min_gap columns apart (default: one tile width).
+
+    Returns:
+        list: Sorted x offsets of the picked windows (may be fewer than n if
+              the frame is too narrow).
+    """
+    if min_gap is None:
+        min_gap = tile_w
+    strips = max(1, tile_w // strip_w)
+    if len(energy) < strips:
+        return []
+
+    windows = []
+    window_sum = sum(energy[:strips])
+    windows.append((window_sum, 0))
+    for i in range(1, len(energy) - strips + 1):
+        window_sum += energy[i + strips - 1] - energy[i - 1]
+        windows.append((window_sum, i))
+    windows.sort(reverse=True)
+
+    reach = strips + (min_gap + strip_w - 1) // strip_w
+    picked = []
+    for score, i in windows:
+        if len(picked) == n:
+            break
+        if all(abs(i - j) >= reach for j in picked):
+            picked.append(i)
+    return sorted(i * strip_w for i in picked)
+
+
+def roi_names(n):
+    """Key names for an n-column layout (LEFT/CENTER/RIGHT where possible)."""
+    return ROI_NAMES.get(n) or tuple("COL{}_ROI".format(i + 1) for i in range(n))
+
+
+def discover_rois(img, n=3, tile_w=MAX_TILE_W, strip_w=STRIP_W, row_step=ROW_STEP,
+                  min_gap=MIN_BAND_GAP):
+    """
+    Finds the n best ROI columns of a frame.
+
+    Returns:
+        dict: {Directional key: pixel value} (env.txt format).
+
+    Raises:
+        ValueError: Fewer than n columns fit, or they do not span the cassette.
+    """
+    energy = column_edge_energy(img, strip_w=strip_w, row_step=row_step)
+    offsets = pick_bands(energy, strip_w, n, tile_w=tile_w, min_gap=min_gap)
+    if len(offsets) < n:
+        raise ValueError("Only {} of {} ROI columns fit a {}px frame".format(
+            len(offsets), n, img.width()))
+    span = offsets[-1] + tile_w - offsets[0]
+    if span < MIN_SPAN * img.width():
+        raise ValueError("ROI columns {} span {}px, not the cassette ({}px frame)".format(
+            offsets, span, img.width()))
+    coords = dict(zip(roi_names(n), (str(x) for x in offsets)))
+    print("Discovered ROI layout: {}".format(coords))
+    return coords
+
+
+def station_layout(img, env_file=ENV_FILE, n=3, rediscover=False, **discover_args):
+    """
+    Returns the station's ROI layout, discovering and caching it if needed.
+
+    The cached layout is used if it has n ROI columns and was found on a
+    frame of the same size; otherwise discover_rois() runs on img and the
+    result replaces the *_ROI keys of env_file (other keys are kept).
+
+    Returns:
+        dict: {Directional key: pixel value} (env.txt format).
+    """
+    try:
+        config = load_env(env_file)
+    except RuntimeError:
+        config = {}
+
+    frame = "{}x{}".format(img.width(), img.height())
+    cached = roi_coords(config)
+    if not rediscover and len(cached) == n and config.get("ROI_FRAME") == frame:
+        return cached
+
+    coords = discover_rois(img, n=n, **discover_args)
+    variables = {key: value for key, value in config.items() if key not in cached}
+    variables.update(coords)
+    variables["ROI_FRAME"] = frame
+    save_env(env_file, variables)
+    print("ROI layout saved to {}".format(env_file))
+    return coords
+
+# ---------USAGE-----------
+# img, exp, gain = calibrated_snapshot(sensor.FHD)
+# coords = station_layout(img, n=3)          # Discovers once, then reads env.txt
+# pre_process = process_frame(img, coords)
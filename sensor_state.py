@@ -0,0 +1,275 @@
+# sensor_state.py
+# Sensor state manager (NO sensor.reset() on import, NO __main__)
+
+import sensor
+
+# -----------------------------------------------------------------------------
+# Tracks the sensor configuration last applied (pixformat, framesize,
+# windowing, frame buffers, exposure, gain, white balance) and only talks to
+# the sensor for settings that actually change. Each change adds to a pending
+# settle time which is paid once by settle(), so back-to-back captures at the
+# same settings skip the mode switches, the step-up dance and the settle.
+#
+# Functions Summary:
+# 1. reset() / invalidate()
+# 2. set_pixformat(), set_framesize(), set_windowing(), set_framebuffers()
+# 3. set_exposure(), set_gain(), set_auto(), set_whitebal()
+# 4. configure(...), matches(...), settle(), current()
+# -----------------------------------------------------------------------------
+
+# Settle costs (ms) per kind of change
+SETTLE_RESET_MS = 2000
+SETTLE_PIXFORMAT_MS = 300
+SETTLE_FRAMESIZE_MS = 600
+SETTLE_LARGE_FRAMESIZE_MS = 1000  # Longer settle for high res
+SETTLE_WINDOWING_MS = 200
+SETTLE_EXPOSURE_MS = 200
+SETTLE_AUTO_MS = 800
+
+# OV5640 quirk: large modes are only stable when entered from SXGA
+STEP_UP_FRAMESIZE = sensor.SXGA
+STEP_UP_SETTLE_MS = 200
+LARGE_FRAMESIZES = (sensor.UXGA, sensor.FHD, sensor.QXGA, sensor.WQXGA2)
+
+# Full readout size of each framesize (used to clear a window)
+FRAME_SIZES = {
+    sensor.QVGA: (320, 240),
+    sensor.VGA: (640, 480),
+    sensor.SXGA: (1280, 1024),
+    sensor.UXGA: (1600, 1200),
+    sensor.FHD: (1920, 1080),
+    sensor.QXGA: (2048, 1536),
+    sensor.WQXGA2: (2592, 1944),
+}
+
+_state = {}
+_pending = {"settle_ms": 0}
+
+
+def _need_settle(ms):
+    if ms > _pending["settle_ms"]:
+        _pending["settle_ms"] = ms
+
+
+# -----------------------------------------------------------------------------
+# Reset / bookkeeping
+# -----------------------------------------------------------------------------
+
+def reset():
+    """Hard sensor reset. All tracked state becomes unknown."""
+    sensor.reset()
+    _state.clear()
+    _need_settle(SETTLE_RESET_MS)
+
+
+def invalidate(*keys):
+    """
+    Forget tracked settings (all of them when no keys are given), e.g. after
+    code outside this module touched the sensor directly.
+    """
+    if not keys:
+        _state.clear()
+    for key in keys:
+        _state.pop(key, None)
+
+
+def current():
+    """Returns a copy of the tracked sensor state."""
+    return dict(_state)
+
+
+def matches(**settings):
+    """True if every given setting equals the tracked value."""
+    for key, value in settings.items():
+        if key not in _state or _state[key] != value:
+            return False
+    return True
+
+
+# -----------------------------------------------------------------------------
+# Mode settings
+# -----------------------------------------------------------------------------
+
+def set_pixformat(pixformat):
+    """Returns True if the sensor was reconfigured."""
+    if _state.get("pixformat") == pixformat:
+        return False
+    sensor.set_pixformat(pixformat)
+    _state["pixformat"] = pixformat
+    _need_settle(SETTLE_PIXFORMAT_MS)
+    return True
+
+
+def set_framesize(framesize, step_up=True):
+    """
+    Sets the framesize, stepping up through SXGA when entering a large mode
+    from a small one. Clears windowing (the sensor does the same).
+
+    Returns True if the sensor was reconfigured.
+    """
+    previous = _state.get("framesize")
+    if previous == framesize:
+        return False
+
+    if (step_up and framesize in LARGE_FRAMESIZES
+            and previous not in LARGE_FRAMESIZES
+            and previous != STEP_UP_FRAMESIZE):
+        sensor.set_framesize(STEP_UP_FRAMESIZE)
+        sensor.skip_frames(time=STEP_UP_SETTLE_MS)
+
+    # Unknown until the call succeeds (callers may fall back on failure)
+    _state.pop("framesize", None)
+    sensor.set_framesize(framesize)
+    _state["framesize"] = framesize
+    _state["windowing"] = None
+
+    if framesize in LARGE_FRAMESIZES:
+        _need_settle(SETTLE_LARGE_FRAMESIZE_MS)
+    else:
+        _need_settle(SETTLE_FRAMESIZE_MS)
+    return True
+
+
+def set_windowing(roi=None):
+    """
+    Crops the readout to roi=(x, y, w, h); None restores the full frame.
+
+    Returns True if the sensor was reconfigured.
+    """
+    if roi is not None:
+        roi = tuple(roi)
+    if "windowing" in _state and _state["windowing"] == roi:
+        return False
+
+    if roi is None:
+        # A window covering the whole frame; re-applying the same framesize
+        # is a no-op on the sensor and would leave the crop in place
+        framesize = _state.get("framesize")
+        if framesize not in FRAME_SIZES:
+            raise RuntimeError("Cannot clear windowing: framesize unknown")
+        w, h = FRAME_SIZES[framesize]
+        sensor.set_windowing((0, 0, w, h))
+    else:
+        sensor.set_windowing(roi)
+
+    _state["windowing"] = roi
+    _need_settle(SETTLE_WINDOWING_MS)
+    return True
+
+
+def set_framebuffers(count):
+    """
+    Sets the number of frame buffers (1 = single buffered; 2+ lets the sensor
+    expose the next frame while the current one is processed).
+
+    Returns True if the sensor was reconfigured.
+    """
+    if _state.get("framebuffers") == count:
+        return False
+    sensor.set_framebuffers(count)
+    _state["framebuffers"] = count
+    return True
+
+
+# -----------------------------------------------------------------------------
+# Exposure / gain / white balance
+# -----------------------------------------------------------------------------
+
+def set_auto(enabled=True):
+    """Switches auto exposure and gain together; auto values are not tracked."""
+    if enabled:
+        sensor.set_auto_exposure(True)
+        sensor.set_auto_gain(True)
+        _state["auto"] = True
+        _state.pop("exposure_us", None)
+        _state.pop("gain_db", None)
+        _need_settle(SETTLE_AUTO_MS)
+    elif _state.get("auto") is not False:
+        sensor.set_auto_exposure(False)
+        sensor.set_auto_gain(False)
+        _state["auto"] = False
+
+
+def set_exposure(us):
+    """Forces manual exposure. Returns True if the sensor was reconfigured."""
+    us = int(us)
+    if _state.get("auto") is False and _state.get("exposure_us") == us:
+        return False
+    sensor.set_auto_exposure(False)
+    sensor.set_auto_exposure(False, exposure_us=us)
+    _state["exposure_us"] = us
+    _need_settle(SETTLE_EXPOSURE_MS)
+    return True
+
+
+def set_gain(db):
+    """Forces manual gain. Returns True if the sensor was reconfigured."""
+    db = float(db)
+    if _state.get("auto") is False and _state.get("gain_db") == db:
+        return False
+    sensor.set_auto_gain(False)
+    sensor.set_auto_gain(False, gain_db=db)
+    _state["gain_db"] = db
+    _need_settle(SETTLE_EXPOSURE_MS)
+    return True
+
+
+def set_whitebal(enabled):
+    if _state.get("whitebal") == enabled:
+        return False
+    sensor.set_auto_whitebal(enabled)
+    _state["whitebal"] = enabled
+    return True
+
+
+# -----------------------------------------------------------------------------
+# Combined configuration
+# -----------------------------------------------------------------------------
+
+def configure(pixformat=None, framesize=None, windowing=False,
+              exposure_us=None, gain_db=None, whitebal=None):
+    """
+    Applies only the settings that differ from the tracked state. Arguments
+    left at None (False for windowing) are not touched.
+
+    Returns:
+        bool: True if anything was reconfigured.
+    """
+    changed = False
+    if pixformat is not None:
+        changed |= set_pixformat(pixformat)
+    if framesize is not None:
+        changed |= set_framesize(framesize)
+    if windowing is not False:
+        changed |= set_windowing(windowing)
+    if whitebal is not None:
+        changed |= set_whitebal(whitebal)
+    if exposure_us is not None or gain_db is not None:
+        set_auto(False)
+    if exposure_us is not None:
+        changed |= set_exposure(exposure_us)
+    if gain_db is not None:
+        changed |= set_gain(gain_db)
+    return changed
+
+
+def settle(min_ms=0):
+    """
+    Pays the settle time accumulated by the changes since the last settle
+    (at least min_ms). Returns the time waited in ms.
+    """
+    ms = max(_pending["settle_ms"], min_ms)
+    _pending["settle_ms"] = 0
+    if ms > 0:
+        sensor.skip_frames(time=ms)
+    return ms
+
+# ---------USAGE-----------
+# import sensor_state
+# sensor_state.reset()
+# sensor_state.configure(pixformat=sensor.GRAYSCALE, framesize=sensor.FHD,
+#                        exposure_us=20000, gain_db=6.0, whitebal=False)
+# sensor_state.settle()     # pays the settle once
+# img = sensor.snapshot()
+# sensor_state.configure(pixformat=sensor.GRAYSCALE, framesize=sensor.FHD)
+# sensor_state.settle()     # nothing changed -> returns 0 immediately
@@ -0,0 +1,307 @@
+# spool_service.py
+# Long-running host service that analyzes frames dropped into a spool directory
+
+import os
+import json
+import time
+import fcntl
+import signal
+import argparse
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from utils import load_env, roi_coords
+from host_batch import analyze_frame, FRAME_EXTENSIONS, MODES
+
+# -----------------------------------------------------------------------------
+# Stations upload frames into the spool directory (directly, or one
+# sub-directory per station with its own env.txt). A frame's state is its
+# file name, so nothing is kept only in memory:
+#
+#     IMG_1.bin           queued (uploaded; stations should write IMG_1.bin.part
+#                         or a dot-file and rename it when complete)
+#     IMG_1.bin.claimed   claimed for analysis (atomic rename)
+#     IMG_1.bin.done      analyzed, result in IMG_1.bin.json next to it
+#     IMG_1.bin.failed    could not be analyzed, error in IMG_1.bin.json
+#
+# Claimed frames go to a process pool. At most max_inflight frames are
+# claimed at a time (backpressure: the rest stay queued in the spool, oldest
+# first). A finished frame is recorded in the progress journal
+# (.spool_progress.jsonl) after its result file is written and before it is
+# renamed. On start, claimed frames left by a crash are finished from the
+# journal, or put back in the queue if their result never made it there, so
+# frames are neither lost nor analyzed twice. One service owns a spool (lock
+# file .spool.lock); it scales with its worker count.
+#
+# Functions Summary:
+# 1. queued_frames(spool, settle_s)
+# 2. claim(path) / finish(claimed, result, journal)
+# 3. recover(spool)
+# 4. run_service(spool, env_file, workers, max_inflight, ...)
+# -----------------------------------------------------------------------------
+
+CLAIMED = ".claimed"
+DONE = ".done"
+FAILED = ".failed"
+JOURNAL = ".spool_progress.jsonl"
+LOCK_FILE = ".spool.lock"
+ENV_FILE = "env.txt"
+SETTLE_S = 1.0            # Frames younger than this may still be uploading
+POLL_S = 0.5              # Spool scan interval when idle
+REPORT_S = 30.0           # Seconds between progress prints
+
+_state = {"stop": False}
+_env_cache = {}
+
+
+def _is_frame(name):
+    return not name.startswith(".") and name.lower().endswith(FRAME_EXTENSIONS)
+
+
+def _spool_dirs(spool):
+    dirs = [spool]
+    for name in sorted(os.listdir(spool)):
+        path = os.path.join(spool, name)
+        if not name.startswith(".") and os.path.isdir(path):
+            dirs.append(path)
+    return dirs
+
+
+def queued_frames(spool, settle_s=SETTLE_S):
+    """
+    Queued frames of the spool (and its station sub-directories), oldest first.
+    """
+    now = time.time()
+    frames = []
+    for directory in _spool_dirs(spool):
+        for entry in os.scandir(directory):
+            if not entry.is_file() or not _is_frame(entry.name):
+                continue
+            mtime = entry.stat().st_mtime
+            if now - mtime >= settle_s:
+                frames.append((mtime, entry.path))
+    frames.sort()
+    return [path for mtime, path in frames]
+
+
+def claim(path):
+    """Claims a queued frame; None if another service got it first."""
+    claimed = path + CLAIMED
+    try:
+        os.rename(path, claimed)
+    except FileNotFoundError:
+        return None
+    return claimed
+
+
+def _write_json(path, data):
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(data, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+def _journal_append(journal, entry):
+    with open(journal, "a") as f:
+        f.write(json.dumps(entry) + "\n")
+        f.flush()
+        os.fsync(f.fileno())
+
+
+def finish(claimed, result, journal):
+    """
+    Writes the result next to the frame, records it in the journal and
+    renames the frame to .done / .failed.
+
+    Returns:
+        str: Final frame path.
+    """
+    frame = claimed[:-len(CLAIMED)]
+    result["frame"] = os.path.basename(frame)
+    _write_json(frame + ".json", result)
+    status = FAILED if "error" in result else DONE
+    _journal_append(journal, {"frame": frame, "status": status})
+    os.replace(claimed, frame + status)
+    return frame + status
+
+
+def recover(spool):
+    """
+    Resolves frames left claimed by a previous run (see module header).
+
+    Returns:
+        dict: {"finished": n, "requeued": n}
+    """
+    journal = os.path.join(spool, JOURNAL)
+    recorded = {}
+    if os.path.exists(journal):
+        with open(journal) as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue  # Torn last line of a crash
+                recorded[entry["frame"]] = entry["status"]
+
+    counts = {"finished": 0, "requeued": 0}
+    for directory in _spool_dirs(spool):
+        for name in os.listdir(directory):
+            if not name.endswith(CLAIMED):
+                continue
+            claimed = os.path.join(directory, name)
+            frame = claimed[:-len(CLAIMED)]
+            if frame in recorded and os.path.exists(frame + ".json"):
+                os.replace(claimed, frame + recorded[frame])
+                counts["finished"] += 1
+            else:
+                os.replace(claimed, frame)
+                counts["requeued"] += 1
+
+    # Every claimed frame is resolved, so the journal starts empty
+    open(journal, "w").close()
+    print("Spool recovery: {}".format(counts))
+    return counts
+
+
+def _coords_for(frame, default_env):
+    """
+    ROI layout of a frame: env.txt of its station directory, else the default.
+
+    Raises:
+        RuntimeError: No readable configuration.
+    """
+    env_file = os.path.join(os.path.dirname(frame), ENV_FILE)
+    if not os.path.exists(env_file):
+        env_file = default_env
+    try:
+        mtime = os.path.getmtime(env_file)
+    except OSError as e:
+        raise RuntimeError("Failed to load environment variables from {}: {}".format(env_file, e))
+    cached = _env_cache.get(env_file)
+    if cached is None or cached[0] != mtime:
+        cached = (mtime, roi_coords(load_env(env_file)))
+        _env_cache[env_file] = cached
+    return cached[1]
+
+
+def _lock(spool):
+    """Exclusive lock of the spool; raises RuntimeError if another service holds it."""
+    handle = open(os.path.join(spool, LOCK_FILE), "w")
+    try:
+        fcntl.flock(handle, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        handle.close()
+        raise RuntimeError("Spool {} is served by another process".format(spool))
+    return handle
+
+
+def _stop(signum, frame):
+    _state["stop"] = True
+
+
+def run_service(spool, env_file=ENV_FILE, workers=None, max_inflight=None, modes=MODES,
+                settle_s=SETTLE_S, poll_s=POLL_S, once=False, **options):
+    """
+    Watches the spool and analyzes frames until stopped (SIGINT / SIGTERM),
+    or until the spool is empty with once=True.
+
+    Args:
+        spool: Spool directory.
+        env_file: Default ROI configuration (station directories may have their own).
+        workers: Pool processes (default: CPU count).
+        max_inflight: Frames claimed at a time (default: 2 per worker).
+        options: analyze_frame() arguments (offset_y, width, height, sensor_type).
+
+    Returns:
+        dict: Counters {claimed, done, failed, lost_claims}.
+    """
+    workers = workers or os.cpu_count() or 1
+    max_inflight = max_inflight or 2 * workers
+    journal = os.path.join(spool, JOURNAL)
+    lock = _lock(spool)
+    recover(spool)
+
+    signal.signal(signal.SIGTERM, _stop)
+    signal.signal(signal.SIGINT, _stop)
+    _state["stop"] = False
+
+    stats = {"claimed": 0, "done": 0, "failed": 0, "lost_claims": 0}
+    inflight = {}
+    start = last_report = time.monotonic()
+    with ProcessPoolExecutor(workers) as executor:
+        while True:
+            # 1. Claim up to the in-flight limit
+            queued = batch = []
+            if not _state["stop"] and len(inflight) < max_inflight:
+                queued = queued_frames(spool, settle_s)
+                batch = queued[:max_inflight - len(inflight)]
+                queued = queued[len(batch):]
+                for path in batch:
+                    claimed = claim(path)
+                    if claimed is None:
+                        stats["lost_claims"] += 1
+                        continue
+                    try:
+                        coords = _coords_for(path, env_file)
+                    except (OSError, RuntimeError) as e:
+                        # Fail just this frame; requeueing it would crash-loop
+                        finish(claimed, {"error": str(e)}, journal)
+                        stats["failed"] += 1
+                        continue
+                    future = executor.submit(analyze_frame, claimed, coords, modes, **options)
+                    inflight[future] = claimed
+                    stats["claimed"] += 1
+
+            if not inflight:
+                if _state["stop"] or (once and not queued and not batch):
+                    break
+                time.sleep(poll_s)
+                continue
+
+            # 2. Finish completed frames
+            completed, _ = wait(list(inflight), timeout=poll_s, return_when=FIRST_COMPLETED)
+            for future in completed:
+                claimed = inflight.pop(future)
+                try:
+                    result = future.result()
+                except Exception as e:
+                    result = {"error": "{}: {}".format(type(e).__name__, e)}
+                finish(claimed, result, journal)
+                stats["failed" if "error" in result else "done"] += 1
+
+            now = time.monotonic()
+            if now - last_report >= REPORT_S:
+                last_report = now
+                print("Spool: {} in flight, {} queued, {} ({:.1f}/s)".format(
+                    len(inflight), len(queued), stats,
+                    (stats["done"] + stats["failed"]) / (now - start)))
+
+    lock.close()
+    print("Spool service stopped: {}".format(stats))
+    return stats
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Analyze frames uploaded to a spool directory.")
+    parser.add_argument("spool", help="Spool directory")
+    parser.add_argument("--env", default=ENV_FILE, help="Default ROI configuration")
+    parser.add_argument("--mode", choices=MODES + ("ALL",), default="ALL")
+    parser.add_argument("--workers", type=int, help="Processes (default: CPU count)")
+    parser.add_argument("--max-inflight", type=int, help="Frames claimed at a time")
+    parser.add_argument("--settle", type=float, default=SETTLE_S,
+                        help="Seconds a frame must be unchanged before it is claimed")
+    parser.add_argument("--width", type=int, help="Width of headerless raw frames")
+    parser.add_argument("--height", type=int, help="Height of headerless raw frames")
+    parser.add_argument("--sensor-type", help="Raw frame size name (VGA, FHD, ...)")
+    parser.add_argument("--once", action="store_true", help="Exit when the spool is empty")
+    args = parser.parse_args()
+
+    run_service(args.spool, env_file=args.env, workers=args.workers,
+                max_inflight=args.max_inflight,
+                modes=MODES if args.mode == "ALL" else (args.mode,),
+                settle_s=args.settle, once=args.once, width=args.width,
+                height=args.height, sensor_type=args.sensor_type)
+
+# ---------USAGE-----------
+# python3 spool_service.py /srv/spool --env env.txt --workers 8
+# Station upload: scp IMG_1.bin host:/srv/spool/st1/.IMG_1.bin && ssh host mv /srv/spool/st1/.IMG_1.bin /srv/spool/st1/IMG_1.bin
@@ -0,0 +1,326 @@
+# synth_cassette.py
+# Synthetic wafer cassette frames with ground truth (scale and accuracy testing)
+
+import os
+import math
+import json
+import random
+import struct
+import argparse
+from itertools import accumulate
+from utils import save_env
+from bmp_line_detection import FRAME_SIZES, MAX_TILE_W
+
+# -----------------------------------------------------------------------------
+# Renders grayscale frames of a cassette at any FRAME_SIZES resolution:
+#   - dark background, cassette box (top / bottom edges, vertical side walls)
+#   - a slotted rail on each side (a groove per slot)
+#   - a bright wafer edge across the box in every occupied slot
+# The slot layout uses the reference geometry of estimate.virtual_slot_windows
+# (box height REFERENCE_HEIGHT, first slot START_POS, PITCH in reference
+# pixels), so with the defaults the ground truth lines up with the virtual
+# slot windows.
+#
+# The scene is a list of rectangles, filled row by row as spans (a rotated
+# rectangle still cuts every row in one span), so tilted WQXGA2 frames render
+# in a moment. Then a box blur (2 passes), the exposure gain and Gaussian
+# sensor noise are applied.
+#
+# Output uses the formats the pipeline reads (read_frame_header()):
+#   "bmp": 8-bit grayscale BMP, bottom-up rows, 4-byte row padding
+#   "raw": headerless top-down frame, as capture_and_save_grayscale writes it
+# Every frame gets a <frame>.json with the ground truth (slots, occupancy,
+# box, suggested ROI layout); generate() also writes an env.txt with the
+# ROI layout of the resolution.
+#
+# Functions Summary:
+# 1. render_cassette(resolution, slots, pitch, occupancy, tilt, blur, noise, exposure, seed)
+# 2. write_frame(path, frame, width, height, fmt)
+# 3. suggested_rois(width, box)
+# 4. compare_inventory(truth, inventory)
+# 5. generate(out_dir, count, resolution, fmt, ...)
+# -----------------------------------------------------------------------------
+
+REFERENCE_HEIGHT = 920.0  # Same reference geometry as virtual_slot_windows()
+START_POS = 100.0
+PITCH = 30.0
+SLOTS = 24
+
+BOX_X = (0.08, 0.92)      # Box side walls (fraction of the frame width)
+BOX_Y = (0.06, 0.92)      # Box top / bottom (fraction of the frame height)
+RAIL_W = 0.08             # Rail width (fraction of the frame width)
+GROOVE = 0.35             # Groove height (fraction of the pitch)
+WAFER = 0.12              # Wafer edge thickness (fraction of the pitch)
+
+BACKGROUND = 40           # Nominal intensities before exposure
+BOX = 90
+RAIL = 125
+GROOVE_LEVEL = 70
+WAFER_LEVEL = 205
+NOISE_TABLE = 1 << 16
+
+
+def _occupancy(spec, slots, rng):
+    """Occupancy spec -> list of bools ("random:0.7", "all", "none", "alternate", "1101...")."""
+    if isinstance(spec, (list, tuple)):
+        return [bool(v) for v in spec][:slots] + [False] * max(0, slots - len(spec))
+    spec = (spec or "random:0.7").lower()
+    if spec.startswith("random"):
+        p = float(spec.partition(":")[2] or 0.7)
+        return [rng.random() < p for _ in range(slots)]
+    if spec == "all":
+        return [True] * slots
+    if spec == "none":
+        return [False] * slots
+    if spec == "alternate":
+        return [i % 2 == 0 for i in range(slots)]
+    bits = [c == "1" for c in spec if c in "01"]
+    return bits[:slots] + [False] * max(0, slots - len(bits))
+
+
+def _span(rect, v, width, cos_a, sin_a, cx, cy):
+    """Pixel columns of row v inside a rectangle rotated about (cx, cy)."""
+    x0, y0, x1, y1 = rect[:4]
+    # Scene point of pixel (u, v): x = a + u*cos, y = b - u*sin
+    a = cx - cx * cos_a + (v + 0.5 - cy) * sin_a
+    b = cy + cx * sin_a + (v + 0.5 - cy) * cos_a
+    lo = (x0 - a) / cos_a
+    hi = (x1 - a) / cos_a
+    if sin_a > 1e-12:
+        lo, hi = max(lo, (b - y1) / sin_a), min(hi, (b - y0) / sin_a)
+    elif sin_a < -1e-12:
+        lo, hi = max(lo, (b - y0) / sin_a), min(hi, (b - y1) / sin_a)
+    elif not y0 <= b < y1:
+        return 0, 0
+    start = max(0, int(math.ceil(lo - 0.5)))
+    end = min(width, int(math.floor(hi - 0.5)) + 1)
+    return start, end
+
+
+def _blur_line(line, r):
+    k = 2 * r + 1
+    acc = list(accumulate([line[0]] * (r + 1) + list(line) + [line[-1]] * r))
+    return bytes([(acc[i + k] - acc[i]) // k for i in range(len(line))])
+
+
+def _box_blur(frame, width, height, radius, passes=2):
+    for _ in range(passes):
+        for y in range(height):
+            frame[y * width:(y + 1) * width] = _blur_line(frame[y * width:(y + 1) * width], radius)
+        for x in range(width):
+            frame[x::width] = _blur_line(frame[x::width], radius)
+
+
+def _add_noise(frame, width, height, sigma, rng):
+    table = [max(-127, min(127, int(round(rng.gauss(0, sigma))))) for _ in range(NOISE_TABLE)]
+    clip = bytes(max(0, min(255, v - 128)) for v in range(512))
+    for y in range(height):
+        o = rng.randrange(NOISE_TABLE - width) if NOISE_TABLE > width else 0
+        noise = table[o:o + width] if NOISE_TABLE > width else \
+            [table[rng.randrange(NOISE_TABLE)] for _ in range(width)]
+        row = frame[y * width:(y + 1) * width]
+        frame[y * width:(y + 1) * width] = bytes([clip[v + n + 128] for v, n in zip(row, noise)])
+
+
+def suggested_rois(width, box):
+    """ROI layout for a rendered cassette: left wall + rail, center, right rail + wall."""
+    tile_w = min(MAX_TILE_W, width // 8)
+    margin = tile_w // 8
+    return {"LEFT_ROI": max(0, int(box["x0"]) - margin),
+            "CENTER_ROI": width // 2 - tile_w // 2,
+            "RIGHT_ROI": min(width - tile_w, int(box["x1"]) - tile_w + margin)}
+
+
+def render_cassette(resolution="VGA", slots=SLOTS, pitch=PITCH, start=START_POS,
+                    occupancy=None, tilt=0.0, blur=1, noise=0.0, exposure=1.0, seed=None):
+    """
+    Renders one synthetic cassette frame.
+
+    Args:
+        resolution: FRAME_SIZES name (QVGA, VGA, FHD, WQXGA2, ...).
+        slots: Number of slots.
+        pitch, start: Slot pitch and first slot position in reference pixels
+                      (box height REFERENCE_HEIGHT).
+        occupancy: See _occupancy() (default "random:0.7").
+        tilt: Rotation in degrees about the frame center.
+        blur: Box blur radius in pixels (0 = sharp).
+        noise: Sensor noise sigma in gray levels.
+        exposure: Gain on the nominal intensities.
+        seed: Random seed (occupancy, noise).
+
+    Returns:
+        tuple: (frame bytearray (top-down), width, height, truth dict)
+    """
+    rng = random.Random(seed)
+    width, height = FRAME_SIZES[resolution]
+    occupied = _occupancy(occupancy, slots, rng)
+
+    box = {"x0": BOX_X[0] * width, "x1": BOX_X[1] * width,
+           "top": BOX_Y[0] * height, "bottom": BOX_Y[1] * height}
+    scale = (box["bottom"] - box["top"]) / REFERENCE_HEIGHT
+    slot_pitch = pitch * scale
+    rail = RAIL_W * width
+
+    # Scene rectangles (x0, y0, x1, y1, level), painted in order
+    rects = [(box["x0"], box["top"], box["x1"], box["bottom"], BOX),
+             (box["x0"], box["top"], box["x0"] + rail, box["bottom"], RAIL),
+             (box["x1"] - rail, box["top"], box["x1"], box["bottom"], RAIL)]
+    truth_slots = []
+    for i in range(slots):
+        y = box["top"] + (start + i * pitch) * scale
+        half = max(1.0, slot_pitch * GROOVE / 2)
+        rects.append((box["x0"], y - half, box["x0"] + rail, y + half, GROOVE_LEVEL))
+        rects.append((box["x1"] - rail, y - half, box["x1"], y + half, GROOVE_LEVEL))
+        if occupied[i]:
+            thick = max(2.0, slot_pitch * WAFER) / 2
+            rects.append((box["x0"] + rail / 2, y - thick, box["x1"] - rail / 2, y + thick,
+                          WAFER_LEVEL))
+        truth_slots.append({"slot": i + 1, "y": round(y, 1), "occupied": occupied[i]})
+
+    angle = math.radians(tilt)
+    cos_a, sin_a = math.cos(angle), math.sin(angle)
+    cx, cy = width / 2.0, height / 2.0
+
+    frame = bytearray(width * height)
+    background = bytes([BACKGROUND]) * width
+    for v in range(height):
+        row = bytearray(background)
+        for rect in rects:
+            s, e = _span(rect, v, width, cos_a, sin_a, cx, cy)
+            if e > s:
+                row[s:e] = bytes([rect[4]]) * (e - s)
+        frame[v * width:(v + 1) * width] = row
+
+    if blur > 0:
+        _box_blur(frame, width, height, int(blur))
+    if exposure != 1.0:
+        frame = bytearray(frame.translate(bytes(
+            min(255, int(v * exposure + 0.5)) for v in range(256))))
+    if noise > 0:
+        _add_noise(frame, width, height, noise, rng)
+
+    # Slot positions on the frame's center column (rotation about the center)
+    for slot in truth_slots:
+        slot["y_center"] = round(cy + (slot["y"] - cy) * cos_a, 1)
+
+    truth = {
+        "resolution": resolution, "width": width, "height": height,
+        "params": {"slots": slots, "pitch": pitch, "start": start, "tilt": tilt,
+                   "blur": blur, "noise": noise, "exposure": exposure, "seed": seed},
+        "box": {k: round(v, 1) for k, v in box.items()},
+        "rois": suggested_rois(width, box),
+        "slots": truth_slots,
+        "inventory": {"Slot_{}".format(s["slot"]): "Occupied" if s["occupied"] else "Empty"
+                      for s in truth_slots},
+    }
+    return frame, width, height, truth
+
+
+def write_frame(path, frame, width, height, fmt="bmp"):
+    """
+    Writes a top-down frame as an 8-bit grayscale BMP (bottom-up rows) or a
+    headerless raw file.
+    """
+    with open(path, "wb") as f:
+        if fmt == "raw":
+            f.write(frame)
+            return
+        row_size = (width + 3) & ~3
+        data_offset = 14 + 40 + 256 * 4
+        f.write(struct.pack("<2sIHHI", b"BM", data_offset + row_size * height, 0, 0, data_offset))
+        f.write(struct.pack("<IiiHHIIiiII", 40, width, height, 1, 8, 0, row_size * height,
+                            2835, 2835, 256, 0))
+        f.write(b"".join(bytes((v, v, v, 0)) for v in range(256)))
+        padding = bytes(row_size - width)
+        for y in range(height - 1, -1, -1):
+            f.write(frame[y * width:(y + 1) * width])
+            f.write(padding)
+
+
+def compare_inventory(truth, inventory):
+    """
+    Scores an analyze_virtual_slots() inventory against the ground truth.
+
+    Returns:
+        dict: {slots, correct, accuracy, wrong: [slot names]}
+    """
+    wrong = [name for name, status in truth["inventory"].items()
+             if inventory.get(name, {}).get("status") != status]
+    n = len(truth["inventory"])
+    return {"slots": n, "correct": n - len(wrong),
+            "accuracy": round((n - len(wrong)) / n, 4) if n else 0.0, "wrong": wrong}
+
+
+def _draw(rng, value):
+    lo, hi = value if isinstance(value, tuple) else (value, value)
+    return lo if lo == hi else rng.uniform(lo, hi)
+
+
+def generate(out_dir, count=10, resolution="VGA", fmt="bmp", seed=0, occupancy=None,
+             slots=SLOTS, pitch=PITCH, start=START_POS, tilt=0.0, blur=1, noise=0.0,
+             exposure=1.0):
+    """
+    Writes a labelled corpus: count frames (tilt, blur, noise and exposure may
+    be (lo, hi) ranges, drawn per frame), their .json ground truth and env.txt.
+
+    Returns:
+        list: Written frame paths.
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    rng = random.Random(seed)
+    paths = []
+    rois = None
+    for i in range(count):
+        frame_seed = rng.randrange(1 << 30)
+        frame, width, height, truth = render_cassette(
+            resolution, slots=slots, pitch=pitch, start=start, occupancy=occupancy,
+            tilt=_draw(rng, tilt), blur=int(round(_draw(rng, blur))),
+            noise=_draw(rng, noise), exposure=_draw(rng, exposure), seed=frame_seed)
+        name = "SYN_{}_{:05d}.{}".format(resolution, i, "bmp" if fmt == "bmp" else "bin")
+        path = os.path.join(out_dir, name)
+        write_frame(path, frame, width, height, fmt)
+        truth["frame"] = name
+        truth["format"] = fmt
+        with open(path + ".json", "w") as f:
+            json.dump(truth, f)
+        rois = truth["rois"]
+        paths.append(path)
+        print("{} ({} occupied)".format(name, sum(s["occupied"] for s in truth["slots"])))
+    if rois is not None:
+        save_env(os.path.join(out_dir, "env.txt"), rois)
+    return paths
+
+
+def _range(text):
+    lo, _, hi = text.partition("..")
+    return (float(lo), float(hi)) if hi else float(lo)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Render synthetic cassette frames.")
+    parser.add_argument("out_dir")
+    parser.add_argument("--count", type=int, default=10)
+    parser.add_argument("--resolution", choices=sorted(FRAME_SIZES), default="VGA")
+    parser.add_argument("--format", choices=("bmp", "raw"), default="bmp")
+    parser.add_argument("--slots", type=int, default=SLOTS)
+    parser.add_argument("--pitch", type=float, default=PITCH, help="Reference pixels")
+    parser.add_argument("--start", type=float, default=START_POS, help="Reference pixels")
+    parser.add_argument("--occupancy", default="random:0.7",
+                        help="random:P, all, none, alternate or a 0/1 pattern")
+    parser.add_argument("--tilt", type=_range, default=0.0,
+                        help="Degrees, or lo..hi (negative values: --tilt=-1.5..1.5)")
+    parser.add_argument("--blur", type=_range, default=1.0, help="Radius px, or lo..hi")
+    parser.add_argument("--noise", type=_range, default=0.0, help="Sigma, or lo..hi")
+    parser.add_argument("--exposure", type=_range, default=1.0, help="Gain, or lo..hi")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    generate(args.out_dir, count=args.count, resolution=args.resolution, fmt=args.format,
+             seed=args.seed, occupancy=args.occupancy, slots=args.slots, pitch=args.pitch,
+             start=args.start, tilt=args.tilt, blur=args.blur, noise=args.noise,
+             exposure=args.exposure)
+
+# ---------USAGE-----------
+# python3 synth_cassette.py synth/vga --count 100 --tilt=-1.5..1.5 --noise 2..6 --exposure 0.7..1.3
+# python3 synth_cassette.py synth/wqxga2 --resolution WQXGA2 --format raw --count 20
+# python3 host_batch.py synth/vga --env synth/vga/env.txt --output synth_vga.json
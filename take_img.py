@@ -2,9 +2,11 @@
 # Image capture library (NO sensor.reset(), NO __main__)
 
 import sensor
+import sensor_state
 import time
 import os
-from exposure_calibration import capture_and_save_grayscale
+from exposure_calibration import capture_and_save_grayscale, calibrated_snapshot
+from bmp_line_detection import roi_tile_width
 
 # Save to SD card for large files (internal flash ~2MB limit)
 SD_ROOT = "/sdcard"
@@ -21,6 +23,12 @@ EXPECTED_WIDTH = 1920
 EXPECTED_HEIGHT = 1080
 EXPECTED_SIZE = EXPECTED_WIDTH * EXPECTED_HEIGHT
 
+# ROI windowed capture (sensor windowing, no SD round trip)
+# "SPAN":  one window from the leftmost ROI to the right edge of the rightmost
+# "BANDS": one windowed capture per ROI tile
+WINDOW_MODE = "SPAN"
+WINDOW_ALIGN = 8  # Sensor window x/width alignment
+
 
 def get_file_size(filepath):
     """Get file size using os.stat (efficient, no file read)."""
@@ -39,10 +47,14 @@ def verify_sd_mounted():
         return False
 
 
-def take_image():
+def take_image(coords=None):
     """
     Capture calibrated GRAYSCALE image at maximum resolution and save to SD card.
 
+    Args:
+        coords: Optional ROI dict; when given, exposure is metered on the
+                ROI column bands only.
+
     Returns:
         tuple: (filename, width, height)
 
@@ -56,7 +68,7 @@ def take_image():
     filename = SNAPSHOT_FILE
 
     # Capture and save at maximum resolution (overwrites previous)
-    meta = capture_and_save_grayscale(filename, framesize=CAPTURE_FRAMESIZE)
+    meta = capture_and_save_grayscale(filename, framesize=CAPTURE_FRAMESIZE, coords=coords)
 
     # Verify file exists
     time.sleep_ms(200)  # Longer delay for large file
@@ -75,3 +87,105 @@ def take_image():
     print("Captured {}x{} ({:.1f}MB)".format(width, height, size/1024/1024))
     print("Exposure: {} us, Gain: {} dB".format(meta["exposure_us"], meta["gain_db"]))
     return filename, width, height
+
+
+
+def take_frame(coords=None):
+    """
+    Capture calibrated GRAYSCALE frame and keep it in the frame buffer.
+
+    Nothing is written to SD; pass the image to process_frame() and call
+    save_frame() afterwards if the frame should be kept.
+
+    Args:
+        coords: Optional ROI dict; when given, exposure is metered on the
+                ROI column bands only.
+
+    Returns:
+        tuple: (img, meta) with meta = {exposure_us, gain_db, width, height}
+    """
+    img, exp, gain = calibrated_snapshot(CAPTURE_FRAMESIZE, coords=coords)
+    width, height = img.width(), img.height()
+    print("Captured {}x{} (in memory)".format(width, height))
+    return img, {"exposure_us": exp, "gain_db": gain, "width": width, "height": height}
+
+
+def save_frame(img, filename=SNAPSHOT_FILE):
+    """
+    Persist a captured frame as raw grayscale bytes (same format as take_image()).
+    Returns the filename, or None if the SD card is missing or the write fails.
+    """
+    if not verify_sd_mounted():
+        print("WARNING: SD card not mounted, frame not saved")
+        return None
+    try:
+        with open(filename, "wb") as f:
+            f.write(img.bytearray())
+    except OSError as e:
+        print("WARNING: Failed to save frame: {}".format(e))
+        return None
+    print("Saved frame to {}".format(filename))
+    return filename
+
+def roi_windows(coords, frame_w=EXPECTED_WIDTH, frame_h=EXPECTED_HEIGHT,
+                tile_w=None, mode=WINDOW_MODE):
+    """
+    Computes the sensor windows needed to read out the ROI tiles (tile_w
+    defaults to roi_tile_width(), as in detection).
+
+    Returns:
+        list: [((x, y, w, h), [tile_x_offset, ...]), ...]
+    """
+    if tile_w is None:
+        tile_w = roi_tile_width(coords, frame_w)
+    offsets = sorted(int(v) for v in coords.values())
+
+    if mode == "BANDS":
+        groups = [[x] for x in offsets]
+    else:
+        groups = [offsets]
+
+    windows = []
+    for group in groups:
+        x0 = (group[0] // WINDOW_ALIGN) * WINDOW_ALIGN
+        x1 = min(group[-1] + tile_w, frame_w)
+        w = ((x1 - x0 + WINDOW_ALIGN - 1) // WINDOW_ALIGN) * WINDOW_ALIGN
+        w = min(w, frame_w - x0)
+        windows.append(((x0, 0, w, frame_h), group))
+    return windows
+
+
+def take_roi_tiles(coords, tile_w=None, mode=WINDOW_MODE):
+    """
+    Capture only the ROI column bands using sensor windowing.
+
+    Generator yielding (tile_x_offset, tile_img) pairs for
+    bmp_line_detection.process_tiles(). Each tile is a heap copy, so only one
+    tile is held at a time; nothing is written to SD.
+
+    Args:
+        coords: ROI dict (env.txt format), offsets at CAPTURE_FRAMESIZE
+        tile_w: Tile width in pixels (default: roi_tile_width())
+        mode: "SPAN" (one window) or "BANDS" (one window per ROI)
+    """
+    if tile_w is None:
+        tile_w = roi_tile_width(coords, EXPECTED_WIDTH)
+    windows = roi_windows(coords, tile_w=tile_w, mode=mode)
+    read_cols = sum(win[2] for win, _ in windows)
+    print("Windowed readout: {} of {} columns ({:.0f}%)".format(
+        read_cols, EXPECTED_WIDTH,
+        100.0 * read_cols / EXPECTED_WIDTH))
+
+    for window, offsets in windows:
+        img, exp, gain = calibrated_snapshot(CAPTURE_FRAMESIZE, coords=coords, window=window)
+        # The framesize fallback of calibrated_snapshot drops the window
+        window = sensor_state.current().get("windowing")
+        print("Captured window {} ({}x{})".format(window, img.width(), img.height()))
+
+        for tile_x_offset in offsets:
+            x = tile_x_offset if window is None else tile_x_offset - window[0]
+            w = min(tile_w, img.width() - x)
+            if w <= 0:
+                print("Skipping ROI {} outside the {}px wide frame".format(tile_x_offset, img.width()))
+                continue
+            yield tile_x_offset, img.copy(roi=(x, 0, w, img.height()))
@@ -1,7 +1,12 @@
 import os
 import time
-import sensor
 import json
+try:
+    import sensor
+    import sensor_state
+except ImportError:
+    # Host tools (filter, pipeline, ...) use the file helpers without a camera
+    sensor = None
 
 # -----------------------------------------------------------------------------
 # This module provides functions for file I/O (logging and configuration)
@@ -10,7 +15,9 @@ import json
 # Functions Summary:
 # 1. log(log_file, message, function_name)
 # 2. load_env(file_path, logs)
-# 3. take_image(grayscale, resolution)
+# 3. save_env(file_path, variables)
+# 4. roi_coords(config)
+# 5. take_image(grayscale, resolution)
 # -----------------------------------------------------------------------------
 
 
@@ -102,24 +109,80 @@ def load_env(file_path, logs=None):
 # print(res)
 
 
+def save_env(file_path, variables):
+    """
+    Writes variables back to an environment file in key=value format.
+
+    Comment lines are kept, keys already in the file are updated in place,
+    keys missing from variables are dropped and new keys are appended.
+
+    Args:
+        file_path: The path to the environment file (e.g., 'env.txt').
+        variables: Dictionary of {key: value} to store.
+    """
+    lines = []
+    written = set()
+    try:
+        with open(file_path, 'r') as file:
+            for line in file:
+                stripped = line.strip()
+                if not stripped or stripped.startswith('#') or '=' not in stripped:
+                    lines.append(stripped)
+                    continue
+                key = stripped.partition('=')[0].strip()
+                if key in variables:
+                    lines.append("{}={}".format(key, variables[key]))
+                    written.add(key)
+    except OSError:
+        pass  # New file
+
+    for key, value in variables.items():
+        if key not in written:
+            lines.append("{}={}".format(key, value))
+
+    try:
+        with open(file_path, 'w') as file:
+            file.write("\n".join(lines) + "\n")
+    except Exception as e:
+        raise RuntimeError(
+            f"Failed to save environment variables to {file_path}: {e}")
+
+# ---------USAGE-----------
+# env = load_env("env.txt")
+# env["CENTER_ROI"] = "820"
+# save_env("env.txt", env)
+
+
+def roi_coords(config):
+    """
+    Returns only the ROI column offsets (keys ending in '_ROI') of a loaded
+    environment, in the {Directional key: pixel value} format process_image() expects.
+    """
+    return {key: value for key, value in config.items() if key.endswith("_ROI")}
+
+# ---------USAGE-----------
+# coords = roi_coords(load_env("env.txt"))
+
+
 # -----------------------------------------------------------------------------
 # Camera Control Function
 # -----------------------------------------------------------------------------
 
-def take_image(grayscale=True, resolution=sensor.VGA):
+def take_image(grayscale=True, resolution=None):
     """
     Captures an image using the camera sensor and saves it to the 'IMG' directory.
+    Only the settings that differ from the current sensor state are applied.
+    resolution defaults to sensor.VGA.
     Returns:
         The filename of the saved image.
     """
-    sensor.reset()
-    if grayscale:
-        sensor.set_pixformat(sensor.GRAYSCALE)
-    else:
-        sensor.set_pixformat(sensor.RGB565)
-
-    sensor.set_framesize(resolution)
-    sensor.skip_frames(time=2000)
+    if sensor is None:
+        raise RuntimeError("take_image() needs the camera sensor module")
+    if resolution is None:
+        resolution = sensor.VGA
+    pixformat = sensor.GRAYSCALE if grayscale else sensor.RGB565
+    sensor_state.configure(pixformat=pixformat, framesize=resolution, windowing=None)
+    sensor_state.settle()
 
     img = sensor.snapshot()
     timestamp = time.ticks_ms()